@@ -0,0 +1,188 @@
+import json
+import re
+import time
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+
+from .records import loads
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_MAX_DEPTH = 64
+DEFAULT_SUMMARY_KEYS = 100
+# Сколько символов тела просматривается для сводки ключей
+SUMMARY_SCAN_CHARS = 64 * 1024
+BODY_MODES = ('full', 'summary')
+
+# Строка JSON целиком (с экранированием) или скобка; одиночная кавычка - незакрытая строка
+_TOKENS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]"]')
+_OPENING = re.compile(r'[{\[]')
+_BRACKETS = re.compile(r'[{}\[\]]')
+_BRACKET_DEPTH = {'{': 1, '[': 1, '}': -1, ']': -1}
+_COLON = re.compile(r'\s*:\s*')
+_DECODER = json.JSONDecoder()
+
+
+def new_body_stats() -> Dict[str, Any]:
+    return {'count': 0, 'parsed': 0, 'summarized': 0, 'failed': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+
+
+def merge_body_stats(stats: Dict[str, Any], other: Dict[str, Any]) -> None:
+    for key in ('count', 'parsed', 'summarized', 'failed', 'seconds'):
+        stats[key] += other[key]
+    stats['max_seconds'] = max(stats['max_seconds'], other['max_seconds'])
+
+
+def max_nesting(text: str) -> int:
+    """Верхняя оценка глубины вложенности: скобки внутри строк тоже считаются.
+
+    Весь подсчет идет в C (findall, map, accumulate), поэтому на обычном
+    теле это намного дешевле точного прохода по токенам.
+    """
+    return max(accumulate(map(_BRACKET_DEPTH.__getitem__, _BRACKETS.findall(text))), default=0)
+
+
+def find_json_end(text: str, start: int, max_depth: int) -> Tuple[Optional[int], bool]:
+    """Конец сбалансированного JSON-значения, начинающегося скобкой в start.
+
+    Один проход по токенам: строки пропускаются целиком, поэтому скобки
+    внутри строк не считаются. Возвращает (конец или None, превышена ли
+    глубина); None - значение не закрыто до конца текста.
+    """
+    depth = 0
+    for match in _TOKENS.finditer(text, start):
+        token = match.group()
+        if token[0] == '"':
+            if len(token) == 1:
+                return None, False
+            continue
+        if token in '{[':
+            depth += 1
+            if depth > max_depth:
+                return None, True
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.end(), False
+    return None, False
+
+
+def index_top_level_keys(
+    text: str,
+    start: int,
+    max_keys: int,
+    max_chars: int,
+    max_depth: int,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Ключи верхнего уровня объекта и смещения их значений в text.
+
+    Просматривается не больше max_chars символов и не глубже max_depth, и
+    собирается не больше max_keys ключей, поэтому сводка огромного тела
+    стоит не больше разбора его начала. Возвращает (ключи, обрезан ли список).
+    """
+    keys: List[Dict[str, Any]] = []
+    depth = 0
+    for match in _TOKENS.finditer(text, start, start + max_chars):
+        token = match.group()
+        if token[0] == '"':
+            if len(token) == 1:
+                return keys, False
+            if depth == 1:
+                colon = _COLON.match(text, match.end())
+                if colon:
+                    if len(keys) >= max_keys:
+                        return keys, True
+                    try:
+                        key = loads(token)
+                    except ValueError:
+                        key = token[1:-1]
+                    keys.append({'key': key, 'offset': colon.end()})
+            continue
+        depth += 1 if token in '{[' else -1
+        if depth == 0:
+            return keys, False
+        if depth > max_depth:
+            break
+    return keys, True
+
+
+class BodyExtractor:
+    """Разбор JSON из тел HTTP-запросов и ответов (tf_http_req_body/tf_http_res_body).
+
+    Берется первое сбалансированное JSON-значение в теле; поиск конца и
+    разбор линейны по длине тела. Тела больше max_bytes и глубже
+    max_depth, а в режиме 'summary' - все тела, не разбираются целиком:
+    вместо них сохраняется сводка {'_summary': {...}} с типом, длиной и
+    первыми summary_keys ключами верхнего уровня со смещениями значений
+    в исходном теле (само тело остается в raw_data).
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        mode: str = 'full',
+        summary_keys: int = DEFAULT_SUMMARY_KEYS,
+    ):
+        if mode not in BODY_MODES:
+            raise ValueError(f"Body mode must be one of {', '.join(BODY_MODES)}, got {mode!r}")
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.mode = mode
+        self.summary_keys = summary_keys
+
+    def extract(self, value: Any, stats: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        if not value or not isinstance(value, str):
+            return None
+        started = time.perf_counter()
+        result, outcome = self._extract(value)
+        if stats is not None:
+            elapsed = time.perf_counter() - started
+            stats['count'] += 1
+            stats[outcome] += 1
+            stats['seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+        return result
+
+    def _extract(self, value: str) -> Tuple[Any, str]:
+        opening = _OPENING.search(value)
+        if opening is None:
+            return None, 'failed'
+        start = opening.start()
+
+        if self.mode == 'summary':
+            return self.summary(value, start, 'summary_mode'), 'summarized'
+        if len(value) - start > self.max_bytes:
+            return self.summary(value, start, 'max_bytes'), 'summarized'
+
+        # Глубина не больше числа открывающих скобок; count() почти бесплатен,
+        # и точнее оценка считается только для тел, где скобок много
+        if (value.count('{', start) + value.count('[', start) > self.max_depth
+                and max_nesting(value[start:]) > self.max_depth):
+            _, too_deep = find_json_end(value, start, self.max_depth)
+            if too_deep:
+                return self.summary(value, start, 'max_depth'), 'summarized'
+
+        try:
+            # Обычно тело от первой скобки до конца - это и есть JSON
+            return loads(value[start:]), 'parsed'
+        except (ValueError, RecursionError):
+            pass
+        try:
+            # После JSON есть хвост: raw_decode разбирает первое значение и игнорирует остальное
+            return _DECODER.raw_decode(value, start)[0], 'parsed'
+        except (ValueError, RecursionError):
+            return None, 'failed'
+
+    def summary(self, value: str, start: int, reason: str) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {
+            'type': 'object' if value[start] == '{' else 'array',
+            'length': len(value),
+            'reason': reason,
+        }
+        if summary['type'] == 'object':
+            keys, truncated = index_top_level_keys(
+                value, start, self.summary_keys, SUMMARY_SCAN_CHARS, self.max_depth
+            )
+            summary['keys'] = keys
+            summary['keys_truncated'] = truncated
+        return {'_summary': summary}
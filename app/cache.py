@@ -0,0 +1,192 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+CacheKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+# Ответ из кэша браузер всегда перепроверяет через If-None-Match
+CACHE_CONTROL = b'no-cache'
+# Заголовки ответа, которые вычисляются заново, а не берутся из кэша
+REBUILT_HEADERS = (b'etag', b'cache-control', b'x-cache')
+
+
+class _Entry:
+    __slots__ = ('body', 'headers', 'etag', 'expires')
+
+    def __init__(self, body: bytes, headers: List[Tuple[bytes, bytes]], etag: bytes, expires: float):
+        self.body = body
+        self.headers = headers
+        self.etag = etag
+        self.expires = expires
+
+
+def body_etag(body: bytes) -> bytes:
+    return b'"' + hashlib.blake2b(body, digest_size=16).hexdigest().encode('ascii') + b'"'
+
+
+def etag_matches(if_none_match: bytes, etag: bytes) -> bool:
+    """Совпадает ли ETag с одним из значений If-None-Match (слабое сравнение)"""
+    for candidate in if_none_match.split(b','):
+        candidate = candidate.strip()
+        if candidate == b'*' or candidate.removeprefix(b'W/') == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """Кэш готовых ответов GET в памяти процесса: TTL и вытеснение LRU по объему.
+
+    Данные меняются только при загрузке, отметке о прочтении и удалении,
+    поэтому каждое изменение увеличивает generation и очищает кэш. Ответ,
+    вычисление которого началось до изменения, в кэш не попадает: put()
+    принимает поколение, снятое перед вычислением. Изменения из других
+    процессов (follow.py, python -m app.retention) кэш не видит, и их
+    задержка ограничена ttl.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 30.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: 'OrderedDict[CacheKey, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def key(path: str, params: Iterable[Tuple[str, str]]) -> CacheKey:
+        """Порядок параметров запроса не важен: ?a=1&b=2 и ?b=2&a=1 - один ответ"""
+        return path, tuple(sorted(params))
+
+    def get(self, key: CacheKey) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: CacheKey, generation: int, body: bytes, headers: List[Tuple[bytes, bytes]]) -> _Entry:
+        """Запоминает ответ, если данные не менялись с начала его вычисления"""
+        entry = _Entry(body, headers, body_etag(body), time.monotonic() + self.ttl)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            if generation != self.generation:
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    def count_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def invalidate(self, *changed: Any) -> None:
+        """Новое поколение данных; аргументы не используются, поэтому метод
+        подходит и как commit_hooks загрузки, и как delete_hooks обслуживания"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+            self.bytes = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'generation': self.generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key: CacheKey) -> None:
+        self.bytes -= len(self._entries.pop(key).body)
+
+
+class ResponseCacheMiddleware:
+    """ASGI-обертка, отдающая GET-запросы к paths из ResponseCache.
+
+    Ответ 200 запоминается целиком вместе с заголовками (X-Next-Cursor
+    страницы логов), получает ETag - хэш тела, и повторный запрос с тем же
+    If-None-Match получает 304 без тела. Остальные запросы проходят мимо.
+    """
+
+    def __init__(self, app, cache: ResponseCache, paths: Iterable[str]):
+        self.app = app
+        self.cache = cache
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or scope['method'] != 'GET'
+                or scope['path'] not in self.paths or not self.cache.enabled):
+            await self.app(scope, receive, send)
+            return
+
+        params = parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        key = self.cache.key(scope['path'], params)
+        entry = self.cache.get(key)
+        status = b'HIT'
+        if entry is None:
+            status = b'MISS'
+            generation = self.cache.generation
+            start: Dict[str, Any] = {}
+            chunks: List[bytes] = []
+
+            async def capture(message):
+                if message['type'] == 'http.response.start':
+                    start.update(message)
+                else:
+                    chunks.append(message.get('body', b''))
+
+            await self.app(scope, receive, capture)
+            body = b''.join(chunks)
+            if start['status'] != 200:
+                await send(start)
+                await send({'type': 'http.response.body', 'body': body})
+                return
+            headers = [(name, value) for name, value in start['headers'] if name.lower() not in REBUILT_HEADERS]
+            entry = self.cache.put(key, generation, body, headers)
+
+        await self._respond(scope, send, entry, status)
+
+    async def _respond(self, scope, send, entry: _Entry, status: bytes) -> None:
+        extra = [(b'etag', entry.etag), (b'cache-control', CACHE_CONTROL), (b'x-cache', status)]
+        if_none_match = dict(scope['headers']).get(b'if-none-match')
+        if if_none_match and etag_matches(if_none_match, entry.etag):
+            self.cache.count_not_modified()
+            await send({'type': 'http.response.start', 'status': 304, 'headers': extra})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        await send({'type': 'http.response.start', 'status': 200, 'headers': entry.headers + extra})
+        await send({'type': 'http.response.body', 'body': entry.body})
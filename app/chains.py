@@ -0,0 +1,208 @@
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import Integer, case, func, insert as core_insert, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .models import RequestChain, TerraformLog
+from .queries import sql_earliest, sql_latest
+
+# Уровни от легкого к тяжелому; неизвестный уровень считается info
+LEVEL_RANKS = {'trace': 0, 'debug': 1, 'info': 2, 'warn': 3, 'error': 4}
+LEVEL_NAMES = {rank: level for level, rank in LEVEL_RANKS.items()}
+DEFAULT_RANK = LEVEL_RANKS['info']
+
+# Параметр sort в /api/chains -> порядок выдачи; совпадает с хвостом индексов (..., tf_req_id)
+CHAIN_ORDERS = {
+    'duration': (RequestChain.duration_ms.desc(), RequestChain.tf_req_id.desc()),
+    'time': (RequestChain.first_timestamp.desc(), RequestChain.tf_req_id.desc()),
+    'count': (RequestChain.log_count.desc(), RequestChain.tf_req_id.desc()),
+}
+
+# DateTime хранится строкой 'YYYY-MM-DD HH:MM:SS.ffffff'; целые секунды - первые
+# 19 символов, микросекунды начинаются с 21-го
+SECONDS_LENGTH = 19
+MICROSECONDS_AT = 21
+
+
+def _duration_ms(first, last):
+    # julianday() округляет до миллисекунд, а RPC провайдера часто короче,
+    # поэтому целые секунды и микросекунды берутся из строки отдельно.
+    # strftime('%s') тоже округляет, и ...:19.9998 превратилось бы в :20,
+    # поэтому ему передаются только целые секунды
+    def seconds(value):
+        return func.cast(func.strftime('%s', func.substr(value, 1, SECONDS_LENGTH)), Integer)
+
+    def microseconds(value):
+        return func.cast(func.substr(value, MICROSECONDS_AT), Integer)
+
+    return (seconds(last) - seconds(first)) * 1000 + (microseconds(last) - microseconds(first)) / 1000.0
+
+
+def update_request_chains(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Хук LogIngestor: добавляет строки пачки в сводки цепочек по tf_req_id"""
+    chains: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        req_id = row.get('tf_req_id')
+        if not req_id:
+            continue
+        timestamp = row.get('timestamp')
+        rank = LEVEL_RANKS.get(row.get('level'), DEFAULT_RANK)
+        chain = chains.get(req_id)
+        if chain is None:
+            chains[req_id] = {
+                'tf_req_id': req_id,
+                'first_timestamp': timestamp,
+                'last_timestamp': timestamp,
+                'tf_rpc': row.get('tf_rpc'),
+                'tf_resource_type': row.get('tf_resource_type'),
+                'log_count': 1,
+                'error_count': 1 if rank == LEVEL_RANKS['error'] else 0,
+                'level_rank': rank,
+            }
+            continue
+        if timestamp is not None:
+            if chain['first_timestamp'] is None or timestamp < chain['first_timestamp']:
+                chain['first_timestamp'] = timestamp
+            if chain['last_timestamp'] is None or timestamp > chain['last_timestamp']:
+                chain['last_timestamp'] = timestamp
+        chain['tf_rpc'] = chain['tf_rpc'] or row.get('tf_rpc')
+        chain['tf_resource_type'] = chain['tf_resource_type'] or row.get('tf_resource_type')
+        chain['log_count'] += 1
+        chain['error_count'] += 1 if rank == LEVEL_RANKS['error'] else 0
+        chain['level_rank'] = max(chain['level_rank'], rank)
+    if not chains:
+        return
+
+    for chain in chains.values():
+        first, last = chain['first_timestamp'], chain['last_timestamp']
+        chain['duration_ms'] = (last - first).total_seconds() * 1000 if first and last else 0.0
+        chain['worst_level'] = LEVEL_NAMES[chain['level_rank']]
+
+    table = RequestChain.__table__
+    statement = insert(table)
+    excluded = statement.excluded
+    first = sql_earliest(table.c.first_timestamp, excluded.first_timestamp)
+    last = sql_latest(table.c.last_timestamp, excluded.last_timestamp)
+    worse = excluded.level_rank > table.c.level_rank
+    statement = statement.on_conflict_do_update(
+        index_elements=['tf_req_id'],
+        set_={
+            'first_timestamp': first,
+            'last_timestamp': last,
+            'duration_ms': func.coalesce(_duration_ms(first, last), 0.0),
+            'tf_rpc': func.coalesce(table.c.tf_rpc, excluded.tf_rpc),
+            'tf_resource_type': func.coalesce(table.c.tf_resource_type, excluded.tf_resource_type),
+            'log_count': table.c.log_count + excluded.log_count,
+            'error_count': table.c.error_count + excluded.error_count,
+            'level_rank': case((worse, excluded.level_rank), else_=table.c.level_rank),
+            'worst_level': case((worse, excluded.worst_level), else_=table.c.worst_level),
+        }
+    )
+    db.execute(statement, [chains[req_id] for req_id in sorted(chains)])
+
+
+CHAIN_COLUMNS = [
+    'tf_req_id', 'first_timestamp', 'last_timestamp', 'duration_ms', 'tf_rpc', 'tf_resource_type',
+    'log_count', 'error_count', 'level_rank', 'worst_level',
+]
+
+
+def _insert_chains_from_logs(db: Session, *conditions) -> None:
+    """Сводки цепочек, посчитанные по terraform_logs с условиями conditions"""
+    rank = case(LEVEL_RANKS, value=TerraformLog.level, else_=DEFAULT_RANK)
+    first = func.min(TerraformLog.timestamp)
+    last = func.max(TerraformLog.timestamp)
+    worst = func.max(rank)
+    source = (
+        select(
+            TerraformLog.tf_req_id,
+            first,
+            last,
+            func.coalesce(_duration_ms(first, last), 0.0),
+            func.max(TerraformLog.tf_rpc),
+            func.max(TerraformLog.tf_resource_type),
+            func.count(TerraformLog.id),
+            func.sum(case((TerraformLog.level == 'error', 1), else_=0)),
+            worst,
+            case(LEVEL_NAMES, value=worst),
+        )
+        .where(TerraformLog.tf_req_id.isnot(None), TerraformLog.tf_req_id != '', *conditions)
+        .group_by(TerraformLog.tf_req_id)
+    )
+    db.execute(core_insert(RequestChain.__table__).from_select(CHAIN_COLUMNS, source))
+
+
+def rebuild_request_chains(db: Session) -> int:
+    """Пересчитывает сводки цепочек по terraform_logs в текущей транзакции"""
+    db.query(RequestChain).delete(synchronize_session=False)
+    _insert_chains_from_logs(db)
+    return db.query(RequestChain).count()
+
+
+def refresh_request_chains(db: Session, req_ids: Iterable[str]) -> None:
+    """Пересчитывает сводки указанных цепочек после удаления части их строк.
+
+    Строки цепочки читаются по индексу (tf_req_id, timestamp, id), поэтому
+    стоимость зависит только от размера этих цепочек.
+    """
+    req_ids = sorted(set(filter(None, req_ids)))
+    for start in range(0, len(req_ids), 500):
+        chunk = req_ids[start:start + 500]
+        db.query(RequestChain).filter(RequestChain.tf_req_id.in_(chunk)).delete(synchronize_session=False)
+        _insert_chains_from_logs(db, TerraformLog.tf_req_id.in_(chunk))
+
+
+def chain_filters(
+    tf_rpc: Optional[str] = None,
+    tf_resource_type: Optional[str] = None,
+    worst_level: Optional[str] = None,
+    min_duration_ms: Optional[float] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> List[Any]:
+    """Условия WHERE для /api/chains; цепочка попадает в диапазон дат целиком"""
+    filters = []
+    if tf_rpc:
+        filters.append(RequestChain.tf_rpc == tf_rpc)
+    if tf_resource_type:
+        filters.append(RequestChain.tf_resource_type == tf_resource_type)
+    if worst_level:
+        filters.append(RequestChain.worst_level == worst_level)
+    if min_duration_ms is not None:
+        filters.append(RequestChain.duration_ms >= min_duration_ms)
+    if start_date:
+        filters.append(RequestChain.first_timestamp >= start_date)
+    if end_date:
+        # Первое условие следует из второго, но ограничивает диапазон индекса по first_timestamp
+        filters.append(RequestChain.first_timestamp <= end_date)
+        filters.append(RequestChain.last_timestamp <= end_date)
+    return filters
+
+
+def main(argv: List[str]) -> int:
+    from .database import SessionLocal, engine
+    from .migrations import apply_migrations
+    from .models import Base
+
+    if argv != ['rebuild']:
+        print("Usage: python -m app.chains rebuild")
+        return 2
+
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        count = rebuild_request_chains(db)
+        db.commit()
+        print(f"Rebuilt {count} request chains")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
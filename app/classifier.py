@@ -0,0 +1,135 @@
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_SIZE = 65536
+
+# Порядок ключей - приоритет: уровень error выигрывает у warn, если в
+# сообщении есть слова обоих. Ключевые слова ищутся как подстроки без учета регистра.
+DEFAULT_RULES: Dict[str, Any] = {
+    'default_level': 'info',
+    'levels': {
+        'error': ['error', 'failed', 'exception', 'fatal'],
+        'warn': ['warn', 'attention', 'caution'],
+        'debug': ['debug', 'trace'],
+        'info': ['info', 'message', 'starting', 'completed'],
+    },
+    'sections': {
+        'plan': ['starting Plan operation'],
+        'apply': ['starting Apply operation'],
+        'validation': ['running validation operation'],
+    },
+}
+
+
+class RulesError(ValueError):
+    pass
+
+
+def _check_rule_map(rules: Dict[str, Any], key: str) -> Dict[str, List[str]]:
+    value = rules[key]
+    if not isinstance(value, dict):
+        raise RulesError(f"'{key}' must be an object of name -> list of keywords")
+    for name, keywords in value.items():
+        if not isinstance(keywords, list) or not keywords or not all(isinstance(k, str) and k for k in keywords):
+            raise RulesError(f"'{key}.{name}' must be a non-empty list of non-empty strings")
+    return value
+
+
+def validate_rules(rules: Dict[str, Any]) -> Dict[str, Any]:
+    """Правила с подставленными по умолчанию отсутствующими ключами"""
+    if not isinstance(rules, dict):
+        raise RulesError("Classifier rules must be a JSON object")
+    unknown = set(rules) - set(DEFAULT_RULES)
+    if unknown:
+        raise RulesError(f"Unknown classifier rule keys: {', '.join(sorted(unknown))}")
+
+    merged = {**DEFAULT_RULES, **rules}
+    if not isinstance(merged['default_level'], str) or not merged['default_level']:
+        raise RulesError("'default_level' must be a non-empty string")
+    merged['levels'] = _check_rule_map(merged, 'levels')
+    merged['sections'] = _check_rule_map(merged, 'sections')
+    return merged
+
+
+def load_rules(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding='utf-8') as file:
+            rules = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        raise RulesError(f"Cannot read classifier rules from {path}: {e}")
+    return validate_rules(rules)
+
+
+def _compile_words(words: List[str]) -> re.Pattern:
+    # Без групп: только так re пропускает позиции, с которых не начинается ни одно слово
+    return re.compile('|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)))
+
+
+class _RuleSet:
+    """Все ключевые слова набора правил в одном регулярном выражении.
+
+    Текст приводится к нижнему регистру один раз. Обычное сообщение не
+    содержит ни одного слова, и ответ дает один проход search(). Найденное
+    слово указывает на свое правило; выше по приоритету могут быть только
+    правила, стоящие раньше, и только они проверяются дальше с позиции
+    найденного слова.
+    """
+
+    def __init__(self, rules: Dict[str, List[str]]):
+        self.names = list(rules)
+        self._rule_of: Dict[str, int] = {}
+        for index, keywords in enumerate(rules.values()):
+            for keyword in keywords:
+                self._rule_of.setdefault(keyword.lower(), index)
+        self._any = _compile_words(list(self._rule_of)) if self._rule_of else None
+        self._rules = [_compile_words([keyword.lower() for keyword in keywords]) for keywords in rules.values()]
+
+    def first(self, text: str) -> Optional[str]:
+        """Имя правила с высшим приоритетом, слово которого есть в тексте (уже в нижнем регистре)"""
+        if self._any is None:
+            return None
+        match = self._any.search(text)
+        if match is None:
+            return None
+
+        best = self._rule_of[match.group()]
+        for index in range(best):
+            # Раньше первой найденной позиции слов нет
+            if self._rules[index].search(text, match.start()):
+                return self.names[index]
+        return self.names[best]
+
+
+class Classifier:
+    """Уровень (если его нет в строке) и секция по тексту сообщения.
+
+    Правила задаются словарем DEFAULT_RULES или JSON-файлом того же вида
+    (TERRAVIEWER_CLASSIFIER_RULES). Terraform повторяет одни и те же
+    сообщения тысячи раз, поэтому результаты кэшируются по тексту
+    сообщения в LRU на cache_size записей.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Any]] = None, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.rules = validate_rules(rules if rules is not None else DEFAULT_RULES)
+        self.cache_size = cache_size
+        self.default_level = self.rules['default_level']
+        self._levels = _RuleSet(self.rules['levels'])
+        self._sections = _RuleSet(self.rules['sections'])
+        self.level = lru_cache(maxsize=cache_size)(self._level)
+        self.section = lru_cache(maxsize=cache_size)(self._section)
+
+    def __reduce__(self):
+        # Кэши не передаются в процессы разбора, классификатор собирается заново
+        return (Classifier, (self.rules, self.cache_size))
+
+    def _level(self, message: str) -> str:
+        return self._levels.first(message.lower()) or self.default_level
+
+    def _section(self, message: str) -> Optional[str]:
+        return self._sections.first(message.lower())
+
+
+def build_classifier(rules_path: str = '', cache_size: int = DEFAULT_CACHE_SIZE) -> Classifier:
+    return Classifier(load_rules(rules_path) if rules_path else None, cache_size)
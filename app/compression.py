@@ -0,0 +1,30 @@
+from typing import Iterable
+
+from starlette.middleware.gzip import GZipMiddleware
+
+# Сжатие стоит дороже, чем экономит на ответах меньше этого размера
+MINIMUM_SIZE = 1024
+# Большая страница логов сжимается в несколько раз уже на низких уровнях,
+# а уровень 9 (по умолчанию в starlette) заметно медленнее
+COMPRESS_LEVEL = 5
+
+
+class CompressionMiddleware:
+    """GZip для ответов, кроме путей excluded.
+
+    GZipMiddleware не сбрасывает сжатый поток после каждой части ответа,
+    поэтому события SSE (/api/stream) копились бы в буфере сжатия; такие
+    пути отдаются без сжатия. Ответы, у которых уже есть Content-Encoding,
+    GZipMiddleware не трогает.
+    """
+
+    def __init__(self, app, excluded: Iterable[str] = ()):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=MINIMUM_SIZE, compresslevel=COMPRESS_LEVEL)
+        self.excluded = frozenset(excluded)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] not in self.excluded:
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,182 @@
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .models import LogCounter, TerraformLog
+
+# Измерение счетчика -> колонка terraform_logs. Измерение 'all' с пустым
+# значением хранит общие количества; строки с NULL в колонке учитываются
+# только в нем.
+COUNTER_DIMENSIONS = {
+    'level': TerraformLog.level,
+    'section': TerraformLog.section,
+    'resource_type': TerraformLog.tf_resource_type,
+}
+TOTAL_KEY = ('all', '')
+
+CounterKey = Tuple[str, str]
+
+
+def _row_keys(row: Dict[str, Any]) -> List[CounterKey]:
+    keys = [TOTAL_KEY]
+    for dimension, column in COUNTER_DIMENSIONS.items():
+        value = row.get(column.key)
+        if value is not None:
+            keys.append((dimension, value))
+    return keys
+
+
+def apply_deltas(db: Session, deltas: Dict[CounterKey, List[int]]) -> None:
+    """Прибавляет (total, unread) к счетчикам в текущей транзакции"""
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+
+    statement = insert(LogCounter.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['dimension', 'value'],
+        set_={
+            'total': LogCounter.total + statement.excluded.total,
+            'unread': LogCounter.unread + statement.excluded.unread,
+        }
+    )
+    db.execute(statement, [
+        {'dimension': dimension, 'value': value, 'total': total, 'unread': unread}
+        for (dimension, value), (total, unread) in sorted(deltas.items())
+    ])
+
+
+def count_inserted_rows(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Хук LogIngestor: новые строки увеличивают total и unread"""
+    deltas: Dict[CounterKey, List[int]] = defaultdict(lambda: [0, 0])
+    for row in rows:
+        unread = 0 if row.get('is_read') else 1
+        for key in _row_keys(row):
+            deltas[key][0] += 1
+            deltas[key][1] += unread
+    apply_deltas(db, deltas)
+
+
+def count_deleted_rows(db: Session, rows: Iterable[Dict[str, Any]]) -> None:
+    """Удаленные строки уменьшают total, а непрочитанные - и unread"""
+    deltas: Dict[CounterKey, List[int]] = defaultdict(lambda: [0, 0])
+    for row in rows:
+        unread = 0 if row.get('is_read') else 1
+        for key in _row_keys(row):
+            deltas[key][0] -= 1
+            deltas[key][1] -= unread
+    apply_deltas(db, deltas)
+
+
+def count_read_rows(db: Session, rows: Iterable[Dict[str, Any]]) -> None:
+    """Строки, которые только что стали прочитанными, уменьшают unread"""
+    deltas: Dict[CounterKey, List[int]] = defaultdict(lambda: [0, 0])
+    for row in rows:
+        for key in _row_keys(row):
+            deltas[key][1] -= 1
+    apply_deltas(db, deltas)
+
+
+def read_stats(db: Session) -> Dict[str, Any]:
+    """Ответ /api/stats из таблицы счетчиков, без обращения к terraform_logs"""
+    result: Dict[str, Any] = {
+        'total_logs': 0,
+        'unread_logs': 0,
+        'level_stats': {},
+        'section_stats': {},
+        'resource_type_stats': {},
+    }
+    for counter in db.query(LogCounter).all():
+        if (counter.dimension, counter.value) == TOTAL_KEY:
+            result['total_logs'] = counter.total
+            result['unread_logs'] = counter.unread
+        elif counter.total and counter.dimension in COUNTER_DIMENSIONS:
+            result[f'{counter.dimension}_stats'][counter.value] = counter.total
+    return result
+
+
+def compute_counters(db: Session) -> Dict[CounterKey, Tuple[int, int]]:
+    """Эталонные значения счетчиков, посчитанные по terraform_logs"""
+    unread = func.sum(func.iif(TerraformLog.is_read, 0, 1))
+    expected: Dict[CounterKey, Tuple[int, int]] = {}
+
+    total, total_unread = db.execute(select(func.count(TerraformLog.id), unread)).one()
+    if total:
+        expected[TOTAL_KEY] = (total, total_unread or 0)
+
+    for dimension, column in COUNTER_DIMENSIONS.items():
+        rows = db.execute(
+            select(column, func.count(TerraformLog.id), unread)
+            .where(column.isnot(None))
+            .group_by(column)
+        )
+        for value, count, value_unread in rows:
+            expected[(dimension, value)] = (count, value_unread or 0)
+    return expected
+
+
+def check_counters(db: Session) -> List[Tuple[CounterKey, Optional[Tuple[int, int]], Tuple[int, int]]]:
+    """Возвращает расхождения (ключ, сохранено, ожидается); пустой список - счетчики верны"""
+    expected = compute_counters(db)
+    stored = {
+        (counter.dimension, counter.value): (counter.total, counter.unread)
+        for counter in db.query(LogCounter).all()
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        want = expected.get(key, (0, 0))
+        have = stored.get(key)
+        if have != want and not (have is None and want == (0, 0)):
+            mismatches.append((key, have, want))
+    return mismatches
+
+
+def rebuild_counters(db: Session) -> int:
+    """Пересчитывает счетчики целиком в текущей транзакции; возвращает число строк"""
+    expected = compute_counters(db)
+    db.query(LogCounter).delete(synchronize_session=False)
+    db.add_all(
+        LogCounter(dimension=dimension, value=value, total=total, unread=unread)
+        for (dimension, value), (total, unread) in expected.items()
+    )
+    db.flush()
+    return len(expected)
+
+
+def main(argv: List[str]) -> int:
+    from .database import SessionLocal, engine
+    from .migrations import apply_migrations
+    from .models import Base
+
+    command = argv[0] if argv else 'check'
+    if command not in ('check', 'rebuild'):
+        print("Usage: python -m app.counters [check|rebuild]")
+        return 2
+
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        if command == 'rebuild':
+            count = rebuild_counters(db)
+            db.commit()
+            print(f"Rebuilt {count} counters")
+            return 0
+
+        mismatches = check_counters(db)
+        for (dimension, value), have, want in mismatches:
+            print(f"{dimension}={value!r}: stored {have}, expected {want}")
+        print("Counters are consistent" if not mismatches else f"{len(mismatches)} counters are out of sync")
+        return 1 if mismatches else 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
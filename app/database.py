@@ -0,0 +1,133 @@
+import functools
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+import anyio
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from .settings import settings
+
+JOURNAL_MODES = ('wal', 'delete', 'truncate', 'persist', 'memory')
+SYNCHRONOUS_MODES = ('off', 'normal', 'full', 'extra')
+
+
+def _choice(name: str, value: str, allowed, default: str) -> str:
+    value = value.lower()
+    if value not in allowed:
+        print(f"Warning: {name}={value!r} is not one of {allowed}, using {default!r}")
+        return default
+    return value
+
+
+def sqlite_pragmas(read_only: bool = False):
+    """PRAGMA для каждого нового соединения.
+
+    WAL позволяет читать, пока идет запись, а synchronous=NORMAL в режиме
+    WAL делает fsync только при checkpoint, не теряя целостности. Режим
+    журнала хранится в самом файле, поэтому его выставляет писатель;
+    соединения чтения открываются с query_only.
+    """
+    pragmas = [
+        f"PRAGMA busy_timeout = {settings.db_busy_timeout_ms}",
+        f"PRAGMA synchronous = {_choice('TERRAVIEWER_DB_SYNCHRONOUS', settings.db_synchronous, SYNCHRONOUS_MODES, 'normal')}",
+        f"PRAGMA mmap_size = {settings.db_mmap_size_mb * 1024 * 1024}",
+        # Отрицательное значение - размер кэша в КиБ, а не в страницах
+        f"PRAGMA cache_size = {-settings.db_cache_size_mb * 1024}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        pragmas += [
+            # Новая БД создается с incremental auto_vacuum (место освобождает app/retention.py);
+            # у существующей режим меняется только при VACUUM
+            "PRAGMA auto_vacuum = INCREMENTAL",
+            f"PRAGMA journal_mode = {_choice('TERRAVIEWER_DB_JOURNAL_MODE', settings.db_journal_mode, JOURNAL_MODES, 'wal')}",
+        ]
+    return pragmas
+
+
+def create_sqlite_engine(url: str, pool_size: int, read_only: bool = False) -> Engine:
+    """Движок с пулом из pool_size соединений; лишние запросы ждут свободное соединение"""
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=settings.db_pool_timeout,
+    )
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        for pragma in pragmas:
+            dbapi_connection.execute(pragma)
+
+    return engine
+
+
+# SQLite допускает одного писателя, поэтому у записи одно соединение: загрузки,
+# слежение, обслуживание и запросы на изменение выстраиваются к нему в очередь,
+# а не ждут блокировку файла. Чтение идет через отдельный пул и в режиме WAL
+# не ждет записи.
+engine = create_sqlite_engine(settings.database_url, pool_size=1)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+read_engine = create_sqlite_engine(settings.database_url, pool_size=settings.db_read_pool_size, read_only=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+
+class DbExecutor:
+    """Блокирующая работа с БД из обработчиков async в собственном пуле потоков.
+
+    Сессия SQLAlchemy синхронна: запрос, выполненный прямо в обработчике,
+    останавливает цикл событий и все остальные запросы. Здесь он уходит
+    в поток, а число потоков равно числу соединений пула, поэтому поток
+    никогда не ждет соединение, а лишние запросы ждут в цикле событий, не
+    занимая потоков. Пул отделен от общего пула потоков starlette: долгий
+    поиск не мешает приему загрузок, и наоборот.
+    """
+
+    def __init__(self, session_factory, threads: int):
+        self.session_factory = session_factory
+        self.threads = max(threads, 1)
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+
+    @property
+    def limiter(self) -> anyio.CapacityLimiter:
+        # CapacityLimiter создается внутри цикла событий, при первом запросе
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(self.threads)
+        return self._limiter
+
+    async def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """func(*args, **kwargs) в потоке пула; сессии func открывает сама"""
+        return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=self.limiter)
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """func(db, *args, **kwargs) в потоке пула с новой сессией, закрываемой после вызова"""
+        return await self.call(self._with_session, func, *args, **kwargs)
+
+    async def iterate(self, iterator: Iterator[Any]) -> AsyncIterator[Any]:
+        """Элементы синхронного итератора; каждый шаг - отдельный вызов в потоке пула,
+        поэтому долгий поток ответа занимает поток только на время шага"""
+        done = object()
+        while True:
+            item = await self.call(next, iterator, done)
+            if item is done:
+                return
+            yield item
+
+    def _with_session(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        db = self.session_factory()
+        try:
+            return func(db, *args, **kwargs)
+        finally:
+            db.close()
+
+
+# Поток на каждое соединение: чтение - по размеру пула чтения, запись - один
+db_reader = DbExecutor(ReadSessionLocal, settings.db_read_pool_size)
+db_writer = DbExecutor(SessionLocal, 1)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .models import IngestedFile
+from .payloads import load_payloads
+
+# 128 бит: вероятность случайного совпадения отпечатков двух разных строк
+# пренебрежимо мала и на миллиардах строк, а совпадение означало бы потерю строки
+FINGERPRINT_SIZE = 16
+
+# encoding/json в Go, которым пишет terraform, экранирует эти символы в строках
+GO_JSON_ESCAPES = str.maketrans({
+    '<': '\\u003c', '>': '\\u003e', '&': '\\u0026', '\u2028': '\\u2028', '\u2029': '\\u2029'
+})
+
+
+def line_fingerprint(source: str, raw_data: Optional[str]) -> bytes:
+    """Отпечаток строки лога: хэш источника и сырой строки (raw_data)"""
+    digest = hashlib.blake2b(digest_size=FINGERPRINT_SIZE)
+    digest.update(source.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update((raw_data or '').encode('utf-8'))
+    return digest.digest()
+
+
+def terraform_line(raw_data: Optional[str]) -> str:
+    """Строка в том виде, в каком ее пишет terraform, по raw_data из json.dumps.
+
+    Так хранились строки, загруженные до появления отпечатков; исходная
+    строка не сохранилась, и отпечаток считается по восстановленной.
+    """
+    if not raw_data:
+        return ''
+    try:
+        value = json.loads(raw_data)
+    except ValueError:
+        return raw_data
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).translate(GO_JSON_ESCAPES)
+
+
+def legacy_fingerprint(raw_data: Optional[str]) -> bytes:
+    return line_fingerprint('', terraform_line(raw_data))
+
+
+def find_ingested_file(db: Session, sha256: Optional[str], source: str = '') -> Optional[IngestedFile]:
+    """Уже загруженный файл с тем же содержимым и источником - поиск по первичному ключу"""
+    if not sha256:
+        return None
+    return db.get(IngestedFile, (sha256, source))
+
+
+def record_ingested_file(
+    db: Session,
+    sha256: str,
+    source: str,
+    filename: Optional[str],
+    job_id: Optional[str],
+    stats: Dict[str, Any],
+) -> None:
+    """Запоминает полностью загруженный файл; повторная запись того же файла игнорируется"""
+    db.execute(insert(IngestedFile.__table__).on_conflict_do_nothing(), {
+        'sha256': sha256,
+        'source': source,
+        'filename': filename,
+        'job_id': job_id,
+        'lines_total': stats.get('total', 0),
+        'lines_new': stats.get('inserted', 0),
+        'lines_duplicate': stats.get('duplicates', 0),
+        'created_at': datetime.utcnow(),
+    })
+
+
+def describe_ingested_file(known: IngestedFile) -> Dict[str, Any]:
+    return {
+        'sha256': known.sha256,
+        'source': known.source,
+        'filename': known.filename,
+        'job_id': known.job_id,
+        'lines_total': known.lines_total,
+        'lines_new': known.lines_new,
+        'lines_duplicate': known.lines_duplicate,
+        'created_at': known.created_at,
+    }
+
+
+def backfill_fingerprints(db: Session, batch_size: int = 5000) -> int:
+    """Проставляет отпечатки уже загруженным логам (источник '').
+
+    Строки обходятся по возрастанию id; если такая строка уже встречалась,
+    UPDATE OR IGNORE оставляет отпечаток пустым. Такие исторические копии
+    не удаляются: они остаются в выдаче и счетчиках, не мешают уникальному
+    индексу, а новые загрузки той же строки пропускаются по отпечатку
+    первой копии.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        log_ids = db.execute(text("""
+            SELECT id FROM terraform_logs
+            WHERE id > :last_id AND fingerprint IS NULL ORDER BY id LIMIT :limit
+        """), {"last_id": last_id, "limit": batch_size}).scalars().all()
+        if not log_ids:
+            break
+        payloads = load_payloads(db, log_ids)
+        result = db.execute(
+            text("UPDATE OR IGNORE terraform_logs SET fingerprint = :fingerprint WHERE id = :id"),
+            [
+                {"id": log_id, "fingerprint": legacy_fingerprint(payloads.get(log_id, {}).get('raw_data'))}
+                for log_id in log_ids
+            ]
+        )
+        updated += result.rowcount
+        last_id = log_ids[-1]
+
+    duplicates = db.execute(text("SELECT COUNT(*) FROM terraform_logs WHERE fingerprint IS NULL")).scalar()
+    print(f"Fingerprinted {updated} logs, {duplicates} earlier duplicates left without a fingerprint")
+    return updated
@@ -0,0 +1,204 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import TerraformLog
+from .payloads import load_payloads
+from .queries import LOG_LIST_COLUMNS, LOGS_ORDER, log_filters
+from .records import dumps
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMATS = ('ndjson', 'csv', 'parquet')
+# Поля, которые читаются из log_payloads, а не из terraform_logs
+PAYLOAD_FIELDS = ('raw_data', 'json_blocks')
+EXPORT_FIELDS = tuple(LOG_LIST_COLUMNS) + PAYLOAD_FIELDS
+# Строк в одном запросе к БД; столько же строк в памяти во время выгрузки
+CHUNK_ROWS = 5000
+# Уровень 1 сжимает NDJSON лога в несколько раз и почти не замедляет выгрузку
+GZIP_LEVEL = 1
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    # charset starlette добавляет к text/* сам
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def iter_export_records(
+    session_factory: Callable[[], Session],
+    fields: List[str],
+    filters: Dict[str, Any],
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Строки под фильтрами /api/logs пачками по chunk_rows в порядке списка.
+
+    Каждая пачка читается в своей сессии по ключу (timestamp, id) последней
+    строки предыдущей (after_key): долгая выгрузка не держит транзакцию
+    чтения, которая в режиме WAL не дала бы сделать checkpoint, и память
+    не зависит от размера выгрузки.
+    """
+    columns = [name for name in fields if name in LOG_LIST_COLUMNS]
+    payload_fields = [name for name in fields if name in PAYLOAD_FIELDS]
+    after = None
+    while True:
+        db = session_factory()
+        try:
+            rows = db.execute(
+                select(*[LOG_LIST_COLUMNS[name] for name in columns], TerraformLog.timestamp, TerraformLog.id)
+                .where(*log_filters(**filters, after=after))
+                .order_by(*LOGS_ORDER)
+                .limit(chunk_rows)
+            ).all()
+            payloads = load_payloads(db, [row[-1] for row in rows]) if payload_fields and rows else {}
+        finally:
+            db.close()
+
+        records = []
+        for row in rows:
+            values = dict(zip(columns, row))
+            payload = payloads.get(row[-1], {})
+            for name in payload_fields:
+                values[name] = payload.get(name)
+            records.append({name: values[name] for name in fields})
+        if records:
+            yield records
+
+        if len(rows) == chunk_rows:
+            after = (rows[-1][-2], rows[-1][-1])
+        elif after and after[0] is not None:
+            # Строки со временем кончились; строки без времени идут после них (after_key)
+            after = (None, None)
+        else:
+            return
+
+
+def ndjson_chunks(batches: Iterator[List[Dict[str, Any]]], fields: List[str]) -> Iterator[bytes]:
+    for records in batches:
+        yield b''.join(dumps(record) + b'\n' for record in records)
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return dumps(value).decode('utf-8')
+    return value
+
+
+def csv_chunks(batches: Iterator[List[Dict[str, Any]]], fields: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for records in batches:
+        writer.writerows([_csv_value(record[name]) for name in fields] for record in records)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ParquetSink:
+    """Файл для ParquetWriter, записанное в который забирается частями"""
+
+    closed = False
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def _parquet_type(name: str):
+    if name in ('id', 'run_id'):
+        return pyarrow.int64()
+    if name in ('has_json', 'is_read'):
+        return pyarrow.bool_()
+    if name in ('timestamp', 'created_at'):
+        return pyarrow.timestamp('us')
+    return pyarrow.string()
+
+
+def parquet_chunks(batches: Iterator[List[Dict[str, Any]]], fields: List[str]) -> Iterator[bytes]:
+    """Parquet (zstd) с группой строк на каждую пачку; футер уходит последним"""
+    schema = pyarrow.schema([(name, _parquet_type(name)) for name in fields])
+    sink = _ParquetSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for records in batches:
+            if 'json_blocks' in fields:
+                for record in records:
+                    if record['json_blocks'] is not None:
+                        record['json_blocks'] = dumps(record['json_blocks']).decode('utf-8')
+            writer.write_table(pyarrow.Table.from_pylist(records, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {'ndjson': ndjson_chunks, 'csv': csv_chunks, 'parquet': parquet_chunks}
+
+
+def gzip_chunks(chunks: Iterator[bytes], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """Сжатие потока на лету в формат gzip (.gz)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_filename(export_format: str, compressed: bool) -> str:
+    return f"terraform-logs.{export_format}" + ('.gz' if compressed else '')
+
+
+def export_stream(
+    session_factory: Callable[[], Session],
+    export_format: str,
+    fields: List[str],
+    filters: Dict[str, Any],
+    compression: Optional[str] = 'gzip',
+) -> Iterator[bytes]:
+    """Байты выгрузки; Parquet уже сжат внутри и поверх не сжимается"""
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format {export_format!r}, expected one of {EXPORT_FORMATS}")
+    if export_format == 'parquet' and pyarrow is None:
+        raise ExportError("Parquet export requires pyarrow")
+    chunks = ENCODERS[export_format](iter_export_records(session_factory, fields, filters), fields)
+    if compression == 'gzip' and export_format != 'parquet':
+        chunks = gzip_chunks(chunks)
+    return chunks
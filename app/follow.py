@@ -0,0 +1,319 @@
+import os
+import threading
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .ingest import iter_lines, new_stats, parse_lines, print_line_error
+from .models import FollowedFile
+from .runs import create_run, open_run
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_READ_SIZE = 1024 * 1024
+
+
+class FollowError(ValueError):
+    pass
+
+
+class _Target:
+    """Открытый файл и позиция чтения в нем.
+
+    committed_inode/committed_offset - то, что записано в followed_files;
+    read_inode/read_offset - открытый сейчас файл. После ротации они
+    расходятся, пока из нового файла не будет загружена первая пачка.
+    """
+
+    def __init__(self, record_id: int, path: str, inode: Optional[str], offset: int, run_id: Optional[int]):
+        self.record_id = record_id
+        self.path = path
+        self.run_id = run_id
+        self.committed_inode = inode
+        self.committed_offset = offset
+        self.file: Optional[BinaryIO] = None
+        self.read_inode: Optional[str] = None
+        self.read_offset = 0
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def _inode(stat: os.stat_result) -> str:
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+
+class FileFollower:
+    """Дочитывает растущие файлы логов (tail -f для TF_LOG_PATH).
+
+    Каждый опрос читает из файла только полные строки, начиная с сохраненного
+    смещения, и загружает их пачками не больше read_size байт через
+    LogIngestor.write_batch. Новое смещение пишется в той же транзакции,
+    что и строки, условным UPDATE по прежним inode и смещению, поэтому после
+    перезапуска загрузка продолжается с места остановки без дублей, даже если
+    файл одновременно дочитывают сервер и follow.py.
+
+    Файл отслеживается по inode: при ротации старый файл дочитывается до
+    конца и чтение переходит на новый с начала, при усечении (copytruncate)
+    чтение начинается с нуля. Если файла нет, запись ждет его появления.
+
+    Строки файла попадают в его запуск (app/runs.py); если запуск удален,
+    при возобновлении слежения создается новый.
+    """
+
+    def __init__(
+        self,
+        ingestor,
+        session_factory,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        read_size: int = DEFAULT_READ_SIZE,
+        read_session_factory=None,
+    ):
+        self.ingestor = ingestor
+        self.session_factory = session_factory
+        # Списки и проверки только читают и не ждут соединение записи
+        self.read_session_factory = read_session_factory or session_factory
+        self.poll_interval = poll_interval
+        self.read_size = read_size
+        self._targets: Dict[int, _Target] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def follow(self, path: str) -> Dict[str, Any]:
+        """Ставит файл на слежение или возобновляет остановленное"""
+        path = os.path.abspath(path)
+        if os.path.exists(path) and not os.path.isfile(path):
+            raise FollowError(f"{path} is not a regular file")
+
+        db = self.session_factory()
+        try:
+            record = db.query(FollowedFile).filter(FollowedFile.path == path).first()
+            if record is None:
+                record = FollowedFile(path=path, status='active', offset=0, lines_parsed=0, lines_failed=0)
+                db.add(record)
+            else:
+                record.status = 'active'
+                record.error = None
+            if record.run_id is None or open_run(db, record.run_id) is None:
+                record.run_id = create_run(db, name=os.path.basename(path)).id
+            record.updated_at = datetime.utcnow()
+            db.commit()
+            return self._describe(record)
+        finally:
+            db.close()
+
+    def unfollow(self, record_id: int) -> bool:
+        db = self.session_factory()
+        try:
+            updated = db.query(FollowedFile).filter(FollowedFile.id == record_id).update(
+                {'status': 'stopped', 'updated_at': datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+    def has_active_run(self, run_id: int) -> bool:
+        """Дочитывается ли сейчас файл, строки которого идут в запуск"""
+        db = self.read_session_factory()
+        try:
+            return db.query(FollowedFile.id).filter(
+                FollowedFile.run_id == run_id,
+                FollowedFile.status.in_(('active', 'waiting'))
+            ).first() is not None
+        finally:
+            db.close()
+
+    def list(self) -> List[Dict[str, Any]]:
+        db = self.read_session_factory()
+        try:
+            return [self._describe(record) for record in db.query(FollowedFile).order_by(FollowedFile.id).all()]
+        finally:
+            db.close()
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        db = self.read_session_factory()
+        try:
+            record = db.query(FollowedFile).filter(FollowedFile.id == record_id).first()
+            return self._describe(record) if record else None
+        finally:
+            db.close()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='log-follower', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2 + 1)
+            self._thread = None
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Follower poll failed: {e}")
+            self._stop.wait(self.poll_interval)
+        for target in self._targets.values():
+            target.close()
+        self._targets.clear()
+
+    def poll_once(self) -> int:
+        """Один проход по всем активным файлам; возвращает число загруженных строк"""
+        db = self.session_factory()
+        try:
+            records = db.query(FollowedFile).filter(FollowedFile.status.in_(('active', 'waiting'))).all()
+            active = {record.id: record for record in records}
+
+            for record_id in list(self._targets):
+                if record_id not in active:
+                    self._targets.pop(record_id).close()
+
+            parsed = 0
+            for record in records:
+                target = self._targets.get(record.id)
+                if target is None:
+                    target = self._targets[record.id] = _Target(
+                        record.id, record.path, record.inode, record.offset or 0, record.run_id
+                    )
+                # Слежение могли возобновить между опросами уже с новым запуском
+                target.run_id = record.run_id
+                try:
+                    parsed += self._poll_target(db, target)
+                except FollowError as e:
+                    db.rollback()
+                    self._targets.pop(record.id).close()
+                    print(f"Following {record.path}: {e}, reloading position")
+                except Exception as e:
+                    db.rollback()
+                    # Позиция перечитывается из БД на следующем опросе
+                    self._targets.pop(record.id).close()
+                    self._set_status(db, record.id, 'failed', str(e))
+                    print(f"Following {record.path} failed: {e}")
+            return parsed
+        finally:
+            db.close()
+
+    def _poll_target(self, db: Session, target: _Target) -> int:
+        try:
+            stat = os.stat(target.path)
+        except FileNotFoundError:
+            # Файл переименован при ротации, а новый еще не создан
+            parsed = self._drain(db, target, final=True) if target.file else 0
+            target.close()
+            self._set_status(db, target.record_id, 'waiting')
+            return parsed
+
+        inode = _inode(stat)
+        parsed = 0
+        if target.file is None:
+            self._open(target)
+            if target.read_inode == target.committed_inode and target.committed_offset <= stat.st_size:
+                target.read_offset = target.committed_offset
+        elif inode != target.read_inode:
+            parsed += self._drain(db, target, final=True)
+            target.close()
+            self._open(target)
+            print(f"{target.path} was rotated, following the new file")
+        elif stat.st_size < target.read_offset:
+            target.read_offset = 0
+            print(f"{target.path} was truncated, reading from the beginning")
+
+        return parsed + self._drain(db, target)
+
+    def _open(self, target: _Target) -> None:
+        target.file = open(target.path, 'rb')
+        # inode берется у открытого дескриптора: файл мог смениться после stat
+        target.read_inode = _inode(os.fstat(target.file.fileno()))
+        target.read_offset = 0
+
+    def _drain(self, db: Session, target: _Target, final: bool = False) -> int:
+        parsed = 0
+        while True:
+            data = self._read_complete_lines(target, final)
+            if not data:
+                return parsed
+            parsed += self._ingest(db, target, data)
+
+    def _read_complete_lines(self, target: _Target, final: bool) -> bytes:
+        """Полные строки после read_offset, не больше read_size байт, если строки не длиннее.
+
+        Хвост без перевода строки еще дописывается и не читается; при
+        ротации (final) старый файл больше не растет, и хвост читается целиком.
+        """
+        target.file.seek(target.read_offset)
+        data = b''
+        while True:
+            chunk = target.file.read(self.read_size)
+            if not chunk:
+                return data if final else b''
+            data += chunk
+            cut = data.rfind(b'\n') + 1
+            if cut:
+                return data[:cut]
+
+    def _ingest(self, db: Session, target: _Target, data: bytes) -> int:
+        stats = new_stats()
+
+        def on_error(kind: str, line_number: int, error: str) -> None:
+            print(f"{target.path}: ", end='')
+            print_line_error(kind, line_number, error)
+
+        rows = list(parse_lines(self.ingestor.parser, iter_lines((data,)), stats, on_error))
+        offset = target.read_offset + len(data)
+
+        updated = db.query(FollowedFile).filter(
+            FollowedFile.id == target.record_id,
+            FollowedFile.status.in_(('active', 'waiting')),
+            FollowedFile.inode.is_(None) if target.committed_inode is None else FollowedFile.inode == target.committed_inode,
+            FollowedFile.offset == target.committed_offset
+        ).update({
+            'inode': target.read_inode,
+            'offset': offset,
+            'status': 'active',
+            'error': None,
+            'lines_parsed': FollowedFile.lines_parsed + stats['parsed'],
+            'lines_failed': FollowedFile.lines_failed + stats['errors'],
+            'updated_at': datetime.utcnow(),
+        }, synchronize_session=False)
+        if not updated:
+            raise FollowError("the file was advanced by another follower or stopped")
+
+        if rows:
+            # Тот же commit фиксирует и строки, и новое смещение
+            self.ingestor.write_batch(db, rows, stats, run_id=target.run_id)
+        else:
+            db.commit()
+
+        target.committed_inode = target.read_inode
+        target.committed_offset = target.read_offset = offset
+        return stats['parsed']
+
+    def _set_status(self, db: Session, record_id: int, status: str, error: Optional[str] = None) -> None:
+        db.query(FollowedFile).filter(
+            FollowedFile.id == record_id,
+            FollowedFile.status.notin_(('stopped', status))
+        ).update({'status': status, 'error': error, 'updated_at': datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def _describe(record: FollowedFile) -> Dict[str, Any]:
+        return {
+            'id': record.id,
+            'path': record.path,
+            'status': record.status,
+            'run_id': record.run_id,
+            'offset': record.offset,
+            'lines_parsed': record.lines_parsed,
+            'lines_failed': record.lines_failed,
+            'error': record.error,
+            'created_at': record.created_at,
+            'updated_at': record.updated_at,
+        }
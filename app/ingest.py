@@ -0,0 +1,402 @@
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from .bodies import merge_body_stats, new_body_stats
+from .chains import update_request_chains
+from .counters import count_inserted_rows
+from .dedup import line_fingerprint
+from .models import TerraformLog
+from .payloads import log_values, store_payloads
+from .records import JSONDecodeError, decode_record
+from .rollups import rollup_inserted_rows
+from .runs import update_runs
+
+# Порядок полей в кортеже, который возвращает parser.parse_record()
+INGEST_COLUMNS = (
+    'level',
+    'message',
+    'timestamp',
+    'module',
+    'tf_req_id',
+    'tf_resource_type',
+    'tf_rpc',
+    'section',
+    'json_blocks',
+    'raw_data',
+)
+
+SECTION_INDEX = INGEST_COLUMNS.index('section')
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_SHARD_SIZE = 8 * 1024 * 1024
+
+LINE_ERROR_FORMATS = {
+    'json': "JSON decode error on line {line}: {error}",
+    'parse': "Error processing line {line}: {error}",
+}
+
+ErrorHandler = Callable[[str, int, str], None]
+ProgressHandler = Callable[[Dict[str, Any]], None]
+# Вызывается с каждой пачкой строк внутри ее транзакции, до commit
+BatchHook = Callable[[Session, List[Dict[str, Any]]], None]
+# Вызывается с пачкой после commit, например для рассылки подписчикам
+CommitHook = Callable[[List[Dict[str, Any]]], None]
+
+
+def new_stats() -> Dict[str, Any]:
+    return {
+        'total': 0,
+        'parsed': 0,
+        'errors': 0,
+        'inserted': 0,
+        'duplicates': 0,
+        'sections': {'plan': 0, 'apply': 0, 'validation': 0},
+        # Разбор тел HTTP-запросов: количество, исходы и затраченное время
+        'bodies': new_body_stats(),
+        'batches': 0,
+        'bytes': 0,
+        'elapsed': 0.0,
+        'rows_per_sec': 0.0,
+    }
+
+
+def merge_stats(stats: Dict[str, Any], other: Dict[str, Any]) -> None:
+    for key in ('total', 'parsed', 'errors'):
+        stats[key] += other[key]
+    for section, count in other['sections'].items():
+        stats['sections'][section] += count
+    merge_body_stats(stats['bodies'], other['bodies'])
+
+
+def print_line_error(kind: str, line_number: int, error: str) -> None:
+    print(LINE_ERROR_FORMATS[kind].format(line=line_number, error=error))
+
+
+def iter_chunks(file: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_file_chunks(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    with open(file_path, 'rb') as file:
+        yield from iter_chunks(file, chunk_size)
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Режет поток чанков на строки, не держа в памяти больше одного чанка"""
+    tail = b''
+    for chunk in chunks:
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def iter_shards(chunks: Iterable[bytes], shard_size: int = DEFAULT_SHARD_SIZE) -> Iterator[bytes]:
+    """Склеивает чанки в шарды примерно по shard_size байт, разрезая только по переводу строки"""
+    buffer: List[bytes] = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size < shard_size:
+            continue
+
+        data = b''.join(buffer)
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            buffer = [data]
+            continue
+
+        yield data[:cut]
+        rest = data[cut:]
+        buffer = [rest] if rest else []
+        size = len(rest)
+
+    if buffer:
+        yield b''.join(buffer)
+
+
+def count_lines(shard: bytes) -> int:
+    if not shard:
+        return 0
+    return shard.count(b'\n') + (0 if shard.endswith(b'\n') else 1)
+
+
+def parse_lines(
+    parser,
+    lines: Iterable[bytes],
+    stats: Dict[str, Any],
+    on_error: ErrorHandler = print_line_error,
+) -> Iterator[Tuple]:
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        stats['total'] += 1
+
+        try:
+            # raw_data - исходная строка: повторная сериализация не нужна
+            row = parser.parse_record(decode_record(line), line.decode('utf-8'), stats['bodies'])
+        except JSONDecodeError as e:
+            on_error('json', line_number, str(e))
+            stats['errors'] += 1
+            continue
+        except Exception as e:
+            on_error('parse', line_number, str(e))
+            stats['errors'] += 1
+            continue
+
+        stats['parsed'] += 1
+        section = row[SECTION_INDEX]
+        if section and section in stats['sections']:
+            stats['sections'][section] += 1
+        yield row
+
+
+# Парсер дочернего процесса разбора; передается один раз при запуске процесса
+_worker_parser = None
+
+
+def parse_worker_context(parser):
+    """Способ запуска процессов разбора: forkserver, а где его нет - spawn.
+
+    Не fork: загрузка идет в потоке сервера, и fork скопировал бы в дочерний
+    процесс блокировки, которые в этот момент держат другие потоки (пул
+    соединений, logging), и их там некому было бы отпустить. Сервер
+    forkserver запускается один раз чистым процессом и заранее импортирует
+    модули разбора, поэтому следующие загрузки запускают процессы быстро.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__, type(parser).__module__])
+    return context
+
+
+def _init_parse_worker(parser) -> None:
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_shard_in_worker(shard: bytes) -> Tuple[List[Tuple], Dict[str, Any], List[Tuple[str, int, str]]]:
+    return parse_shard(_worker_parser, shard)
+
+
+def parse_shard(parser, shard: bytes) -> Tuple[List[Tuple], Dict[str, Any], List[Tuple[str, int, str]]]:
+    """Выполняется в дочернем процессе: разбирает шард целиком и возвращает строки и статистику"""
+    stats = new_stats()
+    errors: List[Tuple[str, int, str]] = []
+    rows = list(parse_lines(
+        parser,
+        iter_lines((shard,)),
+        stats,
+        lambda kind, line_number, error: errors.append((kind, line_number, error)),
+    ))
+    return rows, stats, errors
+
+
+class LogIngestor:
+    """Потоковая загрузка логов пачками через Core executemany.
+
+    Файл читается чанками, каждая строка разбирается в кортеж полей
+    INGEST_COLUMNS, а каждые batch_size строк записываются одним INSERT
+    в отдельной транзакции, поэтому память не зависит от размера файла.
+
+    При workers > 1 разбор идет в ProcessPoolExecutor: поток режется на
+    шарды по границам строк, шарды разбираются параллельно, а результаты
+    принимаются строго по порядку и пишутся одним писателем.
+
+    batch_hooks получают каждую пачку (уже с id строк) в той же транзакции,
+    что и INSERT, поэтому сжатая нагрузка в log_payloads и производные
+    таблицы (счетчики /api/stats, поминутные роллапы, сводки цепочек
+    запросов и запусков) не расходятся с логами. Все строки одной загрузки
+    получают run_id ее запуска (app/runs.py).
+    commit_hooks получают пачку уже после commit; их ошибки не прерывают загрузку.
+
+    Загрузка идемпотентна: у каждой строки есть отпечаток (источник + сырая
+    строка) с уникальным индексом, и INSERT OR IGNORE пропускает уже
+    загруженные строки. Хуки получают только действительно добавленные
+    строки, поэтому повторная загрузка не меняет ни счетчики, ни роллапы.
+    """
+
+    def __init__(
+        self,
+        parser,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        workers: int = 1,
+        shard_size: int = DEFAULT_SHARD_SIZE,
+    ):
+        self.parser = parser
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.shard_size = shard_size
+        self.table = TerraformLog.__table__
+        self.batch_hooks: List[BatchHook] = [
+            store_payloads, count_inserted_rows, rollup_inserted_rows, update_request_chains, update_runs
+        ]
+        self.commit_hooks: List[CommitHook] = []
+
+    def ingest_file(
+        self,
+        file_path: str,
+        db: Session,
+        stats: Optional[Dict[str, Any]] = None,
+        progress: Optional[ProgressHandler] = None,
+        source: str = '',
+        run_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        # Файл открывается сразу, чтобы FileNotFoundError не откладывался до первой итерации
+        with open(file_path, 'rb') as file:
+            return self.ingest_chunks(iter_chunks(file, self.chunk_size), db, stats, progress, source, run_id)
+
+    def ingest_chunks(
+        self,
+        chunks: Iterable[bytes],
+        db: Session,
+        stats: Optional[Dict[str, Any]] = None,
+        progress: Optional[ProgressHandler] = None,
+        source: str = '',
+        run_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Загружает поток; progress(stats) вызывается после каждой пачки и может прервать загрузку исключением"""
+        if stats is None:
+            stats = new_stats()
+
+        started = time.perf_counter()
+        batch: List[Tuple] = []
+
+        def counted(source: Iterable[bytes]) -> Iterator[bytes]:
+            for chunk in source:
+                stats['bytes'] += len(chunk)
+                yield chunk
+
+        try:
+            for row in self.iter_rows(counted(chunks), stats):
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self.write_batch(db, batch, stats, source, run_id)
+                    batch = []
+                    if progress:
+                        progress(stats)
+
+            if batch:
+                self.write_batch(db, batch, stats, source, run_id)
+                if progress:
+                    progress(stats)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            stats['elapsed'] = time.perf_counter() - started
+            if stats['elapsed'] > 0:
+                stats['rows_per_sec'] = round(stats['parsed'] / stats['elapsed'], 1)
+
+        return stats
+
+    def iter_rows(self, chunks: Iterable[bytes], stats: Dict[str, Any]) -> Iterator[Tuple]:
+        if self.workers > 1:
+            return self._iter_rows_parallel(chunks, stats)
+        return parse_lines(self.parser, iter_lines(chunks), stats)
+
+    def _iter_rows_parallel(self, chunks: Iterable[bytes], stats: Dict[str, Any]) -> Iterator[Tuple]:
+        # Не больше двух шардов в очереди на процесс, чтобы память оставалась ограниченной
+        max_pending = self.workers * 2
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=parse_worker_context(self.parser),
+            initializer=_init_parse_worker,
+            initargs=(self.parser,),
+        ) as pool:
+            pending = deque()
+            line_offset = 0
+
+            def drain_one():
+                nonlocal line_offset
+                future, lines_in_shard = pending.popleft()
+                rows, shard_stats, errors = future.result()
+                for kind, line_number, error in errors:
+                    print_line_error(kind, line_offset + line_number, error)
+                merge_stats(stats, shard_stats)
+                line_offset += lines_in_shard
+                return rows
+
+            for shard in iter_shards(chunks, self.shard_size):
+                pending.append((pool.submit(_parse_shard_in_worker, shard), count_lines(shard)))
+                if len(pending) >= max_pending:
+                    yield from drain_one()
+
+            while pending:
+                yield from drain_one()
+
+    def write_batch(
+        self,
+        db: Session,
+        batch: List[Tuple],
+        stats: Dict[str, Any],
+        source: str = '',
+        run_id: Optional[int] = None,
+    ) -> None:
+        rows = [dict(zip(INGEST_COLUMNS, row)) for row in batch]
+        for row in rows:
+            row['fingerprint'] = line_fingerprint(source, row['raw_data'])
+            row['run_id'] = run_id
+        self.write_rows(db, rows, stats)
+
+    def write_rows(self, db: Session, rows: List[Dict[str, Any]], stats: Dict[str, Any]) -> None:
+        """Пишет готовые строки (колонки terraform_logs и нагрузка) одной транзакцией с хуками.
+
+        У всех строк одинаковый набор ключей и заполненный fingerprint;
+        так загружаются и разобранные строки, и строки из архива (app/retention.py).
+        """
+        batch_size = len(rows)
+        result = db.execute(insert(self.table).prefix_with('OR IGNORE'), [log_values(row) for row in rows])
+        inserted = result.rowcount
+
+        # С первого INSERT транзакция держит блокировку записи, а SQLite выдает
+        # rowid как max(rowid) + 1, поэтому добавленные строки заняли подряд
+        # идущие id, последний из которых - текущий максимум. Какие именно
+        # строки пачки добавлены, видно по отпечаткам в этом диапазоне id;
+        # повтор внутри пачки получает id только при первом вхождении.
+        # Это вдвое быстрее, чем RETURNING.
+        if inserted:
+            last_id = db.execute(select(func.max(self.table.c.id))).scalar()
+            ids = dict(db.execute(
+                select(self.table.c.fingerprint, self.table.c.id).where(self.table.c.id > last_id - inserted)
+            ).all())
+            new_rows = []
+            for row in rows:
+                log_id = ids.pop(row['fingerprint'], None)
+                if log_id is not None:
+                    row['id'] = log_id
+                    new_rows.append(row)
+            rows = new_rows
+        else:
+            rows = []
+        stats['inserted'] += len(rows)
+        stats['duplicates'] += batch_size - len(rows)
+
+        for hook in self.batch_hooks:
+            hook(db, rows)
+        db.commit()
+        stats['batches'] += 1
+
+        for hook in self.commit_hooks:
+            try:
+                hook(rows)
+            except Exception as e:
+                print(f"Commit hook {hook!r} failed: {e}")
@@ -0,0 +1,356 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .dedup import describe_ingested_file, find_ingested_file, record_ingested_file
+from .models import IngestJob
+from .purge import purge_run
+from .uploads import UploadCancelled, remove_upload_file
+
+ACTIVE_STATUSES = ('queued', 'running')
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class _JobState:
+    """Живое состояние задачи, пока она в очереди или выполняется"""
+
+    def __init__(
+        self,
+        job_id: str,
+        bytes_total: Optional[int],
+        source: str,
+        run_id: Optional[int],
+        discard_empty_run: bool = False,
+        on_cancel: Optional[Callable[[], None]] = None,
+    ):
+        self.job_id = job_id
+        self.bytes_total = bytes_total
+        self.source = source
+        self.run_id = run_id
+        self.discard_empty_run = discard_empty_run
+        self.on_cancel = on_cancel
+        self.stats: Dict[str, Any] = {}
+        self.status = 'queued'
+        self.started: Optional[float] = None
+        self.cancel_requested = threading.Event()
+        self.future = None
+
+
+class JobManager:
+    """Очередь задач загрузки с ограниченным пулом потоков.
+
+    Каждая задача открывает собственную сессию БД, прогресс периодически
+    сохраняется в таблицу jobs. Если задач в очереди и в работе больше,
+    чем workers + queue_size, submit() бросает JobQueueFull.
+
+    Файл успешно завершенной задачи с известным sha256 запоминается в
+    ingested_files, и повторная загрузка того же файла пропускается целиком.
+    Запуск, созданный для задачи (discard_empty_run), удаляется, если в
+    него не попало ни одной новой строки.
+
+    Состояние задач читается через read_session_factory, чтобы опрос
+    прогресса не ждал соединение записи, занятое самой загрузкой.
+    """
+
+    def __init__(self, ingestor, session_factory, workers: int = 2, queue_size: int = 8, read_session_factory=None):
+        self.ingestor = ingestor
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory or session_factory
+        self.capacity = workers + queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest-job')
+        self._active: Dict[str, _JobState] = {}
+        self._lock = threading.Lock()
+
+    def recover(self) -> None:
+        """Задачи, оставшиеся активными после перезапуска, помечаются как прерванные.
+
+        Продолжить такую задачу нельзя, поэтому ее файл загрузки удаляется.
+        """
+        db = self.session_factory()
+        try:
+            interrupted = db.query(IngestJob).filter(IngestJob.status.in_(ACTIVE_STATUSES))
+            spool_paths = [path for (path,) in interrupted.with_entities(IngestJob.spool_path) if path]
+            interrupted.update(
+                {'status': 'failed', 'error': 'Interrupted by server restart', 'finished_at': datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        for path in spool_paths:
+            remove_upload_file(path)
+
+    def is_full(self) -> bool:
+        return len(self._active) >= self.capacity
+
+    def submit(
+        self,
+        chunks_factory: Callable[[], Iterable[bytes]],
+        filename: Optional[str] = None,
+        sha256: Optional[str] = None,
+        bytes_total: Optional[int] = None,
+        cleanup: Optional[Callable[[], None]] = None,
+        source: str = '',
+        run_id: Optional[int] = None,
+        spool_path: Optional[str] = None,
+        discard_empty_run: bool = False,
+        on_cancel: Optional[Callable[[], None]] = None,
+    ) -> str:
+        """on_cancel вызывается при отмене, чтобы разбудить источник чанков, который ждет данных"""
+        with self._lock:
+            if len(self._active) >= self.capacity:
+                raise JobQueueFull(f"Ingest queue is full ({self.capacity} jobs)")
+            job_id = uuid.uuid4().hex
+            state = _JobState(job_id, bytes_total, source, run_id, discard_empty_run, on_cancel)
+            self._active[job_id] = state
+
+        db = self.session_factory()
+        try:
+            db.add(IngestJob(
+                id=job_id,
+                status='queued',
+                filename=filename,
+                sha256=sha256,
+                source=source,
+                run_id=run_id,
+                bytes_total=bytes_total,
+                spool_path=spool_path
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+        state.future = self._executor.submit(self._run, state, chunks_factory, cleanup)
+        return job_id
+
+    def set_bytes_total(self, job_id: str, bytes_total: int, sha256: Optional[str] = None) -> None:
+        """Для потоковой загрузки размер становится известен только в конце передачи"""
+        state = self._active.get(job_id)
+        if state:
+            state.bytes_total = bytes_total
+        self._update(job_id, bytes_total=bytes_total, sha256=sha256)
+        # Задача могла завершиться раньше, чем стал известен sha256
+        self._remember_file(job_id)
+
+    def known_file(self, sha256: Optional[str], source: str = '') -> Optional[Dict[str, Any]]:
+        """Сведения о ранее полностью загруженном файле с тем же содержимым или None"""
+        db = self.read_session_factory()
+        try:
+            known = find_ingested_file(db, sha256, source)
+            return describe_ingested_file(known) if known else None
+        finally:
+            db.close()
+
+    def has_active_run(self, run_id: int) -> bool:
+        """Есть ли задача в очереди или в работе, загружающая строки в запуск"""
+        return any(state.run_id == run_id for state in list(self._active.values()))
+
+    def cancel(self, job_id: str) -> bool:
+        state = self._active.get(job_id)
+        if state is None:
+            return False
+        self._request_cancel(state)
+        return True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = self.read_session_factory()
+        try:
+            job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+            if not job:
+                return None
+            result = self._describe(job)
+        finally:
+            db.close()
+
+        state = self._active.get(job_id)
+        if state is not None:
+            result.update(self._live_progress(state))
+        return result
+
+    def shutdown(self) -> None:
+        for state in list(self._active.values()):
+            self._request_cancel(state)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _request_cancel(state: _JobState) -> None:
+        state.cancel_requested.set()
+        if state.on_cancel:
+            state.on_cancel()
+
+    def _run(self, state: _JobState, chunks_factory, cleanup) -> None:
+        db = self.session_factory()
+        last_flush = 0.0
+
+        def progress(stats: Dict[str, Any]) -> None:
+            nonlocal last_flush
+            state.stats = stats
+            if state.cancel_requested.is_set():
+                raise JobCancelled()
+            now = time.monotonic()
+            if now - last_flush >= PROGRESS_FLUSH_INTERVAL:
+                last_flush = now
+                self._update(state.job_id, **self._progress_columns(stats))
+
+        try:
+            if state.cancel_requested.is_set():
+                raise JobCancelled()
+
+            state.status = 'running'
+            state.started = time.monotonic()
+            self._update(state.job_id, status='running', started_at=datetime.utcnow())
+
+            stats = self.ingestor.ingest_chunks(
+                chunks_factory(), db, progress=progress, source=state.source, run_id=state.run_id
+            )
+            state.stats = stats
+            self._finish(state, 'completed', stats)
+            self._remember_file(state.job_id)
+            print(f"Job {state.job_id} completed: {stats}")
+        except (JobCancelled, UploadCancelled):
+            self._finish(state, 'cancelled', state.stats)
+            print(f"Job {state.job_id} cancelled")
+        except Exception as e:
+            error = str(e)
+            if state.stats.get('inserted'):
+                error += (f"; {state.stats['inserted']} lines were stored before the failure,"
+                          f" upload the file again to add the rest")
+            self._finish(state, 'failed', state.stats, error=error)
+            print(f"Job {state.job_id} failed: {error}")
+        finally:
+            db.close()
+            if state.discard_empty_run and not state.stats.get('inserted'):
+                self._discard_run(state)
+            with self._lock:
+                self._active.pop(state.job_id, None)
+            if cleanup:
+                cleanup()
+
+    def _finish(self, state: _JobState, status: str, stats: Dict[str, Any], error: Optional[str] = None) -> None:
+        values = self._progress_columns(stats) if stats else {}
+        self._update(
+            state.job_id,
+            status=status,
+            stats=stats or None,
+            error=error,
+            finished_at=datetime.utcnow(),
+            **values
+        )
+
+    def _discard_run(self, state: _JobState) -> None:
+        if any(other.run_id == state.run_id for other in list(self._active.values()) if other is not state):
+            return
+        db = self.session_factory()
+        try:
+            # Сначала отвязывается задача, чтобы purge_run не забыл ее файл
+            db.query(IngestJob).filter(IngestJob.id == state.job_id).update(
+                {'run_id': None}, synchronize_session=False
+            )
+            purge_run(db, state.run_id)
+        finally:
+            db.close()
+        print(f"Job {state.job_id} added no new lines, removed its empty run {state.run_id}")
+
+    def _remember_file(self, job_id: str) -> None:
+        db = self.session_factory()
+        try:
+            job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+            if job is None or job.status != 'completed' or not job.sha256:
+                return
+            record_ingested_file(db, job.sha256, job.source or '', job.filename, job.id, job.stats or {})
+            db.commit()
+        finally:
+            db.close()
+
+    def _update(self, job_id: str, **values) -> None:
+        values = {key: value for key, value in values.items() if value is not None or key == 'error'}
+        db = self.session_factory()
+        try:
+            db.query(IngestJob).filter(IngestJob.id == job_id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _progress_columns(stats: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'bytes_processed': stats.get('bytes', 0),
+            'lines_total': stats.get('total', 0),
+            'lines_parsed': stats.get('parsed', 0),
+            'lines_failed': stats.get('errors', 0),
+            'lines_new': stats.get('inserted', 0),
+            'lines_duplicate': stats.get('duplicates', 0),
+        }
+
+    @staticmethod
+    def _live_progress(state: _JobState) -> Dict[str, Any]:
+        stats = state.stats
+        result = {
+            'status': state.status,
+            'cancel_requested': state.cancel_requested.is_set(),
+            'bytes_total': state.bytes_total,
+        }
+        if not stats:
+            return result
+
+        result.update(JobManager._progress_columns(stats))
+        if state.started is None:
+            return result
+
+        elapsed = time.monotonic() - state.started
+        if elapsed <= 0:
+            return result
+
+        result['elapsed'] = round(elapsed, 3)
+        result['lines_per_sec'] = round(stats.get('parsed', 0) / elapsed, 1)
+        bytes_per_sec = stats.get('bytes', 0) / elapsed
+        result['bytes_per_sec'] = round(bytes_per_sec, 1)
+        if state.bytes_total and bytes_per_sec > 0:
+            remaining = max(state.bytes_total - stats.get('bytes', 0), 0)
+            result['eta_seconds'] = round(remaining / bytes_per_sec, 1)
+        return result
+
+    @staticmethod
+    def _describe(job: IngestJob) -> Dict[str, Any]:
+        result = {
+            'id': job.id,
+            'status': job.status,
+            'filename': job.filename,
+            'sha256': job.sha256,
+            'source': job.source,
+            'run_id': job.run_id,
+            'bytes_total': job.bytes_total,
+            'bytes_processed': job.bytes_processed,
+            'lines_total': job.lines_total,
+            'lines_parsed': job.lines_parsed,
+            'lines_failed': job.lines_failed,
+            'lines_new': job.lines_new,
+            'lines_duplicate': job.lines_duplicate,
+            'error': job.error,
+            # Задача прервана, но часть строк уже записана; повторная загрузка их пропустит
+            'partial': job.status in ('failed', 'cancelled') and bool(job.lines_new),
+            'stats': job.stats,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+        }
+        if job.started_at and job.finished_at:
+            elapsed = (job.finished_at - job.started_at).total_seconds()
+            result['elapsed'] = round(elapsed, 3)
+            if elapsed > 0:
+                result['lines_per_sec'] = round((job.lines_parsed or 0) / elapsed, 1)
+                result['bytes_per_sec'] = round((job.bytes_processed or 0) / elapsed, 1)
+            result['eta_seconds'] = 0
+        return result
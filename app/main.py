@@ -1,37 +1,45 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, UploadFile, File, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, JSON, func
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, List, Dict, Any
-import json
+from typing import Optional, List, Dict, Any, Tuple
+import logging
 import os
-import uuid
-import re
-
-SQLITE_DATABASE_URL = "sqlite:///./data/terraform_logs.db"
-engine = create_engine(SQLITE_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-class TerraformLog(Base):
-    __tablename__ = "terraform_logs"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    level = Column(String, index=True)
-    message = Column(Text)
-    timestamp = Column(DateTime, index=True)
-    module = Column(String, nullable=True)
-    tf_req_id = Column(String, index=True, nullable=True)
-    tf_resource_type = Column(String, index=True, nullable=True)
-    tf_rpc = Column(String, nullable=True)
-    raw_data = Column(Text)
-    section = Column(String, index=True, nullable=True)
-    json_blocks = Column(JSON, nullable=True)
-    is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+from contextlib import asynccontextmanager
+
+from .models import Base, RequestChain, Run, TerraformLog
+from .database import ReadSessionLocal, SessionLocal, db_reader, db_writer, engine, read_engine
+from .counters import count_read_rows, read_stats
+from .cache import ResponseCache, ResponseCacheMiddleware
+from .compression import CompressionMiddleware
+from .export import EXPORT_FIELDS, MEDIA_TYPES, export_filename, export_stream
+from .chains import CHAIN_ORDERS, chain_filters
+from .ingest import LogIngestor, iter_file_chunks
+from .parser import SimpleTerraformParser
+from .follow import FileFollower, FollowError
+from .jobs import JobManager, JobQueueFull
+from .migrations import apply_migrations
+from .queries import LOG_LIST_COLUMNS, LOGS_ORDER, log_filters, parse_log_fields, through_key
+from .reads import mark_ids_read, mark_matching_read
+from .records import dumps, orjson
+from .retention import retention_manager_from_settings
+from .rollups import histogram, parse_interval
+from .runs import create_run, describe_run, list_runs, mark_run_deleting, open_run, run_levels
+from .payloads import load_payloads, with_payload
+from .purge import purge_run
+from .pagination import InvalidCursor, decode_rank_cursor, decode_time_cursor, encode_cursor
+from .search import LogSearch
+from .settings import settings
+from .stream import LogBroker, TooManySubscribers, sse_events
+from .uploads import UPLOAD_CHUNK_SIZE, UPLOAD_DIR, UploadError, UploadSpool, UploadTooLarge, split_upload_filename
+
+logger = logging.getLogger(__name__)
 
 class LogCreate(BaseModel):
     level: str
@@ -49,271 +57,441 @@ class LogResponse(BaseModel):
     id: int
     level: str
     message: str
-    timestamp: datetime
+    timestamp: Optional[datetime] = None
     module: Optional[str] = None
     tf_req_id: Optional[str] = None
     tf_resource_type: Optional[str] = None
     tf_rpc: Optional[str] = None
     section: Optional[str] = None
-    json_blocks: Optional[Dict[str, Any]] = None
+    run_id: Optional[int] = None
+    has_json: bool = False
     is_read: bool
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+class ChainResponse(BaseModel):
+    tf_req_id: str
+    first_timestamp: Optional[datetime] = None
+    last_timestamp: Optional[datetime] = None
+    duration_ms: float
+    tf_rpc: Optional[str] = None
+    tf_resource_type: Optional[str] = None
+    log_count: int
+    error_count: int
+    worst_level: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class FollowRequest(BaseModel):
+    path: str
+
+class MarkReadRequest(BaseModel):
+    """Какие строки отметить прочитанными; все заданные условия объединяются через AND"""
+    ids: Optional[List[int]] = None
+    run_id: Optional[int] = None
+    level: Optional[str] = None
+    tf_resource_type: Optional[str] = None
+    section: Optional[str] = None
+    tf_req_id: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    # X-Next-Cursor страницы /api/logs: строки списка до конца этой страницы включительно
+    through_cursor: Optional[str] = None
+    # Без других условий нужно явно подтвердить отметку всех строк
+    all: bool = False
+
+class LogDetailResponse(LogResponse):
+    raw_data: Optional[str] = None
+    json_blocks: Optional[Dict[str, Any]] = None
+
 Base.metadata.create_all(bind=engine)
+apply_migrations(engine)
+
+search_engine = LogSearch(engine=engine, read_engine=read_engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_manager.recover()
+    file_follower.start()
+    retention_manager.start()
+    yield
+    retention_manager.stop()
+    file_follower.stop()
+    job_manager.shutdown()
+
+# orjson, если установлен, сериализует ответы в байты без промежуточной строки
+app = FastAPI(
+    title="TerraViewer API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
+)
 
-app = FastAPI(title="TerraViewer API", version="1.0.0")
+# Ответы, которые меняются только вместе с данными; кэш сбрасывают загрузка,
+# отметка о прочтении, удаление запуска и обслуживание
+CACHED_PATHS = (
+    "/api/logs",
+    "/api/sections",
+    "/api/stats",
+    "/api/histogram",
+    "/api/levels",
+    "/api/resource-types",
+    "/api/search",
+    "/api/chains",
+)
+response_cache = ResponseCache(max_bytes=settings.cache_max_mb * 1024 * 1024, ttl=settings.cache_ttl)
 
+# Добавленный последним middleware внешний: CORS добавляет заголовки и к ответам из кэша
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache, paths=CACHED_PATHS)
+# Кэш хранит несжатые ответы, сжатие - снаружи него
+# Выгрузка сжимается сама и отдается файлом .gz
+app.add_middleware(CompressionMiddleware, excluded=("/api/stream", "/api/export"))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Cache"],
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+parser = SimpleTerraformParser()
 
-class SimpleTerraformParser:
-    def __init__(self):
-        self.level_patterns = {
-            'error': ['error', 'failed', 'exception', 'fatal'],
-            'warn': ['warn', 'warning', 'attention', 'caution'],
-            'debug': ['debug', 'trace'],
-            'info': ['info', 'message', 'starting', 'completed']
-        }
-        
-        self.plan_section_pattern = re.compile(r'starting Plan operation', re.IGNORECASE)
-        self.apply_section_pattern = re.compile(r'starting Apply operation', re.IGNORECASE)
-        self.validation_section_pattern = re.compile(r'running validation operation', re.IGNORECASE)
-    
-    def detect_level_heuristic(self, message: str) -> str:
-        message_lower = message.lower()
-        for level, patterns in self.level_patterns.items():
-            if any(pattern in message_lower for pattern in patterns):
-                return level
-        return 'info'
-    
-    def parse_timestamp(self, timestamp_str: str) -> Optional[datetime]:
-        try:
-            if '+' in timestamp_str:
-                return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-            elif timestamp_str.endswith('Z'):
-                return datetime.fromisoformat(timestamp_str[:-1] + '+00:00')
-            else:
-                return datetime.fromisoformat(timestamp_str)
-        except (ValueError, TypeError):
-            return datetime.utcnow()
-    
-    def detect_section(self, message: str) -> Optional[str]:
-        if self.plan_section_pattern.search(message):
-            return 'plan'
-        elif self.apply_section_pattern.search(message):
-            return 'apply'
-        elif self.validation_section_pattern.search(message):
-            return 'validation'
-        return None
-    
-    def extract_json_blocks(self, field_value: str) -> Optional[Dict[str, Any]]:
-        if not field_value or not isinstance(field_value, str):
-            return None
-        
-        json_match = re.search(r'(\{.*\}|\[.*\])', field_value, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                pass
-        
-        return None
-    
-    def parse_single_log(self, log_data: dict) -> LogCreate:
-        level = log_data.get('@level')
-        message = log_data.get('@message', '')
-        timestamp_str = log_data.get('@timestamp')
-        
-        if not level:
-            level = self.detect_level_heuristic(message)
-        
-        timestamp = self.parse_timestamp(timestamp_str) if timestamp_str else datetime.utcnow()
-        
-        section = self.detect_section(message)
-        
-        json_blocks = {}
-        for json_field in ['tf_http_req_body', 'tf_http_res_body']:
-            if json_field in log_data:
-                json_blocks[json_field] = self.extract_json_blocks(log_data[json_field])
-        
-        return LogCreate(
-            level=level,
-            message=message,
-            timestamp=timestamp,
-            module=log_data.get('@module'),
-            tf_req_id=log_data.get('tf_req_id'),
-            tf_resource_type=log_data.get('tf_resource_type'),
-            tf_rpc=log_data.get('tf_rpc'),
-            section=section,
-            json_blocks=json_blocks,
-            raw_data=json.dumps(log_data)
-        )
+ingestor = LogIngestor(
+    parser,
+    batch_size=settings.ingest_batch_size,
+    workers=settings.ingest_workers,
+    shard_size=settings.ingest_shard_size
+)
 
-parser = SimpleTerraformParser()
+log_broker = LogBroker(
+    buffer_size=settings.stream_buffer_size,
+    max_subscribers=settings.stream_max_clients
+)
+ingestor.commit_hooks.append(log_broker.publish)
+ingestor.commit_hooks.append(response_cache.invalidate)
 
-def process_log_file(file_path: str, db: Session):
-    try:
-        print(f"Processing file: {file_path}")
-        stats = {
-            'total': 0,
-            'parsed': 0,
-            'errors': 0,
-            'sections': {'plan': 0, 'apply': 0, 'validation': 0}
-        }
-        
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line_number, line in enumerate(file, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                stats['total'] += 1
-                
-                try:
-                    log_data = json.loads(line)
-                    log_create = parser.parse_single_log(log_data)
-                    
-                    db_log = TerraformLog(**log_create.dict())
-                    db.add(db_log)
-                    stats['parsed'] += 1
-                    
-                    section = log_create.section
-                    if section and section in stats['sections']:
-                        stats['sections'][section] += 1
-                    
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error on line {line_number}: {e}")
-                    stats['errors'] += 1
-                except Exception as e:
-                    print(f"Error processing line {line_number}: {e}")
-                    stats['errors'] += 1
-            
-            db.commit()
-        
-        print(f"File processed: {stats}")
-        
-    except Exception as e:
-        print(f"Error processing file: {e}")
-        db.rollback()
-    finally:
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"Cleaned up: {file_path}")
-        except Exception as e:
-            print(f" Cleanup failed: {e}")
+job_manager = JobManager(
+    ingestor,
+    SessionLocal,
+    workers=settings.job_workers,
+    queue_size=settings.job_queue_size,
+    read_session_factory=ReadSessionLocal
+)
+
+file_follower = FileFollower(
+    ingestor,
+    SessionLocal,
+    poll_interval=settings.follow_poll_ms / 1000,
+    read_size=settings.follow_read_size,
+    read_session_factory=ReadSessionLocal
+)
+
+retention_manager = retention_manager_from_settings(SessionLocal, settings)
+retention_manager.delete_hooks.append(response_cache.invalidate)
 
-os.makedirs("./data/uploads", exist_ok=True)
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 @app.get("/")
 async def root():
     return {"message": "TerraViewer API", "version": "1.0.0"}
 
+def invalid_cursor_error(e: InvalidCursor) -> HTTPException:
+    return HTTPException(status_code=400, detail=str(e))
+
+# Запросы к БД выполняются функциями ниже в потоках db_reader/db_writer
+# (app/database.py), чтобы обработчики не останавливали цикл событий
+
+def logs_page(
+    db: Session, fields: List[str], skip: int, limit: int, after=None, **filters
+) -> Tuple[bytes, Optional[str]]:
+    """Страница /api/logs сразу в JSON-байтах и курсор следующей страницы.
+
+    Читаются только столбцы fields, без ORM-объектов и проверки через
+    LogResponse; время и id для курсора читаются всегда.
+    """
+    columns = [LOG_LIST_COLUMNS[name] for name in fields] + [TerraformLog.timestamp, TerraformLog.id]
+    
+    def read(after, skip: int, limit: int):
+        return db.execute(
+            select(*columns)
+            .where(*log_filters(**filters, after=after))
+            .order_by(*LOGS_ORDER)
+            .offset(skip)
+            .limit(limit)
+        ).all()
+    
+    rows = read(after, skip, limit + 1)
+    if len(rows) <= limit and after and after[0] is not None:
+        # Строки со временем кончились; строки без времени идут после них (after_key).
+        # Если все строки со временем ушли в skip, в хвосте пропускается остаток
+        if rows or not skip:
+            skip = 0
+        else:
+            skipped = select(TerraformLog.id).where(*log_filters(**filters, after=after)).limit(skip).subquery()
+            skip -= db.execute(select(func.count()).select_from(skipped)).scalar()
+        rows += read((None, None), skip, limit + 1 - len(rows))
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor('time', rows[-1][-2], rows[-1][-1])
+    
+    count = len(fields)
+    return dumps([dict(zip(fields, row[:count])) for row in rows]), next_cursor
+
 @app.get("/api/logs", response_model=List[LogResponse])
 async def get_logs(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    run_id: Optional[int] = Query(None),
     level: Optional[str] = Query(None),
     tf_resource_type: Optional[str] = Query(None),
     section: Optional[str] = Query(None),
+    tf_req_id: Optional[str] = Query(None),
     start_date: Optional[datetime] = Query(None),
     end_date: Optional[datetime] = Query(None),
     unread_only: bool = Query(False),
-    db: Session = Depends(get_db)
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,level,timestamp,message")
 ):
-    query = db.query(TerraformLog)
-    
-    if level:
-        query = query.filter(TerraformLog.level == level)
-    if tf_resource_type:
-        query = query.filter(TerraformLog.tf_resource_type == tf_resource_type)
-    if section:
-        query = query.filter(TerraformLog.section == section)
-    if start_date:
-        query = query.filter(TerraformLog.timestamp >= start_date)
-    if end_date:
-        query = query.filter(TerraformLog.timestamp <= end_date)
-    if unread_only:
-        query = query.filter(TerraformLog.is_read == False)
+    try:
+        after = decode_time_cursor(cursor)
+    except InvalidCursor as e:
+        raise invalid_cursor_error(e)
     
-    logs = query.order_by(TerraformLog.timestamp.desc()).offset(skip).limit(limit).all()
+    try:
+        columns = parse_log_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    body, next_cursor = await db_reader.run(
+        logs_page,
+        columns,
+        skip,
+        limit,
+        run_id=run_id,
+        level=level,
+        tf_resource_type=tf_resource_type,
+        section=section,
+        tf_req_id=tf_req_id,
+        start_date=start_date,
+        end_date=end_date,
+        unread_only=unread_only,
+        after=after
+    )
     
-    return logs
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(body, media_type="application/json", headers=headers)
 
-@app.get("/api/sections")
-async def get_sections(db: Session = Depends(get_db)):
+def distinct_sections(db: Session) -> List[str]:
     sections = db.query(TerraformLog.section).filter(
         TerraformLog.section.isnot(None)
     ).distinct().all()
     return [section[0] for section in sections]
 
+@app.get("/api/sections")
+async def get_sections():
+    return await db_reader.run(distinct_sections)
+
+@app.get("/api/levels")
+async def get_levels():
+    return await db_reader.call(search_engine.get_levels)
+
+@app.get("/api/resource-types")
+async def get_resource_types():
+    return await db_reader.call(search_engine.get_resource_types)
+
 @app.get("/api/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    total_logs = db.query(TerraformLog).count()
-    unread_logs = db.query(TerraformLog).filter(TerraformLog.is_read == False).count()
-    
-    level_stats = db.query(
-        TerraformLog.level,
-        func.count(TerraformLog.id)
-    ).group_by(TerraformLog.level).all()
-    
-    section_stats = db.query(
-        TerraformLog.section,
-        func.count(TerraformLog.id)
-    ).filter(TerraformLog.section.isnot(None)).group_by(TerraformLog.section).all()
+async def get_stats():
+    return await db_reader.run(read_stats)
+
+@app.get("/api/histogram")
+async def get_histogram(
+    interval: str = Query("1m", description="Bucket width: 1m, 15m, 1h, 1d"),
+    group_by: Optional[str] = Query(None, pattern="^(level|section|tf_resource_type)$"),
+    level: Optional[str] = Query(None),
+    tf_resource_type: Optional[str] = Query(None),
+    section: Optional[str] = Query(None),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None)
+):
+    try:
+        interval_minutes = parse_interval(interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
+    buckets = await db_reader.run(
+        histogram,
+        interval_minutes,
+        group_by=group_by,
+        level=level,
+        section=section,
+        tf_resource_type=tf_resource_type,
+        start_date=start_date,
+        end_date=end_date
+    )
     return {
-        "total_logs": total_logs,
-        "unread_logs": unread_logs,
-        "level_stats": dict(level_stats),
-        "section_stats": dict(section_stats)
+        "interval_seconds": interval_minutes * 60,
+        "group_by": group_by,
+        "buckets": buckets
     }
 
-@app.get("/api/logs/{log_id}", response_model=LogResponse)
-async def get_log(log_id: int, db: Session = Depends(get_db)):
+def load_log_detail(db: Session, log_id: int) -> Optional[dict]:
     log = db.query(TerraformLog).filter(TerraformLog.id == log_id).first()
+    if not log:
+        return None
+    return with_payload(LogResponse.model_validate(log).model_dump(), load_payloads(db, [log.id]))
+
+@app.get("/api/logs/{log_id}", response_model=LogDetailResponse)
+async def get_log(log_id: int):
+    log = await db_reader.run(load_log_detail, log_id)
     if not log:
         raise HTTPException(status_code=404, detail="Log not found")
     return log
 
-@app.patch("/api/logs/{log_id}/read")
-async def mark_log_as_read(log_id: int, db: Session = Depends(get_db)):
+def mark_read(db: Session, log_id: int) -> bool:
+    """Отмечает строку прочитанной; False - строки нет"""
     log = db.query(TerraformLog).filter(TerraformLog.id == log_id).first()
     if not log:
-        raise HTTPException(status_code=404, detail="Log not found")
+        return False
     
-    log.is_read = True
-    db.commit()
+    # Условный UPDATE: при гонке двух запросов счетчик уменьшит только один
+    updated = db.query(TerraformLog).filter(
+        TerraformLog.id == log_id,
+        TerraformLog.is_read == False
+    ).update({'is_read': True}, synchronize_session=False)
+    if updated:
+        count_read_rows(db, [{
+            'level': log.level,
+            'section': log.section,
+            'tf_resource_type': log.tf_resource_type,
+        }])
+        db.commit()
+        response_cache.invalidate()
+    return True
+
+@app.patch("/api/logs/{log_id}/read")
+async def mark_log_as_read(log_id: int):
+    if not await db_writer.run(mark_read, log_id):
+        raise HTTPException(status_code=404, detail="Log not found")
     return {"message": "Log marked as read"}
 
+def mark_logs_read(request: MarkReadRequest, through: Optional[Tuple[Optional[datetime], int]]) -> int:
+    conditions = log_filters(
+        run_id=request.run_id,
+        level=request.level,
+        tf_resource_type=request.tf_resource_type,
+        section=request.section,
+        tf_req_id=request.tf_req_id,
+        start_date=request.start_date,
+        end_date=request.end_date
+    )
+    if through is not None:
+        conditions.append(through_key(*through))
+    
+    db = SessionLocal()
+    try:
+        if request.ids is not None:
+            return mark_ids_read(db, request.ids, conditions, settings.read_chunk_size)
+        return mark_matching_read(db, conditions, settings.read_chunk_size)
+    finally:
+        db.close()
+        response_cache.invalidate()
+
+@app.post("/api/logs/read")
+async def mark_logs_as_read(request: MarkReadRequest):
+    """Отмечает прочитанными строки по списку id, по фильтрам /api/logs
+    или весь список до курсора; возвращает число отмеченных строк"""
+    try:
+        through = decode_time_cursor(request.through_cursor)
+    except InvalidCursor as e:
+        raise invalid_cursor_error(e)
+    
+    criteria = request.model_dump(exclude={'all', 'through_cursor'}, exclude_none=True)
+    if not criteria and through is None and not request.all:
+        raise HTTPException(status_code=400, detail="Specify ids, filters or through_cursor, or set all to true")
+    
+    # Пачки идут в своих транзакциях, как удаление запуска, поэтому большая
+    # отметка не занимает поток записи целиком
+    updated = await run_in_threadpool(mark_logs_read, request, through)
+    return {"message": "Logs marked as read", "updated": updated}
+
 @app.get("/api/search")
 async def search_logs(
     q: str = Query(..., description="Search query"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    order: str = Query("rank", pattern="^(rank|time)$"),
+    exact_total: bool = Query(False, description="Count all matches instead of an estimate")
 ):
+    if not search_engine.fts_available:
+        return await db_reader.run(fallback_search_logs, q, skip, limit)
+    
+    try:
+        after = decode_time_cursor(cursor) if order == "time" else decode_rank_cursor(cursor)
+    except InvalidCursor as e:
+        raise invalid_cursor_error(e)
+    
+    return await db_reader.run(search_page, q, skip, limit, order, after, exact_total)
+
+def search_page(db: Session, q: str, skip: int, limit: int, order: str, after, exact_total: bool) -> dict:
+    try:
+        result = search_engine.search_ids(
+            q,
+            skip=skip,
+            limit=limit + 1,
+            count_limit=None if exact_total else settings.search_count_limit,
+            order=order,
+            after=after
+        )
+    except OperationalError as e:
+        logger.warning("FTS search failed: %s. Using fallback.", e)
+        return fallback_search_logs(db, q, skip, limit)
+    
+    hits = result["hits"]
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        last = hits[-1]
+        if order == "time":
+            next_cursor = encode_cursor("time", last["timestamp"], last["id"])
+        else:
+            next_cursor = encode_cursor("rank", last["score"], last["id"])
+    
+    logs_by_id = {
+        log.id: log
+        for log in db.query(TerraformLog).filter(TerraformLog.id.in_([hit["id"] for hit in hits])).all()
+    } if hits else {}
+    
+    logs = []
+    for hit in hits:
+        log = logs_by_id.get(hit["id"])
+        if log is None:
+            continue
+        item = LogResponse.model_validate(log).model_dump()
+        item["score"] = hit["score"]
+        item["snippet"] = hit["snippet"]
+        logs.append(item)
+    
+    return {
+        "logs": logs,
+        "total": result["total"],
+        "total_exact": result["total_exact"],
+        "next_cursor": next_cursor,
+        "query": q,
+        "page": skip // limit + 1,
+        "page_size": limit
+    }
+
+def fallback_search_logs(db: Session, q: str, skip: int, limit: int) -> dict:
     search_query = f"%{q}%"
     
-    query = db.query(TerraformLog).filter(
-        TerraformLog.message.ilike(search_query) |
-        TerraformLog.raw_data.ilike(search_query)
-    )
+    query = db.query(TerraformLog).filter(TerraformLog.message.ilike(search_query))
     
     total = query.count()
     logs = query.order_by(TerraformLog.timestamp.desc()).offset(skip).limit(limit).all()
@@ -321,56 +499,467 @@ async def search_logs(
     return {
         "logs": logs,
         "total": total,
+        "total_exact": True,
+        "next_cursor": None,
         "query": q,
         "page": skip // limit + 1,
         "page_size": limit
     }
 
+@app.get("/api/export")
+async def export_logs(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    compression: str = Query("gzip", pattern="^(gzip|none)$", description="Ignored for parquet, which is compressed internally"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields; all fields including raw_data and json_blocks by default"),
+    run_id: Optional[int] = Query(None),
+    level: Optional[str] = Query(None),
+    tf_resource_type: Optional[str] = Query(None),
+    section: Optional[str] = Query(None),
+    tf_req_id: Optional[str] = Query(None),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    unread_only: bool = Query(False)
+):
+    """Все строки под фильтрами /api/logs одним потоком, от новых к старым"""
+    try:
+        columns = parse_log_fields(fields, EXPORT_FIELDS)
+        chunks = export_stream(ReadSessionLocal, format, columns, {
+            'run_id': run_id,
+            'level': level,
+            'tf_resource_type': tf_resource_type,
+            'section': section,
+            'tf_req_id': tf_req_id,
+            'start_date': start_date,
+            'end_date': end_date,
+            'unread_only': unread_only,
+        }, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    compressed = compression == "gzip" and format != "parquet"
+    filename = export_filename(format, compressed)
+    # Каждая пачка читается и кодируется через db_reader, как и другие запросы
+    # чтения: выгрузки не занимают пул чтения сверх его размера
+    return StreamingResponse(
+        db_reader.iterate(chunks),
+        media_type="application/gzip" if compressed else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/stream")
+async def stream_logs(
+    request: Request,
+    level: Optional[str] = Query(None),
+    section: Optional[str] = Query(None),
+    tf_resource_type: Optional[str] = Query(None),
+    tf_req_id: Optional[str] = Query(None)
+):
+    try:
+        subscription = log_broker.subscribe({
+            'level': level,
+            'section': section,
+            'tf_resource_type': tf_resource_type,
+            'tf_req_id': tf_req_id,
+        })
+    except TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    async def events():
+        try:
+            async for event in sse_events(subscription, request.is_disconnected):
+                yield event
+        finally:
+            log_broker.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/chains", response_model=List[ChainResponse])
+async def list_request_chains(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    sort: str = Query("duration", pattern="^(duration|time|count)$"),
+    tf_rpc: Optional[str] = Query(None),
+    tf_resource_type: Optional[str] = Query(None),
+    worst_level: Optional[str] = Query(None),
+    min_duration_ms: Optional[float] = Query(None, ge=0),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None)
+):
+    # Читается только request_chains: например, 20 самых долгих ApplyResourceChange
+    # за время apply - ?tf_rpc=ApplyResourceChange&start_date=...&end_date=...&limit=20
+    return await db_reader.run(
+        select_chains,
+        skip,
+        limit,
+        sort,
+        tf_rpc=tf_rpc,
+        tf_resource_type=tf_resource_type,
+        worst_level=worst_level,
+        min_duration_ms=min_duration_ms,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+def select_chains(db: Session, skip: int, limit: int, sort: str, **filters) -> List[RequestChain]:
+    return db.query(RequestChain).filter(*chain_filters(**filters)).order_by(*CHAIN_ORDERS[sort]).offset(skip).limit(limit).all()
+
 @app.get("/api/chains/{tf_req_id}")
-async def get_request_chain(tf_req_id: str, db: Session = Depends(get_db)):
+async def get_request_chain(
+    tf_req_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000)
+):
+    chain = await db_reader.run(load_request_chain, tf_req_id, skip, limit)
+    if chain is None:
+        raise HTTPException(status_code=404, detail="Request chain not found")
+    return chain
+
+def load_request_chain(db: Session, tf_req_id: str, skip: int, limit: int) -> Optional[dict]:
+    chain = db.get(RequestChain, tf_req_id)
+    if chain is None:
+        return None
+    
+    # raw_data и json_blocks не читаются: клиент запрашивает их через /api/logs/{id}
     logs = db.query(TerraformLog).filter(
         TerraformLog.tf_req_id == tf_req_id
-    ).order_by(TerraformLog.timestamp.asc()).all()
-    
-    if not logs:
-        raise HTTPException(status_code=404, detail="Request chain not found")
+    ).order_by(TerraformLog.timestamp.asc(), TerraformLog.id.asc()).offset(skip).limit(limit).all()
     
     return {
         "tf_req_id": tf_req_id,
-        "logs": logs,
-        "total_logs": len(logs)
+        "summary": ChainResponse.model_validate(chain).model_dump(),
+        "logs": [LogResponse.model_validate(log).model_dump() for log in logs],
+        "total_logs": chain.log_count,
+        "skip": skip,
+        "limit": limit
+    }
+
+async def spool_upload_file(file: UploadFile, spool: UploadSpool):
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await run_in_threadpool(spool.write, chunk)
+        await run_in_threadpool(spool.finish)
+    except Exception as e:
+        spool.fail(e)
+        spool.remove()
+        raise
+
+def upload_response(spool: UploadSpool, job_id: str, known: Optional[dict] = None, run_id: Optional[int] = None) -> dict:
+    """Число новых и повторных строк известно сразу только для уже загруженного
+    файла; для нового файла они появляются в /api/jobs/{job_id} по ходу загрузки"""
+    response = {
+        "message": "File uploaded successfully",
+        "job_id": job_id,
+        "run_id": run_id,
+        "filename": spool.filename,
+        "size": spool.bytes_written,
+        "received_bytes": spool.bytes_received,
+        "compression": spool.compression,
+        "sha256": spool.sha256,
+        "duplicate_file": known is not None,
+        "lines_new": None,
+        "lines_duplicate": None
     }
+    if known is not None:
+        response.update({
+            "message": "File was already ingested, skipped",
+            "lines_new": 0,
+            "lines_duplicate": (known["lines_new"] or 0) + (known["lines_duplicate"] or 0),
+            "ingested_at": known["created_at"]
+        })
+    return response
+
+def queue_full_error(e: JobQueueFull) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+def open_upload_run(run_id: Optional[int], name: Optional[str], workspace: str, source: str) -> int:
+    """Запуск, в который пойдут строки загрузки: указанный или новый"""
+    db = SessionLocal()
+    try:
+        if run_id is not None:
+            if open_run(db, run_id) is None:
+                raise HTTPException(status_code=404, detail="Run not found or is being deleted")
+            return run_id
+        run = create_run(db, name=name, workspace=workspace, source=source)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+def discard_upload_run(run_id: int) -> None:
+    """Убирает запуск, созданный для загрузки, которую не удалось поставить в очередь"""
+    db = SessionLocal()
+    try:
+        purge_run(db, run_id)
+    finally:
+        db.close()
 
 @app.post("/api/upload-logs")
 async def upload_logs_file(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    source: str = Query('', description="Source of the log lines, part of their fingerprints"),
+    run_id: Optional[int] = Query(None, description="Append to an existing run instead of starting a new one"),
+    run_name: Optional[str] = Query(None, description="Name of the new run, the file name by default"),
+    workspace: str = Query('', description="Workspace of the new run")
 ):
     try:
-        if not file.filename or not file.filename.endswith(('.json', '.log', '.txt')):
+        file_extension = split_upload_filename(file.filename)
+        if not file_extension:
             raise HTTPException(status_code=400, detail="Only JSON, LOG, and TXT files are allowed")
         
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = f"./data/uploads/{unique_filename}"
+        if job_manager.is_full():
+            raise queue_full_error(JobQueueFull("Ingest queue is full"))
         
-        content = await file.read()
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
+        spool = UploadSpool(file_extension, max_bytes=settings.upload_max_mb * 1024 * 1024)
+        await spool_upload_file(file, spool)
+        
+        known = await db_reader.call(job_manager.known_file, spool.sha256, source)
+        if known is not None:
+            spool.remove()
+            return upload_response(spool, known["job_id"], known)
+        
+        try:
+            upload_run_id = await db_writer.call(
+                open_upload_run, run_id, run_name or file.filename, workspace, source
+            )
+        except HTTPException:
+            spool.remove()
+            raise
         
-        background_tasks.add_task(process_log_file, file_path, db)
+        try:
+            job_id = await db_writer.call(
+                job_manager.submit,
+                lambda: iter_file_chunks(spool.path),
+                file.filename,
+                spool.sha256,
+                spool.bytes_written,
+                spool.remove,
+                source,
+                upload_run_id,
+                spool_path=spool.path,
+                discard_empty_run=run_id is None
+            )
+        except JobQueueFull as e:
+            spool.remove()
+            if run_id is None:
+                await db_writer.call(discard_upload_run, upload_run_id)
+            raise queue_full_error(e)
         
-        return {
-            "message": "File uploaded successfully", 
-            "filename": unique_filename,
-            "size": len(content)
-        }
+        return upload_response(spool, job_id, run_id=upload_run_id)
         
     except HTTPException:
         raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+@app.put("/api/upload-logs/stream")
+async def upload_logs_stream(
+    request: Request,
+    filename: str = Query(..., description="Original file name, e.g. terraform.log.gz"),
+    source: str = Query('', description="Source of the log lines, part of their fingerprints"),
+    run_id: Optional[int] = Query(None, description="Append to an existing run instead of starting a new one"),
+    run_name: Optional[str] = Query(None, description="Name of the new run, the file name by default"),
+    workspace: str = Query('', description="Workspace of the new run")
+):
+    """Загрузка сырого тела запроса: разбор начинается, пока файл еще передается.
+
+    sha256 файла известен только в конце передачи, поэтому уже загруженный
+    файл не пропускается целиком, но его строки отсекаются по отпечаткам.
+    Если передача оборвалась, задача завершается ошибкой, а уже записанные
+    строки остаются (partial в /api/jobs/{job_id}); повторная загрузка
+    файла добавит остальные.
+    """
+    file_extension = split_upload_filename(filename)
+    if not file_extension:
+        raise HTTPException(status_code=400, detail="Only JSON, LOG, and TXT files are allowed")
+    
+    if job_manager.is_full():
+        raise queue_full_error(JobQueueFull("Ingest queue is full"))
+    
+    upload_run_id = await db_writer.call(open_upload_run, run_id, run_name or filename, workspace, source)
+    
+    spool = UploadSpool(file_extension, max_bytes=settings.upload_max_mb * 1024 * 1024)
+    try:
+        job_id = await db_writer.call(
+            job_manager.submit,
+            spool.follow_chunks,
+            filename,
+            None,
+            None,
+            spool.remove,
+            source,
+            upload_run_id,
+            spool_path=spool.path,
+            discard_empty_run=run_id is None,
+            on_cancel=spool.cancel
+        )
+    except JobQueueFull as e:
+        spool.fail(e)
+        spool.remove()
+        if run_id is None:
+            await db_writer.call(discard_upload_run, upload_run_id)
+        raise queue_full_error(e)
+    
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(spool.write, chunk)
+        await run_in_threadpool(spool.finish)
+    except UploadTooLarge as e:
+        spool.fail(e)
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        spool.fail(e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClientDisconnect:
+        spool.fail(UploadError(f"client disconnected after {spool.bytes_received} bytes"))
+        raise HTTPException(status_code=400, detail="Client disconnected")
     except Exception as e:
+        spool.fail(e)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        # Отмена обработчика (например, остановка сервера) - не Exception; без
+        # этого задача ждала бы продолжения файла вечно
+        if not spool.finished:
+            spool.fail(UploadError("upload request was cancelled"))
+    
+    await db_writer.call(job_manager.set_bytes_total, job_id, spool.bytes_written, spool.sha256)
+    
+    return upload_response(spool, job_id, run_id=upload_run_id)
+
+@app.get("/api/runs")
+async def get_runs(
+    workspace: Optional[str] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    return await db_reader.run(list_runs, workspace, skip, limit)
+
+def load_run(db: Session, run_id: int) -> Optional[dict]:
+    run = db.get(Run, run_id)
+    if not run:
+        return None
+    result = describe_run(run)
+    result["levels"] = run_levels(db, run_id)
+    return result
+
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: int):
+    run = await db_reader.run(load_run, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+def delete_run(run_id: int) -> Optional[int]:
+    """Удаляет запуск, если в него ничего не загружается; None - запуска нет"""
+    db = SessionLocal()
+    try:
+        run = db.get(Run, run_id)
+        if run is None:
+            return None
+        status = run.status
+        # Соединение записи одно, а проверки ниже открывают свои сессии
+        db.commit()
+        # Запуск в статусе deleting остался от прерванного удаления, и оно продолжается
+        if status == 'active':
+            if job_manager.has_active_run(run_id) or file_follower.has_active_run(run_id):
+                raise HTTPException(
+                    status_code=409,
+                    detail="Run is still being ingested; cancel its jobs and stop following its files first"
+                )
+            mark_run_deleting(db, run_id)
+        return purge_run(db, run_id, settings.purge_chunk_size)
+    finally:
+        db.close()
+        response_cache.invalidate()
+
+@app.delete("/api/runs/{run_id}")
+async def delete_run_logs(run_id: int):
+    # Удаление идет частями и может быть долгим: оно не занимает поток записи,
+    # а берет соединение между частями наравне с загрузками
+    deleted = await run_in_threadpool(delete_run, run_id)
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return {"message": "Run deleted", "id": run_id, "deleted_logs": deleted}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await db_reader.call(job_manager.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = await db_reader.call(job_manager.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    return {"message": "Job cancellation requested", "id": job_id}
+
+@app.get("/api/cache")
+async def get_cache_metrics():
+    return response_cache.metrics()
+
+@app.get("/api/maintenance")
+async def get_maintenance():
+    return await db_writer.call(retention_manager.status)
+
+@app.post("/api/maintenance/run")
+async def run_maintenance():
+    # Проход обслуживания долгий, поэтому идет в общем пуле потоков, как удаление запуска
+    report = await run_in_threadpool(retention_manager.run_once)
+    if report is None:
+        raise HTTPException(status_code=409, detail="Maintenance pass is already running")
+    return report
+
+def follow_path_allowed(path: str) -> bool:
+    """Через API можно следить только за файлами внутри TERRAVIEWER_FOLLOW_ROOTS"""
+    path = os.path.realpath(path)
+    for root in filter(None, settings.follow_roots.split(os.pathsep)):
+        root = os.path.realpath(root)
+        if os.path.commonpath([path, root]) == root:
+            return True
+    return False
+
+@app.post("/api/follow")
+async def follow_file(request: FollowRequest):
+    if not follow_path_allowed(request.path):
+        raise HTTPException(
+            status_code=403,
+            detail="Path is outside TERRAVIEWER_FOLLOW_ROOTS; use follow.py to follow arbitrary files"
+        )
+    try:
+        return await db_writer.call(file_follower.follow, request.path)
+    except FollowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/follow")
+async def list_followed_files():
+    return await db_reader.call(file_follower.list)
+
+@app.get("/api/follow/{follow_id}")
+async def get_followed_file(follow_id: int):
+    followed = await db_reader.call(file_follower.get, follow_id)
+    if not followed:
+        raise HTTPException(status_code=404, detail="Followed file not found")
+    return followed
+
+@app.delete("/api/follow/{follow_id}")
+async def unfollow_file(follow_id: int):
+    if not await db_writer.call(file_follower.unfollow, follow_id):
+        raise HTTPException(status_code=404, detail="Followed file not found")
+    return {"message": "Stopped following", "id": follow_id}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,271 @@
+from datetime import datetime
+from typing import Callable, List, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .chains import rebuild_request_chains
+from .counters import rebuild_counters
+from .dedup import backfill_fingerprints
+from .payloads import codec as payload_codec, migrate_inline_payloads
+from .rollups import rebuild_rollups
+
+
+def _add_columns(table: str, columns: List[Tuple[str, str]]) -> Callable[[Connection], None]:
+    """Шаг, добавляющий колонки, которых еще нет (в новой базе их уже создал create_all)"""
+    def step(conn: Connection) -> None:
+        existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+        for name, ddl in columns:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    return step
+
+
+def _backfill_log_counters(conn: Connection) -> None:
+    db = Session(bind=conn)
+    try:
+        rebuild_counters(db)
+    finally:
+        db.close()
+
+
+def _backfill_log_rollups(conn: Connection) -> None:
+    db = Session(bind=conn)
+    try:
+        rebuild_rollups(db)
+    finally:
+        db.close()
+
+
+def _move_log_payloads(conn: Connection) -> None:
+    db = Session(bind=conn)
+    try:
+        migrate_inline_payloads(db)
+    finally:
+        db.close()
+    # Словарь, обученный при переносе, станет активным после commit миграции
+    payload_codec.reset()
+
+
+def _backfill_request_chains(conn: Connection) -> None:
+    db = Session(bind=conn)
+    try:
+        rebuild_request_chains(db)
+    finally:
+        db.close()
+
+
+def _backfill_fingerprints(conn: Connection) -> None:
+    db = Session(bind=conn)
+    try:
+        backfill_fingerprints(db)
+    finally:
+        db.close()
+
+
+# Шаг миграции - SQL-выражение или функция, получающая соединение
+Step = Union[str, Callable[[Connection], None]]
+
+# Миграции применяются по порядку и ровно один раз; каждая в своей транзакции.
+# Новые миграции добавляются только в конец списка.
+MIGRATIONS: List[Tuple[str, List[Step]]] = [
+    ('0001_log_filter_indexes', [
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_timestamp_id ON terraform_logs (timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_level_timestamp ON terraform_logs (level, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_section_timestamp ON terraform_logs (section, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_resource_type_timestamp "
+        "ON terraform_logs (tf_resource_type, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_req_id_timestamp ON terraform_logs (tf_req_id, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_unread_timestamp "
+        "ON terraform_logs (timestamp, id) WHERE is_read = 0",
+        # Одноколоночные индексы - префиксы составных выше, либо дублируют первичный ключ
+        "DROP INDEX IF EXISTS ix_terraform_logs_id",
+        "DROP INDEX IF EXISTS ix_terraform_logs_level",
+        "DROP INDEX IF EXISTS ix_terraform_logs_timestamp",
+        "DROP INDEX IF EXISTS ix_terraform_logs_section",
+        "DROP INDEX IF EXISTS ix_terraform_logs_tf_resource_type",
+        "DROP INDEX IF EXISTS ix_terraform_logs_tf_req_id",
+    ]),
+    ('0002_log_counters', [
+        """
+        CREATE TABLE IF NOT EXISTS log_counters (
+            dimension VARCHAR NOT NULL,
+            value VARCHAR NOT NULL,
+            total INTEGER NOT NULL,
+            unread INTEGER NOT NULL,
+            PRIMARY KEY (dimension, value)
+        )
+        """,
+        _backfill_log_counters,
+    ]),
+    ('0003_log_rollups', [
+        """
+        CREATE TABLE IF NOT EXISTS log_rollups (
+            bucket INTEGER NOT NULL,
+            level VARCHAR NOT NULL,
+            section VARCHAR NOT NULL,
+            resource_type VARCHAR NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (bucket, level, section, resource_type)
+        )
+        """,
+        _backfill_log_rollups,
+    ]),
+    ('0004_log_payloads', [
+        """
+        CREATE TABLE IF NOT EXISTS log_payloads (
+            log_id INTEGER PRIMARY KEY,
+            codec VARCHAR NOT NULL,
+            data BLOB NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS payload_dictionaries (
+            id INTEGER PRIMARY KEY,
+            codec VARCHAR NOT NULL,
+            data BLOB NOT NULL,
+            samples INTEGER,
+            created_at DATETIME
+        )
+        """,
+        _move_log_payloads,
+    ]),
+    ('0005_followed_files', [
+        """
+        CREATE TABLE IF NOT EXISTS followed_files (
+            id INTEGER PRIMARY KEY,
+            path VARCHAR NOT NULL UNIQUE,
+            status VARCHAR,
+            inode VARCHAR,
+            "offset" INTEGER,
+            lines_parsed INTEGER,
+            lines_failed INTEGER,
+            error TEXT,
+            created_at DATETIME,
+            updated_at DATETIME
+        )
+        """,
+    ]),
+    ('0006_log_fingerprints', [
+        _add_columns('terraform_logs', [('fingerprint', 'BLOB')]),
+        _add_columns('jobs', [
+            ('source', "VARCHAR DEFAULT ''"),
+            ('lines_new', 'INTEGER DEFAULT 0'),
+            ('lines_duplicate', 'INTEGER DEFAULT 0'),
+        ]),
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_terraform_logs_fingerprint ON terraform_logs (fingerprint)",
+        """
+        CREATE TABLE IF NOT EXISTS ingested_files (
+            sha256 VARCHAR NOT NULL,
+            source VARCHAR NOT NULL,
+            filename VARCHAR,
+            job_id VARCHAR,
+            lines_total INTEGER,
+            lines_new INTEGER,
+            lines_duplicate INTEGER,
+            created_at DATETIME,
+            PRIMARY KEY (sha256, source)
+        )
+        """,
+        _backfill_fingerprints,
+    ]),
+    ('0007_request_chains', [
+        """
+        CREATE TABLE IF NOT EXISTS request_chains (
+            tf_req_id VARCHAR NOT NULL PRIMARY KEY,
+            first_timestamp DATETIME,
+            last_timestamp DATETIME,
+            duration_ms FLOAT NOT NULL,
+            tf_rpc VARCHAR,
+            tf_resource_type VARCHAR,
+            log_count INTEGER NOT NULL,
+            error_count INTEGER NOT NULL,
+            level_rank INTEGER NOT NULL,
+            worst_level VARCHAR
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_request_chains_duration ON request_chains (duration_ms, tf_req_id)",
+        "CREATE INDEX IF NOT EXISTS ix_request_chains_first_timestamp ON request_chains (first_timestamp, tf_req_id)",
+        "CREATE INDEX IF NOT EXISTS ix_request_chains_log_count ON request_chains (log_count, tf_req_id)",
+        "CREATE INDEX IF NOT EXISTS ix_request_chains_rpc_duration ON request_chains (tf_rpc, duration_ms, tf_req_id)",
+        "CREATE INDEX IF NOT EXISTS ix_request_chains_rpc_first_timestamp "
+        "ON request_chains (tf_rpc, first_timestamp, tf_req_id)",
+        _backfill_request_chains,
+    ]),
+    ('0008_runs', [
+        """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            name VARCHAR,
+            workspace VARCHAR,
+            source VARCHAR,
+            status VARCHAR,
+            log_count INTEGER NOT NULL,
+            first_timestamp DATETIME,
+            last_timestamp DATETIME,
+            created_at DATETIME
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_runs_workspace ON runs (workspace, id)",
+        # Строки, загруженные до появления запусков, остаются с run_id = NULL
+        _add_columns('terraform_logs', [('run_id', 'INTEGER')]),
+        _add_columns('jobs', [('run_id', 'INTEGER')]),
+        _add_columns('followed_files', [('run_id', 'INTEGER')]),
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_run_timestamp ON terraform_logs (run_id, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_run_level_timestamp "
+        "ON terraform_logs (run_id, level, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_run_section_timestamp "
+        "ON terraform_logs (run_id, section, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS ix_terraform_logs_run_resource_type_timestamp "
+        "ON terraform_logs (run_id, tf_resource_type, timestamp, id)",
+    ]),
+    # Длительность цепочек, у которых граница приходилась на конец секунды, была занижена на секунду
+    ('0009_request_chain_durations', [
+        _backfill_request_chains,
+    ]),
+    ('0011_job_spool_paths', [
+        _add_columns('jobs', [('spool_path', 'VARCHAR')]),
+    ]),
+]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR PRIMARY KEY,
+            applied_at DATETIME NOT NULL
+        )
+    """))
+
+
+def applied_migrations(engine: Engine) -> List[str]:
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return [row[0] for row in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def apply_migrations(engine: Engine) -> List[str]:
+    """Применяет недостающие миграции и возвращает список примененных версий"""
+    done = set(applied_migrations(engine))
+    applied = []
+
+    for version, steps in MIGRATIONS:
+        if version in done:
+            continue
+
+        with engine.begin() as conn:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(text(step))
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, applied_at) VALUES (:version, :applied_at)"),
+                {"version": version, "applied_at": datetime.utcnow()}
+            )
+
+        print(f"Applied migration {version}")
+        applied.append(version)
+
+    return applied
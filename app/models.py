@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, JSON, Index, LargeBinary, Float, text
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -7,16 +7,195 @@ Base = declarative_base()
 class TerraformLog(Base):
     __tablename__ = "terraform_logs"
     
-    id = Column(Integer, primary_key=True, index=True)
-    level = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    level = Column(String)
     message = Column(Text)
-    timestamp = Column(DateTime, index=True)
+    timestamp = Column(DateTime)
     module = Column(String, nullable=True)
-    tf_req_id = Column(String, index=True, nullable=True)
-    tf_resource_type = Column(String, index=True, nullable=True)
+    tf_req_id = Column(String, nullable=True)
+    tf_resource_type = Column(String, nullable=True)
     tf_rpc = Column(String, nullable=True)
-    raw_data = Column(Text)
-    section = Column(String, index=True, nullable=True)
-    json_blocks = Column(JSON, nullable=True)
+    section = Column(String, nullable=True)
+    # raw_data и json_blocks хранятся сжатыми в log_payloads (app/payloads.py)
+    has_json = Column(Boolean, default=False)
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Хэш источника и строки в каноническом виде (app/dedup.py); повторная загрузка строки игнорируется
+    fingerprint = Column(LargeBinary, nullable=True)
+    # Запуск terraform, к которому относится строка (app/runs.py); у строк, загруженных до появления запусков, NULL
+    run_id = Column(Integer, nullable=True)
+    
+    # Все списки сортируются по (timestamp DESC, id DESC), поэтому каждый
+    # фильтр /api/logs имеет свой индекс с этим хвостом, а для запросов в
+    # пределах одного запуска - такой же индекс, начинающийся с run_id. Для
+    # существующих баз эти же индексы создаются миграциями в app/migrations.py.
+    __table_args__ = (
+        Index('ix_terraform_logs_timestamp_id', 'timestamp', 'id'),
+        Index('ix_terraform_logs_level_timestamp', 'level', 'timestamp', 'id'),
+        Index('ix_terraform_logs_section_timestamp', 'section', 'timestamp', 'id'),
+        Index('ix_terraform_logs_resource_type_timestamp', 'tf_resource_type', 'timestamp', 'id'),
+        Index('ix_terraform_logs_req_id_timestamp', 'tf_req_id', 'timestamp', 'id'),
+        Index('ix_terraform_logs_unread_timestamp', 'timestamp', 'id', sqlite_where=text('is_read = 0')),
+        Index('ix_terraform_logs_fingerprint', 'fingerprint', unique=True),
+        Index('ix_terraform_logs_run_timestamp', 'run_id', 'timestamp', 'id'),
+        Index('ix_terraform_logs_run_level_timestamp', 'run_id', 'level', 'timestamp', 'id'),
+        Index('ix_terraform_logs_run_section_timestamp', 'run_id', 'section', 'timestamp', 'id'),
+        Index('ix_terraform_logs_run_resource_type_timestamp', 'run_id', 'tf_resource_type', 'timestamp', 'id'),
+    )
+
+
+class LogPayload(Base):
+    """Сжатые raw_data и json_blocks лога; читаются только для детального просмотра"""
+    __tablename__ = "log_payloads"
+    
+    log_id = Column(Integer, primary_key=True)
+    codec = Column(String, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+
+class PayloadDictionary(Base):
+    """Общий словарь сжатия log_payloads; строки ссылаются на него по id в имени кодека"""
+    __tablename__ = "payload_dictionaries"
+    
+    id = Column(Integer, primary_key=True)
+    codec = Column(String, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    samples = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IngestJob(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String, primary_key=True)
+    status = Column(String, index=True, default='queued')
+    filename = Column(String, nullable=True)
+    sha256 = Column(String, nullable=True)
+    source = Column(String, default='')
+    run_id = Column(Integer, nullable=True)
+    bytes_total = Column(Integer, nullable=True)
+    # Файл загрузки в UPLOAD_DIR; после перезапуска сервера удаляется вместе с прерванной задачей
+    spool_path = Column(String, nullable=True)
+    bytes_processed = Column(Integer, default=0)
+    lines_total = Column(Integer, default=0)
+    lines_parsed = Column(Integer, default=0)
+    lines_failed = Column(Integer, default=0)
+    lines_new = Column(Integer, default=0)
+    lines_duplicate = Column(Integer, default=0)
+    stats = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class IngestedFile(Base):
+    """Полностью загруженный файл: по sha256 содержимого и источнику повторная загрузка пропускается целиком"""
+    __tablename__ = "ingested_files"
+    
+    sha256 = Column(String, primary_key=True)
+    source = Column(String, primary_key=True)
+    filename = Column(String, nullable=True)
+    job_id = Column(String, nullable=True)
+    lines_total = Column(Integer, default=0)
+    lines_new = Column(Integer, default=0)
+    lines_duplicate = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Run(Base):
+    """Запуск terraform (одна загрузка или один отслеживаемый файл), к которому относятся строки логов.
+
+    log_count и границы времени поддерживаются при загрузке (app/runs.py),
+    поэтому список запусков не читает terraform_logs. status='deleting' -
+    строки запуска удаляются, новые загрузки в него не принимаются.
+    """
+    __tablename__ = "runs"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=True)
+    workspace = Column(String, default='')
+    source = Column(String, default='')
+    status = Column(String, default='active')
+    log_count = Column(Integer, nullable=False, default=0)
+    first_timestamp = Column(DateTime, nullable=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_runs_workspace', 'workspace', 'id'),
+    )
+
+
+class LogCounter(Base):
+    """Счетчики логов для /api/stats, поддерживаются при загрузке и пометке прочитанным"""
+    __tablename__ = "log_counters"
+    
+    dimension = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    unread = Column(Integer, nullable=False, default=0)
+
+
+class LogRollup(Base):
+    """Количество логов за минуту в разрезе уровня, секции и типа ресурса.
+
+    bucket - номер минуты от начала эпохи (timestamp // 60), отсутствующие
+    значения хранятся как пустая строка, чтобы входить в первичный ключ.
+    """
+    __tablename__ = "log_rollups"
+    
+    bucket = Column(Integer, primary_key=True)
+    level = Column(String, primary_key=True)
+    section = Column(String, primary_key=True)
+    resource_type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class RequestChain(Base):
+    """Сводка цепочки логов одного tf_req_id, поддерживается при загрузке (app/chains.py).
+
+    level_rank - ранг худшего уровня в цепочке (LEVEL_RANKS), worst_level -
+    его имя; duration_ms - время от первой до последней записи.
+    """
+    __tablename__ = "request_chains"
+    
+    tf_req_id = Column(String, primary_key=True)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    duration_ms = Column(Float, nullable=False, default=0.0)
+    tf_rpc = Column(String, nullable=True)
+    tf_resource_type = Column(String, nullable=True)
+    log_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    level_rank = Column(Integer, nullable=False, default=0)
+    worst_level = Column(String, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_request_chains_duration', 'duration_ms', 'tf_req_id'),
+        Index('ix_request_chains_first_timestamp', 'first_timestamp', 'tf_req_id'),
+        Index('ix_request_chains_log_count', 'log_count', 'tf_req_id'),
+        Index('ix_request_chains_rpc_duration', 'tf_rpc', 'duration_ms', 'tf_req_id'),
+        Index('ix_request_chains_rpc_first_timestamp', 'tf_rpc', 'first_timestamp', 'tf_req_id'),
+    )
+
+
+class FollowedFile(Base):
+    """Растущий файл лога, который дочитывается по мере записи (app/follow.py).
+
+    inode и offset - позиция после последней загруженной полной строки; они
+    меняются в той же транзакции, что и загруженные строки.
+    """
+    __tablename__ = "followed_files"
+    
+    id = Column(Integer, primary_key=True)
+    path = Column(String, unique=True, nullable=False)
+    status = Column(String, default='active')
+    run_id = Column(Integer, nullable=True)
+    inode = Column(String, nullable=True)
+    offset = Column(Integer, default=0)
+    lines_parsed = Column(Integer, default=0)
+    lines_failed = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=True)
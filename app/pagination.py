@@ -0,0 +1,51 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(kind: str, *values: Any) -> str:
+    """Непрозрачный курсор: base64 от JSON со списком значений ключа сортировки"""
+    payload = [kind] + [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, kind: str) -> Tuple[Any, ...]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+
+    if not isinstance(payload, list) or not payload or payload[0] != kind:
+        raise InvalidCursor(f"Cursor does not belong to '{kind}' pagination")
+    return tuple(payload[1:])
+
+
+def decode_time_cursor(cursor: Optional[str]) -> Optional[Tuple[Optional[datetime], int]]:
+    """Курсор по (timestamp, id) для выдачи, отсортированной от новых к старым; у строки без времени timestamp - None"""
+    if not cursor:
+        return None
+    values = decode_cursor(cursor, 'time')
+    try:
+        timestamp, log_id = values
+        return (datetime.fromisoformat(timestamp) if timestamp is not None else None), int(log_id)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+
+
+def decode_rank_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """Курсор по (bm25, id) для выдачи поиска, отсортированной по релевантности"""
+    if not cursor:
+        return None
+    values = decode_cursor(cursor, 'rank')
+    try:
+        score, log_id = values
+        return float(score), int(log_id)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
@@ -0,0 +1,348 @@
+import json
+import os
+import sys
+import threading
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, insert, select, text
+from sqlalchemy.orm import Session
+
+from .models import LogPayload, PayloadDictionary
+from .settings import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Колонки разобранной строки, которые хранятся не в terraform_logs, а в log_payloads
+PAYLOAD_COLUMNS = ('raw_data', 'json_blocks')
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+# zlib видит только последние 32 КиБ словаря
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+ZSTD_DICTIONARY_SIZE = 112 * 1024
+# Словарь обучается автоматически на первой пачке не меньше этого размера
+DICTIONARY_MIN_SAMPLES = 1000
+DICTIONARY_SAMPLES = 5000
+# Ключ Session.info со словарем, обученным в еще не завершенной транзакции
+PENDING_DICTIONARY_KEY = 'payload_dictionary'
+
+
+def payload_text(raw_data: Optional[str], json_blocks: Any) -> bytes:
+    """Нагрузка до сжатия: JSON json_blocks, перевод строки, raw_data"""
+    blocks = json.dumps(json_blocks, separators=(',', ':')) if json_blocks else ''
+    return f"{blocks}\n{raw_data or ''}".encode('utf-8')
+
+
+def parse_payload_text(data: bytes) -> Dict[str, Any]:
+    blocks, _, raw_data = data.decode('utf-8').partition('\n')
+    return {
+        'raw_data': raw_data or None,
+        'json_blocks': json.loads(blocks) if blocks else None,
+    }
+
+
+def build_dictionary(kind: str, samples: List[bytes]) -> Optional[bytes]:
+    """Общий словарь по образцам нагрузки.
+
+    Для zlib это просто склейка образцов (более свежие - ближе к концу, где
+    zlib ищет совпадения дешевле), для zstd - обученный zstandard словарь.
+    """
+    if kind == 'zstd':
+        try:
+            return zstandard.train_dictionary(ZSTD_DICTIONARY_SIZE, samples).as_bytes()
+        except zstandard.ZstdError as e:
+            print(f"Warning: failed to train zstd dictionary: {e}")
+            return None
+
+    dictionary = bytearray()
+    for sample in reversed(samples):
+        if len(dictionary) + len(sample) > ZLIB_DICTIONARY_SIZE:
+            break
+        dictionary[:0] = sample
+    return bytes(dictionary) or None
+
+
+class PayloadCodec:
+    """Сжатие нагрузки логов для log_payloads.
+
+    Имя кодека хранится в каждой строке: 'zlib', 'zstd' или 'zlib:<id>' /
+    'zstd:<id>' для сжатия с общим словарем из payload_dictionaries. Короткие
+    строки логов почти не сжимаются по отдельности, а со словарем, обученным
+    на телах запросов провайдера, занимают в несколько раз меньше. Словари
+    хранятся в БД вместе с данными, поэтому старые строки читаются и после
+    обучения нового словаря. 'zstd' требует пакет zstandard; без него
+    используется zlib.
+    """
+
+    def __init__(self, kind: str = 'zlib', use_dictionary: bool = True):
+        if kind == 'zstd' and zstandard is None:
+            print("Warning: zstd payload compression requires the 'zstandard' package, using zlib")
+            kind = 'zlib'
+        if kind not in ('zlib', 'zstd'):
+            print(f"Warning: unknown payload codec {kind!r}, using zlib")
+            kind = 'zlib'
+
+        self.kind = kind
+        self.use_dictionary = use_dictionary
+        self._dictionaries: Dict[int, bytes] = {}
+        self._zlib_compressors: Dict[int, Any] = {}
+        self._active_id: Optional[int] = None
+        self._active_loaded = False
+        self._lock = threading.Lock()
+
+    def compressor(self, dict_id: Optional[int] = None) -> Callable[[bytes], bytes]:
+        """Функция сжатия для одной пачки.
+
+        Подготовка словаря zlib стоит дороже сжатия короткой строки, поэтому
+        подготовленный компрессор кэшируется и для каждой строки копируется.
+        """
+        dictionary = self._dictionaries[dict_id] if dict_id is not None else None
+        if self.kind == 'zstd':
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data).compress
+        if dictionary is None:
+            return lambda data: zlib.compress(data, ZLIB_LEVEL)
+
+        primed = self._zlib_compressors.get(dict_id)
+        if primed is None:
+            primed = self._zlib_compressors[dict_id] = zlib.compressobj(ZLIB_LEVEL, zdict=dictionary)
+
+        def compress(data: bytes) -> bytes:
+            compressor = primed.copy()
+            return compressor.compress(data) + compressor.flush()
+        return compress
+
+    def decompress(self, db: Session, name: str, data: bytes) -> bytes:
+        kind, _, dict_id = name.partition(':')
+        dictionary = self.dictionary(db, int(dict_id)) if dict_id else None
+        if kind == 'zlib':
+            if dictionary:
+                decompressor = zlib.decompressobj(zdict=dictionary)
+                return decompressor.decompress(data) + decompressor.flush()
+            return zlib.decompress(data)
+        if kind == 'zstd' and zstandard is not None:
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+        raise ValueError(f"Payload codec {name!r} requires the 'zstandard' package")
+
+    def dictionary(self, db: Session, dict_id: int) -> bytes:
+        dictionary = self._dictionaries.get(dict_id)
+        if dictionary is None:
+            dictionary = db.execute(
+                select(PayloadDictionary.data).where(PayloadDictionary.id == dict_id)
+            ).scalar_one()
+            self._dictionaries[dict_id] = dictionary
+        return dictionary
+
+    def active_dictionary(self, db: Session) -> Optional[int]:
+        """id последнего словаря для текущего кодека; загружается из БД один раз"""
+        if not self._active_loaded:
+            self._active_id = db.execute(
+                select(PayloadDictionary.id)
+                .where(PayloadDictionary.codec == self.kind)
+                .order_by(PayloadDictionary.id.desc())
+                .limit(1)
+            ).scalar()
+            self._active_loaded = True
+        return self._active_id
+
+    def train(self, db: Session, samples: List[bytes]) -> Optional[int]:
+        """Обучает словарь и сохраняет его в текущей транзакции db.
+
+        До commit словарь использует только эта сессия; активным для всех
+        он становится после commit, а после rollback забывается, чтобы
+        строки не ссылались на несуществующий словарь.
+        """
+        dictionary = build_dictionary(self.kind, samples)
+        if dictionary is None:
+            return None
+        dict_id = db.execute(insert(PayloadDictionary.__table__).values(
+            codec=self.kind,
+            data=dictionary,
+            samples=len(samples),
+            created_at=datetime.utcnow()
+        )).inserted_primary_key[0]
+        self._dictionaries[dict_id] = dictionary
+        # Компрессор мог остаться от словаря с тем же id в другой базе
+        self._zlib_compressors.pop(dict_id, None)
+        db.info[PENDING_DICTIONARY_KEY] = dict_id
+
+        def promote(session: Session) -> None:
+            if session.info.pop(PENDING_DICTIONARY_KEY, None) == dict_id:
+                with self._lock:
+                    self._active_id = dict_id
+                    self._active_loaded = True
+
+        def discard(session: Session) -> None:
+            if session.info.get(PENDING_DICTIONARY_KEY) == dict_id:
+                session.info.pop(PENDING_DICTIONARY_KEY)
+                self._dictionaries.pop(dict_id, None)
+                self._zlib_compressors.pop(dict_id, None)
+
+        event.listen(db, 'after_commit', promote, once=True)
+        event.listen(db, 'after_rollback', discard, once=True)
+        return dict_id
+
+    def encode_many(self, db: Session, payloads: List[bytes]) -> Tuple[str, List[bytes]]:
+        """Сжимает нагрузку пачки; при отсутствии словаря обучает его на этой пачке"""
+        dict_id = None
+        if self.use_dictionary:
+            with self._lock:
+                dict_id = self.active_dictionary(db) or db.info.get(PENDING_DICTIONARY_KEY)
+                if dict_id is None and len(payloads) >= DICTIONARY_MIN_SAMPLES:
+                    step = max(1, len(payloads) // DICTIONARY_SAMPLES)
+                    dict_id = self.train(db, payloads[::step])
+
+        if dict_id is not None:
+            # После перезапуска известен только id активного словаря
+            self.dictionary(db, dict_id)
+        compress = self.compressor(dict_id)
+        name = self.kind if dict_id is None else f"{self.kind}:{dict_id}"
+        return name, [compress(payload) for payload in payloads]
+
+    def reset(self) -> None:
+        """Перечитать активный словарь и сами словари из БД при следующем обращении"""
+        with self._lock:
+            self._active_id = None
+            self._active_loaded = False
+            self._dictionaries.clear()
+            self._zlib_compressors.clear()
+
+
+codec = PayloadCodec(settings.payload_codec, use_dictionary=bool(settings.payload_dictionary))
+
+
+def log_values(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Значения для INSERT в terraform_logs: горячие колонки и признак has_json"""
+    values = {key: value for key, value in row.items() if key not in PAYLOAD_COLUMNS}
+    values['has_json'] = bool(row.get('json_blocks'))
+    return values
+
+
+def write_payloads(db: Session, entries: List[Tuple[int, Optional[str], Any]]) -> None:
+    """Пишет сжатую нагрузку для списка (log_id, raw_data, json_blocks)"""
+    if not entries:
+        return
+    name, blobs = codec.encode_many(db, [payload_text(raw_data, blocks) for _, raw_data, blocks in entries])
+    db.execute(insert(LogPayload.__table__), [
+        {'log_id': log_id, 'codec': name, 'data': blob}
+        for (log_id, _, _), blob in zip(entries, blobs)
+    ])
+
+
+def store_payloads(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Хук LogIngestor: пишет сжатую нагрузку строк пачки, строки уже имеют id"""
+    write_payloads(db, [(row['id'], row.get('raw_data'), row.get('json_blocks')) for row in rows])
+
+
+def delete_payloads(db: Session, log_ids: List[int]) -> None:
+    """Удаляет нагрузку удаляемых логов; словари остаются, на них ссылаются другие строки"""
+    for start in range(0, len(log_ids), 500):
+        db.execute(delete(LogPayload.__table__).where(LogPayload.log_id.in_(log_ids[start:start + 500])))
+
+
+def load_payloads(db: Session, log_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Распакованные raw_data и json_blocks для указанных логов"""
+    log_ids = list(log_ids)
+    payloads = {}
+    # Не больше 500 id в одном IN, чтобы не упереться в лимит параметров SQLite
+    for start in range(0, len(log_ids), 500):
+        rows = db.execute(
+            select(LogPayload.log_id, LogPayload.codec, LogPayload.data)
+            .where(LogPayload.log_id.in_(log_ids[start:start + 500]))
+        ).all()
+        for log_id, name, data in rows:
+            payloads[log_id] = parse_payload_text(codec.decompress(db, name, data))
+    return payloads
+
+
+def with_payload(log: Dict[str, Any], payloads: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    log.update(payloads.get(log['id'], {'raw_data': None, 'json_blocks': None}))
+    return log
+
+
+def migrate_inline_payloads(db: Session, batch_size: int = 5000) -> int:
+    """Переносит raw_data и json_blocks из terraform_logs в log_payloads и удаляет колонки"""
+    columns = {row[1] for row in db.execute(text("PRAGMA table_info(terraform_logs)"))}
+    if 'has_json' not in columns:
+        db.execute(text("ALTER TABLE terraform_logs ADD COLUMN has_json BOOLEAN DEFAULT 0"))
+    if 'raw_data' not in columns:
+        return 0
+
+    db.execute(text(
+        "UPDATE terraform_logs SET has_json = json_blocks IS NOT NULL AND json_blocks NOT IN ('null', '{}')"
+    ))
+
+    moved = 0
+    last_id = 0
+    while True:
+        rows = db.execute(text("""
+            SELECT id, raw_data, json_blocks FROM terraform_logs
+            WHERE id > :last_id ORDER BY id LIMIT :limit
+        """), {"last_id": last_id, "limit": batch_size}).all()
+        if not rows:
+            break
+        write_payloads(db, [
+            (log_id, raw_data, json.loads(blocks) if blocks else None)
+            for log_id, raw_data, blocks in rows
+        ])
+        moved += len(rows)
+        last_id = rows[-1][0]
+
+    db.execute(text("ALTER TABLE terraform_logs DROP COLUMN raw_data"))
+    db.execute(text("ALTER TABLE terraform_logs DROP COLUMN json_blocks"))
+    print(f"Moved {moved} log payloads to log_payloads; run 'python -m app.payloads vacuum' to reclaim space")
+    return moved
+
+
+def train_dictionary(db: Session, samples: int = DICTIONARY_SAMPLES) -> Optional[int]:
+    """Обучает новый словарь на последних логах; новые строки сжимаются уже с ним"""
+    rows = db.execute(
+        select(LogPayload.codec, LogPayload.data).order_by(LogPayload.log_id.desc()).limit(samples)
+    ).all()
+    payloads = [codec.decompress(db, name, data) for name, data in reversed(rows)]
+    if not payloads:
+        return None
+    return codec.train(db, payloads)
+
+
+def main(argv: List[str]) -> int:
+    from .database import SessionLocal, engine
+    from .migrations import apply_migrations
+    from .models import Base
+
+    if argv not in (['train-dictionary'], ['vacuum']):
+        print("Usage: python -m app.payloads train-dictionary|vacuum")
+        return 2
+
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+
+    if argv[0] == 'vacuum':
+        # После переноса нагрузки в log_payloads файл БД уменьшается только после VACUUM
+        before = os.path.getsize(engine.url.database)
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        print(f"Database size: {before} -> {os.path.getsize(engine.url.database)} bytes")
+        return 0
+
+    db = SessionLocal()
+    try:
+        dict_id = train_dictionary(db)
+        db.commit()
+    finally:
+        db.close()
+    if dict_id is None:
+        print("No payloads to train a dictionary on")
+        return 1
+    print(f"Trained {codec.kind} dictionary {dict_id}; it is used for new logs after a server restart")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
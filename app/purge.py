@@ -0,0 +1,78 @@
+from typing import Any, Dict, List
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from .chains import refresh_request_chains
+from .counters import count_deleted_rows
+from .models import IngestedFile, IngestJob, Run, TerraformLog
+from .payloads import delete_payloads
+from .rollups import rollup_deleted_rows
+from .runs import runs_deleted_rows
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Колонки удаляемых строк, по которым поправляются производные таблицы
+PURGE_COLUMNS = (
+    TerraformLog.id,
+    TerraformLog.level,
+    TerraformLog.section,
+    TerraformLog.tf_resource_type,
+    TerraformLog.timestamp,
+    TerraformLog.is_read,
+    TerraformLog.tf_req_id,
+    TerraformLog.run_id,
+)
+
+
+def delete_logs(db: Session, log_ids: List[int]) -> int:
+    """Удаляет логи вместе с нагрузкой в текущей транзакции.
+
+    Производные таблицы (счетчики /api/stats, роллапы, сводки цепочек,
+    запуски) поправляются в той же транзакции, как и при загрузке, а
+    индекс FTS - триггером. Возвращает число удаленных строк.
+    """
+    rows: List[Dict[str, Any]] = []
+    for start in range(0, len(log_ids), 500):
+        chunk = log_ids[start:start + 500]
+        rows.extend(dict(row._mapping) for row in db.execute(select(*PURGE_COLUMNS).where(TerraformLog.id.in_(chunk))))
+    if not rows:
+        return 0
+
+    ids = [row['id'] for row in rows]
+    delete_payloads(db, ids)
+    for start in range(0, len(ids), 500):
+        db.execute(delete(TerraformLog.__table__).where(TerraformLog.id.in_(ids[start:start + 500])))
+
+    count_deleted_rows(db, rows)
+    rollup_deleted_rows(db, rows)
+    refresh_request_chains(db, (row['tf_req_id'] for row in rows))
+    runs_deleted_rows(db, rows)
+    return len(rows)
+
+
+def purge_run(db: Session, run_id: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Удаляет все строки запуска и сам запуск; возвращает число удаленных строк.
+
+    Строки выбираются по индексу (run_id, timestamp, id) и удаляются
+    пачками по chunk_size, каждая в своей короткой транзакции, поэтому
+    стоимость зависит только от размера запуска, а запись в БД блокируется
+    не дольше одной пачки.
+    """
+    deleted = 0
+    while True:
+        ids = db.execute(
+            select(TerraformLog.id).where(TerraformLog.run_id == run_id).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            break
+        deleted += delete_logs(db, ids)
+        db.commit()
+
+    # Файлы запуска забываются, чтобы их можно было загрузить заново
+    db.query(IngestedFile).filter(
+        IngestedFile.job_id.in_(select(IngestJob.id).where(IngestJob.run_id == run_id))
+    ).delete(synchronize_session=False)
+    db.query(Run).filter(Run.id == run_id).delete(synchronize_session=False)
+    db.commit()
+    return deleted
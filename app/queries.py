@@ -0,0 +1,106 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, or_, tuple_
+
+from .models import TerraformLog
+
+# Порядок выдачи всех списков логов; совпадает с хвостом индексов (..., timestamp, id)
+LOGS_ORDER = (TerraformLog.timestamp.desc(), TerraformLog.id.desc())
+
+# Поля строки в списке /api/logs (те же, что у LogResponse); fields= выбирает
+# подмножество, и из БД читаются только эти столбцы
+LOG_LIST_COLUMNS: Dict[str, Any] = {
+    column.key: column
+    for column in (
+        TerraformLog.id,
+        TerraformLog.level,
+        TerraformLog.message,
+        TerraformLog.timestamp,
+        TerraformLog.module,
+        TerraformLog.tf_req_id,
+        TerraformLog.tf_resource_type,
+        TerraformLog.tf_rpc,
+        TerraformLog.section,
+        TerraformLog.run_id,
+        TerraformLog.has_json,
+        TerraformLog.is_read,
+        TerraformLog.created_at,
+    )
+}
+
+
+def parse_log_fields(spec: Optional[str], available: Sequence[str] = tuple(LOG_LIST_COLUMNS)) -> List[str]:
+    """Поля из 'id,level,message'; пусто - все available"""
+    fields = list(dict.fromkeys(name.strip() for name in (spec or '').split(',') if name.strip()))
+    if not fields:
+        return list(available)
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown}; available: {', '.join(available)}")
+    return fields
+
+
+def after_key(timestamp: Optional[datetime], log_id: Optional[int]) -> Any:
+    """Условие "после строки (timestamp, id)" в порядке LOGS_ORDER.
+
+    SQLite ставит строки без времени в конец порядка по убыванию, а
+    сравнение кортежа с NULL не бывает истинным, поэтому после строки со
+    временем это условие их не находит: такие строки читаются отдельно,
+    ключом (None, None) - начало хвоста, - а затем (None, id).
+    """
+    if timestamp is not None:
+        return tuple_(TerraformLog.timestamp, TerraformLog.id) < (timestamp, log_id)
+    if log_id is None:
+        return TerraformLog.timestamp.is_(None)
+    return and_(TerraformLog.timestamp.is_(None), TerraformLog.id < log_id)
+
+
+def through_key(timestamp: Optional[datetime], log_id: int) -> Any:
+    """Условие "до строки (timestamp, id) включительно" в порядке LOGS_ORDER, обратное after_key"""
+    if timestamp is not None:
+        return tuple_(TerraformLog.timestamp, TerraformLog.id) >= (timestamp, log_id)
+    return or_(TerraformLog.timestamp.isnot(None), TerraformLog.id >= log_id)
+
+
+def log_filters(
+    run_id: Optional[int] = None,
+    level: Optional[str] = None,
+    tf_resource_type: Optional[str] = None,
+    section: Optional[str] = None,
+    tf_req_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    unread_only: bool = False,
+    after: Optional[Tuple[Optional[datetime], Optional[int]]] = None,
+) -> List[Any]:
+    """Условия WHERE для фильтров /api/logs; используются и проверкой планов запросов"""
+    filters = []
+    if run_id is not None:
+        filters.append(TerraformLog.run_id == run_id)
+    if level:
+        filters.append(TerraformLog.level == level)
+    if tf_resource_type:
+        filters.append(TerraformLog.tf_resource_type == tf_resource_type)
+    if section:
+        filters.append(TerraformLog.section == section)
+    if tf_req_id:
+        filters.append(TerraformLog.tf_req_id == tf_req_id)
+    if start_date:
+        filters.append(TerraformLog.timestamp >= start_date)
+    if end_date:
+        filters.append(TerraformLog.timestamp <= end_date)
+    if unread_only:
+        filters.append(TerraformLog.is_read == False)
+    if after:
+        filters.append(after_key(*after))
+    return filters
+
+
+def sql_earliest(a, b):
+    """Меньшее из двух значений в SQL; скалярный min() в SQLite дает NULL, если NULL хоть один аргумент"""
+    return func.coalesce(func.min(a, b), a, b)
+
+
+def sql_latest(a, b):
+    return func.coalesce(func.max(a, b), a, b)
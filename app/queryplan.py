@@ -0,0 +1,81 @@
+import itertools
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+
+from .models import TerraformLog
+from .queries import LOGS_ORDER, log_filters
+
+# Значения для каждого фильтра /api/logs; сами значения на план не влияют
+SAMPLE_FILTERS: Dict[str, Any] = {
+    'run_id': 1,
+    'level': 'error',
+    'tf_resource_type': 'aws_instance',
+    'section': 'apply',
+    'tf_req_id': 'req-1',
+    'start_date': datetime(2024, 1, 1),
+    'end_date': datetime(2024, 1, 2),
+    'unread_only': True,
+    'after': (datetime(2024, 1, 1, 12), 1000),
+}
+
+
+def explain(engine: Engine, statement) -> List[str]:
+    sql = statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        return [row[3] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+EQUALITY_FILTERS = ('run_id', 'level', 'tf_resource_type', 'section', 'tf_req_id')
+UNREAD_INDEX = 'ix_terraform_logs_unread_timestamp'
+
+
+def plan_problems(plan: List[str], filters: Dict[str, Any]) -> List[str]:
+    problems = []
+    table_steps = [detail for detail in plan if detail.split(' ')[1:2] == ['terraform_logs']]
+
+    for detail in table_steps:
+        if detail.startswith('SCAN') and 'INDEX' not in detail:
+            problems.append(f"full table scan: {detail}")
+    for detail in plan:
+        if 'TEMP B-TREE FOR ORDER BY' in detail:
+            problems.append(f"sort without index: {detail}")
+
+    # Обход всего индекса по времени с фильтрацией строк - тоже полный скан,
+    # если запрос ограничен по уровню, секции или типу ресурса
+    searched = any(detail.startswith('SEARCH') for detail in table_steps)
+    if any(filters.get(name) for name in EQUALITY_FILTERS) and not searched:
+        problems.append(f"equality filter not served by an index: {'; '.join(table_steps)}")
+    elif filters.get('unread_only') and not searched:
+        if not any(UNREAD_INDEX in detail for detail in table_steps):
+            problems.append(f"unread filter not served by the partial index: {'; '.join(table_steps)}")
+
+    return problems
+
+
+def check_log_query_plans(engine: Engine, limit: int = 100) -> List[Tuple[Dict[str, Any], List[str], List[str]]]:
+    """Проверяет план каждой комбинации фильтров /api/logs.
+
+    Возвращает список (фильтры, план, проблемы) для комбинаций, в которых
+    SQLite сканирует всю таблицу, сортирует результат во временном B-дереве
+    или обходит весь индекс по времени, хотя запрос ограничен равенством.
+    Пустой список означает, что все комбинации обслуживаются индексами.
+    """
+    failures = []
+    names = list(SAMPLE_FILTERS)
+    for size in range(len(names) + 1):
+        for combo in itertools.combinations(names, size):
+            filters = {name: SAMPLE_FILTERS[name] for name in combo}
+            statement = (
+                select(TerraformLog)
+                .where(*log_filters(**filters))
+                .order_by(*LOGS_ORDER)
+                .limit(limit)
+            )
+            plan = explain(engine, statement)
+            problems = plan_problems(plan, filters)
+            if problems:
+                failures.append((filters, plan, problems))
+    return failures
@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .counters import count_read_rows
+from .models import TerraformLog
+from .queries import LOGS_ORDER, after_key
+
+DEFAULT_CHUNK_SIZE = 2000
+# Столбцы, по которым уменьшаются счетчики непрочитанных (app/counters.py)
+COUNTED_COLUMNS = (TerraformLog.level, TerraformLog.section, TerraformLog.tf_resource_type)
+
+
+def _mark_chunk(db: Session, *conditions) -> List[Any]:
+    """Один UPDATE непрочитанных строк под conditions в своей транзакции.
+
+    Счетчики уменьшаются по RETURNING того же UPDATE, поэтому строка,
+    которую одновременно отметил другой запрос, не будет учтена дважды.
+    """
+    rows = db.execute(
+        update(TerraformLog)
+        .where(*conditions, TerraformLog.is_read == False)
+        .values(is_read=True)
+        .returning(*COUNTED_COLUMNS, TerraformLog.timestamp, TerraformLog.id)
+    ).all()
+    count_read_rows(db, [row._asdict() for row in rows])
+    db.commit()
+    return rows
+
+
+def mark_ids_read(db: Session, ids: Iterable[int], conditions: List[Any], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Отмечает прочитанными строки из ids, подходящие под conditions; возвращает их число"""
+    ids = sorted(set(ids))
+    updated = 0
+    for start in range(0, len(ids), chunk_size):
+        updated += len(_mark_chunk(db, TerraformLog.id.in_(ids[start:start + chunk_size]), *conditions))
+    return updated
+
+
+def mark_matching_read(db: Session, conditions: List[Any], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Отмечает прочитанными все строки под conditions пачками по chunk_size.
+
+    Каждая пачка - один UPDATE ... WHERE id IN (SELECT ... LIMIT). Пачки
+    идут в порядке списка (timestamp DESC, id DESC) по индексу фильтра, и
+    следующая начинается после последней строки предыдущей (after_key),
+    поэтому уже отмеченные строки не просматриваются заново.
+    """
+    updated = 0
+    after: Optional[Tuple[Any, Optional[int]]] = None
+    while True:
+        keyset = [after_key(*after)] if after else []
+        chunk = (
+            select(TerraformLog.id)
+            .where(TerraformLog.is_read == False, *conditions, *keyset)
+            .order_by(*LOGS_ORDER)
+            .limit(chunk_size)
+            .scalar_subquery()
+        )
+        rows = _mark_chunk(db, TerraformLog.id.in_(chunk))
+        updated += len(rows)
+        if len(rows) == chunk_size:
+            # Порядок RETURNING не определен; последняя в порядке списка - строка
+            # без времени с меньшим id, а если таких нет - самая ранняя
+            last = min(rows, key=lambda row: (row.timestamp is not None, row.timestamp or datetime.min, row.id))
+            after = (last.timestamp, last.id)
+        elif after and after[0] is not None:
+            # Строки со временем кончились; строки без времени ключ по времени не находит
+            after = (None, None)
+        else:
+            return updated
@@ -0,0 +1,59 @@
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError наследует json.JSONDecodeError, поэтому ошибки
+# разбора ловятся одинаково с ускорителем и без него
+JSONDecodeError = json.JSONDecodeError
+
+# Поля terraform-лога с телами HTTP-запросов, из которых извлекаются json_blocks
+JSON_BODY_FIELDS = ('tf_http_req_body', 'tf_http_res_body')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """JSON из байтов или строки: orjson, если установлен, иначе stdlib json"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    """JSON-байты: orjson, если установлен, иначе stdlib json; datetime - в ISO 8601"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, default=lambda v: v.isoformat()).encode('utf-8')
+
+
+class LogRecord:
+    """Поля строки terraform-лога, которые нужны парсеру.
+
+    Разобранный словарь строки не хранится: после декодирования остаются
+    только эти поля, а исходная строка целиком сохраняется как raw_data.
+    bodies - пары (поле, значение) для присутствующих JSON_BODY_FIELDS.
+    """
+
+    __slots__ = ('level', 'message', 'timestamp', 'module', 'tf_req_id', 'tf_resource_type', 'tf_rpc', 'bodies')
+
+    def __init__(self, log_data: Dict[str, Any]):
+        get = log_data.get
+        self.level: Optional[str] = get('@level')
+        self.message: str = get('@message', '')
+        self.timestamp: Optional[str] = get('@timestamp')
+        self.module: Optional[str] = get('@module')
+        self.tf_req_id: Optional[str] = get('tf_req_id')
+        self.tf_resource_type: Optional[str] = get('tf_resource_type')
+        self.tf_rpc: Optional[str] = get('tf_rpc')
+        self.bodies: Tuple[Tuple[str, Any], ...] = tuple(
+            (field, log_data[field]) for field in JSON_BODY_FIELDS if field in log_data
+        )
+
+
+def decode_record(line: bytes) -> LogRecord:
+    log_data = loads(line)
+    if not isinstance(log_data, dict):
+        raise ValueError(f"expected a JSON object, got {type(log_data).__name__}")
+    return LogRecord(log_data)
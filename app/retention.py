@@ -0,0 +1,535 @@
+import gzip
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import and_, or_, select, text
+from sqlalchemy.orm import Session
+
+from .chains import DEFAULT_RANK, LEVEL_RANKS
+from .counters import read_stats
+from .dedup import legacy_fingerprint
+from .ingest import INGEST_COLUMNS, new_stats
+from .models import TerraformLog
+from .payloads import load_payloads
+from .purge import delete_logs, purge_run
+from .records import dumps, loads
+from .runs import create_run
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Правило срока хранения для уровней, у которых нет своего
+ANY_LEVEL = '*'
+ARCHIVE_FORMATS = ('ndjson', 'parquet', 'none')
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+# Страниц, возвращаемых системе одним шагом PRAGMA incremental_vacuum
+VACUUM_STEP_PAGES = 256
+# Файл Parquet читается только после записи футера, поэтому строки удаляются
+# после закрытия файла, а файл закрывается каждые PARQUET_FILE_ROWS строк
+PARQUET_FILE_ROWS = 100000
+
+# Колонки строки в архиве; raw_data и json_blocks добавляются из log_payloads
+ARCHIVE_COLUMNS = (
+    TerraformLog.id,
+    TerraformLog.level,
+    TerraformLog.message,
+    TerraformLog.timestamp,
+    TerraformLog.module,
+    TerraformLog.tf_req_id,
+    TerraformLog.tf_resource_type,
+    TerraformLog.tf_rpc,
+    TerraformLog.section,
+    TerraformLog.is_read,
+    TerraformLog.created_at,
+    TerraformLog.run_id,
+    TerraformLog.fingerprint,
+)
+
+
+def parse_retention_days(spec: str) -> Dict[str, int]:
+    """'trace=7,debug=14,*=30' -> {'trace': 7, 'debug': 14, '*': 30}"""
+    policy = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        level, _, days = item.partition('=')
+        try:
+            policy[level.strip()] = int(days)
+        except ValueError:
+            print(f"Warning: retention rule {item!r} is not level=days, ignored")
+            continue
+        if policy[level.strip()] <= 0:
+            print(f"Warning: retention rule {item!r} must keep logs at least one day, ignored")
+            del policy[level.strip()]
+    return policy
+
+
+def archive_record(row, payload: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    record = dict(row._mapping)
+    record['fingerprint'] = record['fingerprint'].hex() if record['fingerprint'] else None
+    record.update(payload or {'raw_data': None, 'json_blocks': None})
+    return record
+
+
+class NdjsonArchive:
+    """Архив в gzip-сжатом NDJSON; каждая пачка сбрасывается на диск до удаления строк"""
+
+    extension = '.ndjson.gz'
+
+    def __init__(self, path: str):
+        self.paths = [path]
+        self.file = gzip.open(path, 'wb')
+
+    def write(self, records: List[Dict[str, Any]]) -> bool:
+        """Возвращает True, если все записанное уже можно удалять из БД"""
+        self.file.write(b''.join(dumps(record) + b'\n' for record in records))
+        # Z_SYNC_FLUSH: записанные строки читаются и из недописанного файла
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return True
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetArchive:
+    """Архив в Parquet (zstd), по файлу на каждые PARQUET_FILE_ROWS строк"""
+
+    extension = '.parquet'
+
+    def __init__(self, path: str):
+        string = pyarrow.string()
+        timestamp = pyarrow.timestamp('us')
+        self.schema = pyarrow.schema([
+            ('id', pyarrow.int64()),
+            ('level', string),
+            ('message', string),
+            ('timestamp', timestamp),
+            ('module', string),
+            ('tf_req_id', string),
+            ('tf_resource_type', string),
+            ('tf_rpc', string),
+            ('section', string),
+            ('is_read', pyarrow.bool_()),
+            ('created_at', timestamp),
+            ('run_id', pyarrow.int64()),
+            ('fingerprint', string),
+            ('raw_data', string),
+            ('json_blocks', string),
+        ])
+        self.base = path[:-len(self.extension)]
+        self.paths: List[str] = []
+        self.writer = None
+        self.rows = 0
+
+    def write(self, records: List[Dict[str, Any]]) -> bool:
+        if self.writer is None:
+            path = self.base + (f'-{len(self.paths)}' if self.paths else '') + self.extension
+            self.paths.append(path)
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+        for record in records:
+            if record['json_blocks'] is not None:
+                record['json_blocks'] = dumps(record['json_blocks']).decode('utf-8')
+        self.writer.write_table(pyarrow.Table.from_pylist(records, schema=self.schema))
+        self.rows += len(records)
+        if self.rows < PARQUET_FILE_ROWS:
+            return False
+        self.close()
+        return True
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.rows = 0
+
+
+ARCHIVE_CLASSES = {'ndjson': NdjsonArchive, 'parquet': ParquetArchive}
+
+
+def read_archive(path: str) -> Iterator[Dict[str, Any]]:
+    """Строки архива любого из форматов ARCHIVE_CLASSES"""
+    if path.endswith(ParquetArchive.extension):
+        if pyarrow is None:
+            raise RuntimeError("Reading Parquet archives requires pyarrow")
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            for record in batch.to_pylist():
+                if record['json_blocks'] is not None:
+                    record['json_blocks'] = loads(record['json_blocks'])
+                yield record
+        return
+
+    with gzip.open(path, 'rb') as file:
+        try:
+            for line in file:
+                if line.strip():
+                    yield loads(line)
+        except EOFError:
+            # Архив прерванного прохода: все сброшенные пачки уже прочитаны
+            print(f"Warning: {path} is truncated, restored the rows written before the cut")
+
+
+def _datetime(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def restored_row(record: Dict[str, Any], run_id: int) -> Dict[str, Any]:
+    """Строка архива в виде, который принимает LogIngestor.write_rows"""
+    row = {column: record.get(column) for column in INGEST_COLUMNS}
+    row['timestamp'] = _datetime(row['timestamp'])
+    row['is_read'] = bool(record.get('is_read'))
+    row['created_at'] = _datetime(record.get('created_at')) or datetime.utcnow()
+    # Исторические копии строк хранились без отпечатка; пересчитанный
+    # отпечаток совпадет с отпечатком оригинала, и копия будет пропущена
+    fingerprint = record.get('fingerprint')
+    row['fingerprint'] = bytes.fromhex(fingerprint) if fingerprint else legacy_fingerprint(row['raw_data'])
+    row['run_id'] = run_id
+    return row
+
+
+def restore_archive(db: Session, ingestor, path: str, run_name: Optional[str] = None) -> Dict[str, Any]:
+    """Загружает архив обратно в отдельный запуск; строки, которые уже есть в БД, пропускаются"""
+    run_id = create_run(db, name=run_name or f"restore: {os.path.basename(path)}", source='archive').id
+    db.commit()
+
+    stats = new_stats()
+    started = time.perf_counter()
+    batch: List[Dict[str, Any]] = []
+    for record in read_archive(path):
+        batch.append(restored_row(record, run_id))
+        if len(batch) >= ingestor.batch_size:
+            ingestor.write_rows(db, batch, stats)
+            batch = []
+    if batch:
+        ingestor.write_rows(db, batch, stats)
+
+    stats['total'] = stats['parsed'] = stats['inserted'] + stats['duplicates']
+    stats['elapsed'] = time.perf_counter() - started
+    if not stats['inserted']:
+        purge_run(db, run_id)
+        run_id = None
+    stats['run_id'] = run_id
+    return stats
+
+
+class RetentionManager:
+    """Плановое обслуживание БД: сроки хранения, предел размера, архив и vacuum.
+
+    Строки старше срока своего уровня и, при превышении max_bytes, самые
+    старые строки самых легких уровней сначала выгружаются в архив, а
+    затем удаляются через purge.delete_logs пачками по chunk_size, каждая
+    в своей короткой транзакции с паузой после нее, чтобы загрузка и
+    чтение не ждали удаления. Освободившиеся страницы возвращаются
+    системе через incremental_vacuum, если он включен в БД.
+
+    delete_hooks получают id строк каждой удаленной пачки после commit.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        policy: Dict[str, int],
+        max_bytes: int = 0,
+        archive_format: str = 'ndjson',
+        archive_dir: str = './data/archive',
+        chunk_size: int = 200,
+        pause: float = 0.05,
+        interval: float = 0,
+    ):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format {archive_format!r}, expected one of {ARCHIVE_FORMATS}")
+        if archive_format == 'parquet' and pyarrow is None:
+            print("Warning: Parquet archives require pyarrow, falling back to ndjson")
+            archive_format = 'ndjson'
+        self.session_factory = session_factory
+        self.policy = policy
+        self.max_bytes = max_bytes
+        self.archive_format = archive_format
+        self.archive_dir = archive_dir
+        self.chunk_size = max(1, chunk_size)
+        self.pause = pause
+        self.interval = interval
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.delete_hooks: List[Callable[[List[int]], None]] = []
+        self._running = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Состояние текущего прохода
+        self._archive = None
+        self._pending: List[int] = []
+        self._report: Dict[str, Any] = {}
+
+    def start(self) -> None:
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='db-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def run_forever(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Maintenance pass failed: {e}")
+
+    def is_running(self) -> bool:
+        return self._running.locked()
+
+    def run_once(self) -> Optional[Dict[str, Any]]:
+        """Один проход обслуживания; None - другой проход еще идет"""
+        if not self._running.acquire(blocking=False):
+            return None
+        db = self.session_factory()
+        started = time.perf_counter()
+        self._report = {
+            'started_at': datetime.utcnow(),
+            'deleted': {},
+            'archived': 0,
+            'archive_files': [],
+            # Транзакция пачки целиком и ее commit: читатели ждут только commit
+            'max_chunk_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'used_bytes_before': used_bytes(db),
+        }
+        try:
+            now = datetime.utcnow()
+            for level, days in sorted(self.policy.items()):
+                cutoff = now - timedelta(days=days)
+                if level == ANY_LEVEL:
+                    own = [name for name in self.policy if name != ANY_LEVEL]
+                    condition = TerraformLog.timestamp < cutoff
+                    if own:
+                        condition = and_(condition, or_(TerraformLog.level.notin_(own), TerraformLog.level.is_(None)))
+                else:
+                    condition = and_(TerraformLog.level == level, TerraformLog.timestamp < cutoff)
+                self._expire(db, f'age:{level}', condition)
+
+            if self.max_bytes:
+                self._enforce_size(db)
+            self._flush_archive(db)
+
+            self._report['freed_pages'] = self._vacuum(db)
+            self._report['used_bytes_after'] = used_bytes(db)
+            self._report['auto_vacuum'] = auto_vacuum_mode(db)
+        finally:
+            if self._archive is not None:
+                self._archive.close()
+                self._archive = None
+            self._pending = []
+            db.close()
+            self._report['elapsed'] = round(time.perf_counter() - started, 3)
+            self.last_report, self._report = self._report, {}
+            self._running.release()
+        print(f"Maintenance pass: deleted {self.last_report['deleted']}, "
+              f"archived {self.last_report['archived']}, freed {self.last_report['freed_pages']} pages")
+        return self.last_report
+
+    def status(self) -> Dict[str, Any]:
+        db = self.session_factory()
+        try:
+            mode = auto_vacuum_mode(db)
+            size = used_bytes(db)
+        finally:
+            db.close()
+        return {
+            'policy_days': self.policy,
+            'max_bytes': self.max_bytes,
+            'used_bytes': size,
+            'auto_vacuum': mode,
+            'archive_format': self.archive_format,
+            'archive_dir': self.archive_dir,
+            'interval': self.interval,
+            'running': self.is_running(),
+            'last_run': self.last_report,
+        }
+
+    def _enforce_size(self, db: Session) -> None:
+        """Удаляет самые старые строки самых легких уровней, пока БД не уложится в max_bytes.
+
+        Число строк оценивается по среднему размеру строки; остаток, если
+        оценка оказалась мала, добирается следующим проходом.
+        """
+        size = used_bytes(db)
+        stats = read_stats(db)
+        if size <= self.max_bytes or not stats['total_logs']:
+            return
+        remaining = math.ceil((size - self.max_bytes) / (size / stats['total_logs']))
+        levels = sorted(stats['level_stats'], key=lambda level: (LEVEL_RANKS.get(level, DEFAULT_RANK), level))
+        for level in levels:
+            if remaining <= 0:
+                break
+            remaining -= self._expire(db, f'size:{level}', TerraformLog.level == level, remaining)
+
+    def _expire(self, db: Session, rule: str, condition, limit: Optional[int] = None) -> int:
+        """Архивирует и удаляет строки под условием от старых к новым; возвращает их число.
+
+        Строки читаются по индексу (level, timestamp, id) с продолжением
+        после последней прочитанной, поэтому строки, ждущие удаления до
+        закрытия файла Parquet, не выбираются повторно.
+        """
+        selected = 0
+        after = None
+        while limit is None or selected < limit:
+            size = self.chunk_size if limit is None else min(self.chunk_size, limit - selected)
+            query = select(*ARCHIVE_COLUMNS).where(condition, TerraformLog.timestamp.isnot(None))
+            if after is not None:
+                query = query.where(or_(
+                    TerraformLog.timestamp > after[0],
+                    and_(TerraformLog.timestamp == after[0], TerraformLog.id > after[1])
+                ))
+            rows = db.execute(query.order_by(TerraformLog.timestamp, TerraformLog.id).limit(size)).all()
+            # Чтение не должно держать снимок БД между пачками
+            db.commit()
+            if not rows:
+                break
+            after = (rows[-1].timestamp, rows[-1].id)
+            selected += len(rows)
+            self._report['deleted'][rule] = self._report['deleted'].get(rule, 0) + len(rows)
+            self._archive_rows(db, rows)
+        return selected
+
+    def _archive_rows(self, db: Session, rows) -> None:
+        ids = [row.id for row in rows]
+        if self.archive_format == 'none':
+            self._delete(db, ids)
+            return
+
+        if self._archive is None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            archive_class = ARCHIVE_CLASSES[self.archive_format]
+            name = f"terraform_logs-{datetime.utcnow():%Y%m%dT%H%M%S_%f}{archive_class.extension}"
+            self._archive = archive_class(os.path.join(self.archive_dir, name))
+        payloads = load_payloads(db, ids)
+        db.commit()
+        durable = self._archive.write([archive_record(row, payloads.get(row.id)) for row in rows])
+        self._report['archived'] += len(rows)
+        self._pending.extend(ids)
+        if durable:
+            ids, self._pending = self._pending, []
+            self._delete(db, ids)
+
+    def _flush_archive(self, db: Session) -> None:
+        if self._archive is None:
+            return
+        self._archive.close()
+        self._report['archive_files'] = self._archive.paths
+        self._archive = None
+        ids, self._pending = self._pending, []
+        self._delete(db, ids)
+
+    def _delete(self, db: Session, ids: List[int]) -> None:
+        for start in range(0, len(ids), self.chunk_size):
+            started = time.perf_counter()
+            chunk = ids[start:start + self.chunk_size]
+            delete_logs(db, chunk)
+            committing = time.perf_counter()
+            db.commit()
+            finished = time.perf_counter()
+            for hook in self.delete_hooks:
+                hook(chunk)
+            report = self._report
+            report['max_chunk_ms'] = round(max(report['max_chunk_ms'], (finished - started) * 1000), 2)
+            report['max_commit_ms'] = round(max(report['max_commit_ms'], (finished - committing) * 1000), 2)
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _vacuum(self, db: Session) -> int:
+        """Возвращает свободные страницы системе шагами по VACUUM_STEP_PAGES"""
+        if auto_vacuum_mode(db) != 'incremental':
+            return 0
+        freed = 0
+        while True:
+            free = db.execute(text("PRAGMA freelist_count")).scalar()
+            if not free:
+                break
+            step = min(free, VACUUM_STEP_PAGES)
+            db.commit()
+            # Каждый шаг - отдельная транзакция записи. execute() в sqlite3 делает
+            # один шаг оператора, то есть освобождает одну страницу, а executescript
+            # выполняет его до конца
+            db.connection().connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({step})")
+            freed += step
+            if self.pause:
+                time.sleep(self.pause)
+        return freed
+
+
+def used_bytes(db: Session) -> int:
+    """Занятое место в файле БД без свободных страниц"""
+    page_size = db.execute(text("PRAGMA page_size")).scalar()
+    pages = db.execute(text("PRAGMA page_count")).scalar()
+    free = db.execute(text("PRAGMA freelist_count")).scalar()
+    return (pages - free) * page_size
+
+
+def auto_vacuum_mode(db: Session) -> str:
+    return AUTO_VACUUM_MODES.get(db.execute(text("PRAGMA auto_vacuum")).scalar(), 'none')
+
+
+def retention_manager_from_settings(session_factory, settings) -> RetentionManager:
+    return RetentionManager(
+        session_factory,
+        parse_retention_days(settings.retention_days),
+        max_bytes=settings.retention_max_mb * 1024 * 1024,
+        archive_format=settings.archive_format,
+        archive_dir=settings.archive_dir,
+        chunk_size=settings.retention_chunk_size,
+        pause=settings.retention_pause_ms / 1000,
+        interval=settings.maintenance_interval,
+    )
+
+
+def main(argv: List[str]) -> int:
+    from .database import SessionLocal, engine
+    from .ingest import LogIngestor
+    from .migrations import apply_migrations
+    from .models import Base
+    from .settings import settings
+
+    if not argv or argv[0] not in ('run', 'vacuum', 'restore') or (argv[0] == 'restore') != (len(argv) in (2, 3)):
+        print("Usage: python -m app.retention run|vacuum|restore ARCHIVE [RUN_NAME]")
+        return 2
+
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+
+    if argv[0] == 'vacuum':
+        # auto_vacuum существующей БД меняется только полным VACUUM; после него
+        # место освобождается шагами incremental_vacuum при обслуживании
+        before = os.path.getsize(engine.url.database)
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+        print(f"Database size: {before} -> {os.path.getsize(engine.url.database)} bytes, auto_vacuum=incremental")
+        return 0
+
+    if argv[0] == 'restore':
+        db = SessionLocal()
+        try:
+            stats = restore_archive(db, LogIngestor(None, batch_size=settings.ingest_batch_size), *argv[1:])
+        finally:
+            db.close()
+        print(f"Restored {stats['inserted']} rows into run {stats['run_id']}, "
+              f"{stats['duplicates']} were already in the database")
+        return 0
+
+    report = retention_manager_from_settings(SessionLocal, settings).run_once()
+    print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,191 @@
+import calendar
+import re
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, delete, func, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from .models import LogRollup
+
+EPOCH = datetime(1970, 1, 1)
+BUCKET_SECONDS = 60
+
+# Колонки, по которым можно группировать гистограмму: параметр API -> колонка роллапа
+GROUP_COLUMNS = {
+    'level': LogRollup.level,
+    'section': LogRollup.section,
+    'tf_resource_type': LogRollup.resource_type,
+}
+
+INTERVAL_UNITS = {'m': 1, 'h': 60, 'd': 24 * 60}
+INTERVAL_PATTERN = re.compile(r'^(\d+)([mhd])$')
+MAX_INTERVAL_MINUTES = 366 * 24 * 60
+
+
+def minute_bucket(timestamp: datetime) -> int:
+    """Номер минуты от начала эпохи по "настенному" времени, как оно хранится в БД"""
+    return calendar.timegm(timestamp.timetuple()) // BUCKET_SECONDS
+
+
+def parse_interval(interval: str) -> int:
+    """'5m', '1h', '1d' -> ширина корзины в минутах"""
+    match = INTERVAL_PATTERN.match(interval or '')
+    if not match:
+        raise ValueError("Interval must look like 1m, 15m, 1h or 1d")
+    minutes = int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+    if not 0 < minutes <= MAX_INTERVAL_MINUTES:
+        raise ValueError(f"Interval must be between 1m and {MAX_INTERVAL_MINUTES // (24 * 60)}d")
+    return minutes
+
+
+def _rollup_counts(rows: Iterable[Dict[str, Any]]) -> Counter:
+    counts: Counter = Counter()
+    for row in rows:
+        timestamp = row.get('timestamp')
+        if timestamp is None:
+            continue
+        counts[(
+            minute_bucket(timestamp),
+            row.get('level') or '',
+            row.get('section') or '',
+            row.get('tf_resource_type') or '',
+        )] += 1
+    return counts
+
+
+def rollup_inserted_rows(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Хук LogIngestor: добавляет строки пачки в поминутные роллапы"""
+    counts = _rollup_counts(rows)
+    if not counts:
+        return
+
+    statement = insert(LogRollup.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['bucket', 'level', 'section', 'resource_type'],
+        set_={'count': LogRollup.count + statement.excluded.count}
+    )
+    db.execute(statement, [
+        {'bucket': bucket, 'level': level, 'section': section, 'resource_type': resource_type, 'count': count}
+        for (bucket, level, section, resource_type), count in sorted(counts.items())
+    ])
+
+
+def rollup_deleted_rows(db: Session, rows: Iterable[Dict[str, Any]]) -> None:
+    """Вычитает удаленные строки из роллапов; опустевшие минуты удаляются"""
+    counts = _rollup_counts(rows)
+    if not counts:
+        return
+
+    table = LogRollup.__table__
+    key = (
+        (table.c.bucket == bindparam('b_bucket'))
+        & (table.c.level == bindparam('b_level'))
+        & (table.c.section == bindparam('b_section'))
+        & (table.c.resource_type == bindparam('b_resource_type'))
+    )
+    params = [
+        {'b_bucket': bucket, 'b_level': level, 'b_section': section, 'b_resource_type': resource_type, 'b_count': count}
+        for (bucket, level, section, resource_type), count in sorted(counts.items())
+    ]
+    db.execute(update(table).where(key).values(count=table.c.count - bindparam('b_count')), params)
+    db.execute(delete(table).where(key, table.c.count <= 0), params)
+
+
+REBUILD_ROLLUPS_SQL = """
+    INSERT INTO log_rollups (bucket, level, section, resource_type, count)
+    SELECT CAST(strftime('%s', timestamp) AS INTEGER) / 60,
+           COALESCE(level, ''), COALESCE(section, ''), COALESCE(tf_resource_type, ''),
+           COUNT(*)
+    FROM terraform_logs
+    WHERE timestamp IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+def rebuild_rollups(db: Session) -> int:
+    """Пересчитывает роллапы по terraform_logs в текущей транзакции"""
+    db.query(LogRollup).delete(synchronize_session=False)
+    db.execute(text(REBUILD_ROLLUPS_SQL))
+    return db.query(LogRollup).count()
+
+
+def histogram(
+    db: Session,
+    interval_minutes: int,
+    group_by: Optional[str] = None,
+    level: Optional[str] = None,
+    section: Optional[str] = None,
+    tf_resource_type: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """Гистограмма количества логов по корзинам шириной interval_minutes.
+
+    Считается только по log_rollups, поэтому время ответа зависит от числа
+    поминутных строк в диапазоне, а не от числа логов. Границы диапазона
+    округляются до минуты. Корзины без логов в ответ не попадают, а
+    отсутствующее значение группы возвращается ключом ''.
+    """
+    start = (LogRollup.bucket // interval_minutes) * interval_minutes
+    columns = [start.label('start'), func.sum(LogRollup.count).label('count')]
+    group_column = GROUP_COLUMNS[group_by] if group_by else None
+    if group_column is not None:
+        columns.append(group_column.label('key'))
+
+    statement = select(*columns)
+    for column, value in ((LogRollup.level, level), (LogRollup.section, section),
+                          (LogRollup.resource_type, tf_resource_type)):
+        if value:
+            statement = statement.where(column == value)
+    if start_date:
+        statement = statement.where(LogRollup.bucket >= minute_bucket(start_date))
+    if end_date:
+        statement = statement.where(LogRollup.bucket <= minute_bucket(end_date))
+
+    statement = statement.group_by(*([start] + ([group_column] if group_column is not None else [])))
+    statement = statement.order_by(start)
+
+    buckets: Dict[int, Dict[str, Any]] = {}
+    for row in db.execute(statement):
+        bucket = buckets.get(row.start)
+        if bucket is None:
+            bucket = buckets[row.start] = {
+                'start': EPOCH + timedelta(minutes=row.start),
+                'count': 0,
+            }
+            if group_column is not None:
+                bucket['groups'] = {}
+        bucket['count'] += row.count
+        if group_column is not None:
+            bucket['groups'][row.key] = row.count
+    return list(buckets.values())
+
+
+def main(argv: List[str]) -> int:
+    from .database import SessionLocal, engine
+    from .migrations import apply_migrations
+    from .models import Base
+
+    if argv != ['rebuild']:
+        print("Usage: python -m app.rollups rebuild")
+        return 2
+
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        count = rebuild_rollups(db)
+        db.commit()
+        print(f"Rebuilt {count} rollup rows")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import DateTime, bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from .models import Run, TerraformLog
+from .queries import sql_earliest, sql_latest
+
+
+def create_run(db: Session, name: Optional[str] = None, workspace: str = '', source: str = '') -> Run:
+    """Новый запуск в текущей транзакции; id известен сразу после flush"""
+    run = Run(name=name, workspace=workspace or '', source=source or '', status='active', log_count=0)
+    db.add(run)
+    db.flush()
+    return run
+
+
+def open_run(db: Session, run_id: int) -> Optional[Run]:
+    """Запуск, в который можно догружать строки, или None"""
+    run = db.get(Run, run_id)
+    if run is None or run.status != 'active':
+        return None
+    return run
+
+
+def _group_by_run(rows: Iterable[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    runs: Dict[int, Dict[str, Any]] = defaultdict(lambda: {'count': 0, 'first': None, 'last': None})
+    for row in rows:
+        run_id = row.get('run_id')
+        if run_id is None:
+            continue
+        run = runs[run_id]
+        run['count'] += 1
+        timestamp = row.get('timestamp')
+        if timestamp is not None:
+            if run['first'] is None or timestamp < run['first']:
+                run['first'] = timestamp
+            if run['last'] is None or timestamp > run['last']:
+                run['last'] = timestamp
+    return runs
+
+
+def update_runs(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Хук LogIngestor: число строк и границы времени запусков пачки"""
+    runs = _group_by_run(rows)
+    if not runs:
+        return
+
+    table = Run.__table__
+    first = bindparam('b_first', type_=DateTime())
+    last = bindparam('b_last', type_=DateTime())
+    db.execute(
+        update(table).where(table.c.id == bindparam('b_run')).values(
+            log_count=table.c.log_count + bindparam('b_count'),
+            first_timestamp=sql_earliest(table.c.first_timestamp, first),
+            last_timestamp=sql_latest(table.c.last_timestamp, last),
+        ),
+        [
+            {'b_run': run_id, 'b_count': run['count'], 'b_first': run['first'], 'b_last': run['last']}
+            for run_id, run in sorted(runs.items())
+        ]
+    )
+
+
+def runs_deleted_rows(db: Session, rows: Iterable[Dict[str, Any]]) -> None:
+    """Вычитает удаленные строки из запусков и заново находит границы времени.
+
+    min/max по индексу (run_id, timestamp, id) стоят O(log n) на запуск.
+    """
+    runs = _group_by_run(rows)
+    if not runs:
+        return
+
+    table = Run.__table__
+    logs = TerraformLog.__table__
+    in_run = logs.c.run_id == table.c.id
+    db.execute(
+        update(table).where(table.c.id == bindparam('b_run')).values(
+            log_count=table.c.log_count - bindparam('b_count'),
+            first_timestamp=select(func.min(logs.c.timestamp)).where(in_run).scalar_subquery(),
+            last_timestamp=select(func.max(logs.c.timestamp)).where(in_run).scalar_subquery(),
+        ),
+        [{'b_run': run_id, 'b_count': run['count']} for run_id, run in sorted(runs.items())]
+    )
+
+
+def run_levels(db: Session, run_id: int) -> Dict[str, int]:
+    """Количество строк запуска по уровням; читается только индекс (run_id, level, ...)"""
+    rows = db.execute(
+        select(TerraformLog.level, func.count())
+        .where(TerraformLog.run_id == run_id)
+        .group_by(TerraformLog.level)
+    )
+    return {level or '': count for level, count in rows}
+
+
+def describe_run(run: Run) -> Dict[str, Any]:
+    duration = None
+    if run.first_timestamp and run.last_timestamp:
+        duration = round((run.last_timestamp - run.first_timestamp).total_seconds(), 3)
+    return {
+        'id': run.id,
+        'name': run.name,
+        'workspace': run.workspace,
+        'source': run.source,
+        'status': run.status,
+        'log_count': run.log_count,
+        'first_timestamp': run.first_timestamp,
+        'last_timestamp': run.last_timestamp,
+        'duration_seconds': duration,
+        'created_at': run.created_at,
+    }
+
+
+def list_runs(
+    db: Session,
+    workspace: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    query = db.query(Run)
+    if workspace is not None:
+        query = query.filter(Run.workspace == workspace)
+    return [describe_run(run) for run in query.order_by(Run.id.desc()).offset(skip).limit(limit).all()]
+
+
+def mark_run_deleting(db: Session, run_id: int) -> bool:
+    updated = db.query(Run).filter(Run.id == run_id, Run.status == 'active').update(
+        {'status': 'deleting'}, synchronize_session=False
+    )
+    db.commit()
+    return bool(updated)
+
@@ -1,45 +1,191 @@
-from sqlalchemy import create_engine, text, func
+from sqlalchemy import text, func, bindparam, DateTime
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 
+FTS_COLUMNS = ('message', 'tf_resource_type', 'tf_rpc', 'module')
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+
+
+def build_match_query(query: str) -> str:
+    """Превращает пользовательский ввод в безопасный запрос FTS5.
+
+    Каждое слово берется в кавычки (операторы FTS5 не интерпретируются),
+    слова объединяются через AND, последнее слово ищется по префиксу.
+    """
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if not terms:
+        return ''
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
 class LogSearch:
-    def __init__(self, database_url: str = "sqlite:///./data/terraform_logs.db"):
-        self.engine = create_engine(database_url)
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+    def __init__(self, engine: Optional[Engine] = None, read_engine: Optional[Engine] = None):
+        """engine создает таблицу FTS и триггеры, запросы идут через read_engine.
+
+        По умолчанию - общие движки app/database.py; если передан только
+        engine, он же используется и для чтения.
+        """
+        if engine is None:
+            from .database import engine, read_engine
+        self.engine = engine
+        self.read_engine = read_engine if read_engine is not None else engine
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.read_engine)
+        self.fts_available = False
         
         self._setup_fts_table()
     
     def _setup_fts_table(self):
-        """Создание виртуальной таблицы FTS5 для полнотекстового поиска"""
+        """Создание внешней (external content) таблицы FTS5 и триггеров синхронизации.
+
+        Индекс читает текст из terraform_logs и обновляется триггерами при
+        вставке, удалении и изменении строк, поэтому полная перестройка
+        выполняется только один раз, когда таблица создается заново.
+        """
+        columns = ', '.join(FTS_COLUMNS)
+        new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+        old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
         try:
-            with self.engine.connect() as conn:
-                conn.execute(text("""
-                    CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts 
-                    USING fts5(id, level, message, tf_resource_type, timestamp)
+            with self.engine.begin() as conn:
+                existing = conn.execute(text(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'logs_fts'"
+                )).scalar()
+                
+                rebuild = existing is None
+                if existing is not None and "content='terraform_logs'" not in existing:
+                    # Старая самостоятельная таблица с копией данных
+                    conn.execute(text("DROP TABLE logs_fts"))
+                    rebuild = True
+                
+                conn.execute(text(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts
+                    USING fts5({columns}, content='terraform_logs', content_rowid='id')
                 """))
                 
-                conn.execute(text("""
-                    INSERT OR IGNORE INTO logs_fts 
-                    SELECT id, level, message, tf_resource_type, timestamp 
-                    FROM terraform_logs
+                conn.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS terraform_logs_fts_insert
+                    AFTER INSERT ON terraform_logs BEGIN
+                        INSERT INTO logs_fts(rowid, {columns}) VALUES (new.id, {new_values});
+                    END
+                """))
+                conn.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS terraform_logs_fts_delete
+                    AFTER DELETE ON terraform_logs BEGIN
+                        INSERT INTO logs_fts(logs_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                    END
+                """))
+                conn.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS terraform_logs_fts_update
+                    AFTER UPDATE OF {columns} ON terraform_logs BEGIN
+                        INSERT INTO logs_fts(logs_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                        INSERT INTO logs_fts(rowid, {columns}) VALUES (new.id, {new_values});
+                    END
                 """))
-                conn.commit()
+                
+                if rebuild:
+                    conn.execute(text("INSERT INTO logs_fts(logs_fts) VALUES ('rebuild')"))
+            self.fts_available = True
         except Exception as e:
             print(f"Warning: FTS5 setup failed: {e}. Using fallback search.")
     
+    def search_ids(
+        self,
+        query: str,
+        skip: int = 0,
+        limit: int = 100,
+        count_limit: Optional[int] = 10000,
+        order: str = 'rank',
+        after: Optional[Tuple[Any, int]] = None
+    ) -> Dict[str, Any]:
+        """Поиск по FTS5 с ранжированием bm25.
+
+        Возвращает id, оценку, время и фрагмент с подсветкой для каждой
+        найденной записи. order='rank' сортирует по релевантности,
+        order='time' - от новых записей к старым; after - ключ последней
+        записи предыдущей страницы ((score, id) или (timestamp, id)).
+        Если count_limit задан, совпадения считаются только до этого
+        предела и total становится нижней оценкой (total_exact = False).
+        """
+        match = build_match_query(query)
+        if not match:
+            return {"hits": [], "total": 0, "total_exact": True}
+        
+        params = {
+            "match": match,
+            "start": SNIPPET_START,
+            "end": SNIPPET_END,
+            "limit": limit,
+            "skip": skip
+        }
+        
+        if order == 'time':
+            # Строки без времени идут в конце выдачи (after_key в app/queries.py);
+            # совпадения сортируются после поиска, так что OR не мешает индексу
+            if after and after[0] is not None:
+                keyset = "AND ((l.timestamp, l.id) < (:after_key, :after_id) OR l.timestamp IS NULL)"
+            elif after:
+                keyset = "AND l.timestamp IS NULL AND l.id < :after_id"
+            else:
+                keyset = ""
+            order_by = "l.timestamp DESC, l.id DESC"
+        else:
+            keyset = "AND (bm25(logs_fts), l.id) > (:after_key, :after_id)" if after else ""
+            order_by = "score, l.id"
+        
+        statement = text(f"""
+            SELECT l.id AS id,
+                   l.timestamp AS timestamp,
+                   bm25(logs_fts) AS score,
+                   snippet(logs_fts, 0, :start, :end, '…', 16) AS snippet
+            FROM logs_fts
+            JOIN terraform_logs l ON l.id = logs_fts.rowid
+            WHERE logs_fts MATCH :match {keyset}
+            ORDER BY {order_by}
+            LIMIT :limit OFFSET :skip
+        """).columns(timestamp=DateTime())
+        
+        if after:
+            params["after_key"], params["after_id"] = after
+            if order == 'time' and after[0] is not None:
+                statement = statement.bindparams(bindparam("after_key", type_=DateTime()))
+            elif order == 'time':
+                del params["after_key"]
+        
+        with self.read_engine.connect() as conn:
+            hits = conn.execute(statement, params).mappings().all()
+            
+            if count_limit is None:
+                total = conn.execute(text(
+                    "SELECT count(*) FROM logs_fts WHERE logs_fts MATCH :match"
+                ), {"match": match}).scalar()
+                total_exact = True
+            else:
+                total = conn.execute(text("""
+                    SELECT count(*) FROM (
+                        SELECT rowid FROM logs_fts WHERE logs_fts MATCH :match LIMIT :cap
+                    )
+                """), {"match": match, "cap": count_limit + 1}).scalar()
+                total_exact = total <= count_limit
+                total = min(total, count_limit)
+        
+        return {"hits": [dict(hit) for hit in hits], "total": total, "total_exact": total_exact}
+    
     def full_text_search(self, query: str, limit: int = 100) -> List[Dict[str, Any]]:
         """Полнотекстовый поиск с использованием FTS5"""
         try:
-            with self.engine.connect() as conn:
+            with self.read_engine.connect() as conn:
                 result = conn.execute(text("""
                     SELECT l.* 
-                    FROM logs_fts f
-                    JOIN terraform_logs l ON f.id = l.id
+                    FROM logs_fts
+                    JOIN terraform_logs l ON logs_fts.rowid = l.id
                     WHERE logs_fts MATCH :query
                     ORDER BY rank
                     LIMIT :limit
-                """), {"query": query, "limit": limit})
+                """), {"query": build_match_query(query), "limit": limit})
                 
                 return [dict(row) for row in result.mappings()]
         except Exception as e:
@@ -47,11 +193,11 @@ class LogSearch:
             return self.fallback_search(query, limit)
     
     def fallback_search(self, query: str, limit: int = 100) -> List[Dict[str, Any]]:
-        with self.engine.connect() as conn:
+        with self.read_engine.connect() as conn:
             search_query = f"%{query}%"
             result = conn.execute(text("""
                 SELECT * FROM terraform_logs 
-                WHERE message LIKE :query OR raw_data LIKE :query
+                WHERE message LIKE :query
                 ORDER BY timestamp DESC 
                 LIMIT :limit
             """), {"query": search_query, "limit": limit})
@@ -67,7 +213,7 @@ class LogSearch:
         end_date: Optional[datetime] = None,
         limit: int = 100
     ) -> List[Dict[str, Any]]:
-        with self.engine.connect() as conn:
+        with self.read_engine.connect() as conn:
             sql = """
                 SELECT * FROM terraform_logs 
                 WHERE 1=1
@@ -75,7 +221,7 @@ class LogSearch:
             params = {}
             
             if query:
-                sql += " AND (message LIKE :query OR raw_data LIKE :query)"
+                sql += " AND message LIKE :query"
                 params["query"] = f"%{query}%"
             
             if level:
@@ -101,7 +247,7 @@ class LogSearch:
             return [dict(row) for row in result.mappings()]
     
     def get_resource_types(self) -> List[str]:
-        with self.engine.connect() as conn:
+        with self.read_engine.connect() as conn:
             result = conn.execute(text("""
                 SELECT DISTINCT tf_resource_type 
                 FROM terraform_logs 
@@ -111,12 +257,10 @@ class LogSearch:
             return [row[0] for row in result if row[0]]
     
     def get_levels(self) -> List[str]:
-        with self.engine.connect() as conn:
+        with self.read_engine.connect() as conn:
             result = conn.execute(text("""
                 SELECT DISTINCT level 
                 FROM terraform_logs 
                 ORDER BY level
             """))
-            return [row[0] for row in result if row[0]]
-
-search_engine = LogSearch()
\ No newline at end of file
+            return [row[0] for row in result if row[0]]
\ No newline at end of file
@@ -0,0 +1,83 @@
+import os
+from dataclasses import dataclass, field
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Warning: {name}={value!r} is not an integer, using {default}")
+        return default
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return default if value is None or value == '' else value
+
+
+@dataclass
+class Settings:
+    """Настройки приложения; каждое поле можно переопределить переменной TERRAVIEWER_*"""
+
+    database_url: str = field(default_factory=lambda: _env_str('TERRAVIEWER_DATABASE_URL', 'sqlite:///./data/terraform_logs.db'))
+    # Соединения SQLite (app/database.py): один писатель и пул соединений только для чтения
+    db_read_pool_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_DB_READ_POOL_SIZE', 4))
+    # Сколько секунд запрос ждет свободное соединение из пула
+    db_pool_timeout: int = field(default_factory=lambda: _env_int('TERRAVIEWER_DB_POOL_TIMEOUT', 30))
+    db_busy_timeout_ms: int = field(default_factory=lambda: _env_int('TERRAVIEWER_DB_BUSY_TIMEOUT_MS', 5000))
+    db_journal_mode: str = field(default_factory=lambda: _env_str('TERRAVIEWER_DB_JOURNAL_MODE', 'wal'))
+    db_synchronous: str = field(default_factory=lambda: _env_str('TERRAVIEWER_DB_SYNCHRONOUS', 'normal'))
+    db_mmap_size_mb: int = field(default_factory=lambda: _env_int('TERRAVIEWER_DB_MMAP_SIZE_MB', 256))
+    # Кэш страниц на каждое соединение
+    db_cache_size_mb: int = field(default_factory=lambda: _env_int('TERRAVIEWER_DB_CACHE_SIZE_MB', 32))
+    ingest_batch_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_INGEST_BATCH_SIZE', 5000))
+    ingest_workers: int = field(default_factory=lambda: _env_int('TERRAVIEWER_INGEST_WORKERS', 1))
+    ingest_shard_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_INGEST_SHARD_SIZE', 8 * 1024 * 1024))
+    job_workers: int = field(default_factory=lambda: _env_int('TERRAVIEWER_JOB_WORKERS', 2))
+    job_queue_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_JOB_QUEUE_SIZE', 8))
+    # Предел размера загрузки после распаковки; больший файл отклоняется с 413, 0 - без предела
+    upload_max_mb: int = field(default_factory=lambda: _env_int('TERRAVIEWER_UPLOAD_MAX_MB', 4096))
+    # Кэш ответов GET (app/cache.py); cache_ttl=0 - без кэша
+    cache_ttl: int = field(default_factory=lambda: _env_int('TERRAVIEWER_CACHE_TTL', 30))
+    cache_max_mb: int = field(default_factory=lambda: _env_int('TERRAVIEWER_CACHE_MAX_MB', 64))
+    search_count_limit: int = field(default_factory=lambda: _env_int('TERRAVIEWER_SEARCH_COUNT_LIMIT', 10000))
+    stream_buffer_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_STREAM_BUFFER_SIZE', 20000))
+    stream_max_clients: int = field(default_factory=lambda: _env_int('TERRAVIEWER_STREAM_MAX_CLIENTS', 200))
+    follow_poll_ms: int = field(default_factory=lambda: _env_int('TERRAVIEWER_FOLLOW_POLL_MS', 1000))
+    follow_read_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_FOLLOW_READ_SIZE', 1024 * 1024))
+    # Каталоги (через os.pathsep), файлы из которых можно ставить на слежение через API
+    follow_roots: str = field(default_factory=lambda: _env_str('TERRAVIEWER_FOLLOW_ROOTS', ''))
+    payload_codec: str = field(default_factory=lambda: _env_str('TERRAVIEWER_PAYLOAD_CODEC', 'zlib'))
+    payload_dictionary: int = field(default_factory=lambda: _env_int('TERRAVIEWER_PAYLOAD_DICTIONARY', 1))
+    # JSON-файл с правилами уровней и секций (app/classifier.py); пусто - правила по умолчанию
+    classifier_rules: str = field(default_factory=lambda: _env_str('TERRAVIEWER_CLASSIFIER_RULES', ''))
+    classifier_cache_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_CLASSIFIER_CACHE_SIZE', 65536))
+    # Тела HTTP больше body_max_bytes или глубже body_max_depth сохраняются сводкой (app/bodies.py);
+    # body_mode=summary - сводкой сохраняются все тела
+    body_max_bytes: int = field(default_factory=lambda: _env_int('TERRAVIEWER_BODY_MAX_BYTES', 1024 * 1024))
+    body_max_depth: int = field(default_factory=lambda: _env_int('TERRAVIEWER_BODY_MAX_DEPTH', 64))
+    body_mode: str = field(default_factory=lambda: _env_str('TERRAVIEWER_BODY_MODE', 'full'))
+    body_summary_keys: int = field(default_factory=lambda: _env_int('TERRAVIEWER_BODY_SUMMARY_KEYS', 100))
+    # Сколько строк удаляется в одной транзакции при удалении запуска (app/purge.py)
+    purge_chunk_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_PURGE_CHUNK_SIZE', 1000))
+    # Сколько строк отмечается прочитанными одним UPDATE (app/reads.py)
+    read_chunk_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_READ_CHUNK_SIZE', 2000))
+    # Обслуживание БД (app/retention.py). Срок хранения в днях по уровням,
+    # например 'trace=7,debug=14,info=30,warn=90,error=365'; '*' - остальные
+    # уровни, уровень без срока хранится бессрочно. Пусто - удаления по возрасту нет.
+    retention_days: str = field(default_factory=lambda: _env_str('TERRAVIEWER_RETENTION_DAYS', ''))
+    # Предел занятого места в БД; при превышении удаляются самые старые строки самых легких уровней
+    retention_max_mb: int = field(default_factory=lambda: _env_int('TERRAVIEWER_RETENTION_MAX_MB', 0))
+    retention_chunk_size: int = field(default_factory=lambda: _env_int('TERRAVIEWER_RETENTION_CHUNK_SIZE', 200))
+    retention_pause_ms: int = field(default_factory=lambda: _env_int('TERRAVIEWER_RETENTION_PAUSE_MS', 50))
+    # Период обслуживания в секундах; 0 - только вручную (POST /api/maintenance/run)
+    maintenance_interval: int = field(default_factory=lambda: _env_int('TERRAVIEWER_MAINTENANCE_INTERVAL', 3600))
+    # Удаленные строки сначала выгружаются в архив: ndjson (.ndjson.gz), parquet (нужен pyarrow) или none
+    archive_format: str = field(default_factory=lambda: _env_str('TERRAVIEWER_ARCHIVE_FORMAT', 'ndjson'))
+    archive_dir: str = field(default_factory=lambda: _env_str('TERRAVIEWER_ARCHIVE_DIR', './data/archive'))
+
+
+settings = Settings()
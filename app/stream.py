@@ -0,0 +1,174 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+# Поля строки, которые уходят подписчикам; совпадают с LogResponse без created_at
+STREAM_FIELDS = (
+    'id',
+    'level',
+    'message',
+    'timestamp',
+    'module',
+    'tf_req_id',
+    'tf_resource_type',
+    'tf_rpc',
+    'section',
+)
+DEFAULT_BUFFER_SIZE = 20000
+DEFAULT_MAX_SUBSCRIBERS = 200
+KEEPALIVE_INTERVAL = 15.0
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def stream_view(row: Dict[str, Any]) -> str:
+    view = {name: row.get(name) for name in STREAM_FIELDS}
+    view['has_json'] = bool(row.get('json_blocks'))
+    view['is_read'] = False
+    return json.dumps(view, default=_json_default)
+
+
+class Subscription:
+    """Очередь одного клиента: ограниченный буфер сериализованных строк.
+
+    Буфер заполняет поток загрузки, а читает цикл событий клиента. Строки
+    в буфере - общие для всех клиентов объекты, поэтому место в буфере стоит
+    один указатель и его размер должен вмещать несколько пачек загрузки. Если
+    клиент не успевает читать, новые строки отбрасываются и считаются в
+    dropped; клиент получает об этом отдельное событие и может перечитать
+    список. Поток загрузки никогда не ждет медленного клиента.
+    """
+
+    def __init__(self, filters: Dict[str, str], loop: asyncio.AbstractEventLoop, buffer_size: int):
+        self.filters = filters
+        self.key = tuple(sorted(filters.items()))
+        self.buffer_size = buffer_size
+        self.buffer: Deque[str] = deque()
+        self.dropped = 0
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._signalled = False
+        self._lock = threading.Lock()
+
+    def matches(self, row: Dict[str, Any]) -> bool:
+        return all(row.get(name) == value for name, value in self.filters.items())
+
+    def push(self, items: List[str]) -> None:
+        with self._lock:
+            room = self.buffer_size - len(self.buffer)
+            self.buffer.extend(items[:room])
+            self.dropped += max(len(items) - max(room, 0), 0)
+            if self._signalled:
+                return
+            self._signalled = True
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # Цикл событий клиента уже закрыт
+            pass
+
+    def drain(self):
+        with self._lock:
+            items = list(self.buffer)
+            self.buffer.clear()
+            dropped, self.dropped = self.dropped, 0
+            self._signalled = False
+            self._ready.clear()
+        return items, dropped
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class LogBroker:
+    """Рассылка только что загруженных строк подписчикам /api/stream.
+
+    publish() вызывается писателем LogIngestor после commit пачки: строки
+    фильтруются один раз на каждый набор фильтров и сериализуются один раз
+    в потоке загрузки, подписчикам достаются готовые JSON-строки. Сотня
+    вкладок с одинаковыми фильтрами стоит одной проверки пачки.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, max_subscribers: int = DEFAULT_MAX_SUBSCRIBERS):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, filters: Dict[str, Optional[str]]) -> Subscription:
+        """Вызывается из цикла событий клиента"""
+        subscription = Subscription(
+            {name: value for name, value in filters.items() if value},
+            asyncio.get_running_loop(),
+            self.buffer_size
+        )
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"Too many stream clients ({self.max_subscribers})")
+            self._subscribers = self._subscribers + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscription]
+
+    def publish(self, rows: List[Dict[str, Any]]) -> None:
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+
+        groups: Dict[tuple, List[Subscription]] = {}
+        for subscription in subscribers:
+            groups.setdefault(subscription.key, []).append(subscription)
+
+        serialized: Dict[int, str] = {}
+        for group in groups.values():
+            items = []
+            for index, row in enumerate(rows):
+                if group[0].matches(row):
+                    item = serialized.get(index)
+                    if item is None:
+                        item = serialized[index] = stream_view(row)
+                    items.append(item)
+            if items:
+                for subscription in group:
+                    subscription.push(items)
+
+
+async def sse_events(
+    subscription: Subscription,
+    is_disconnected: Callable[[], Any],
+    keepalive: float = KEEPALIVE_INTERVAL,
+) -> AsyncIterator[str]:
+    """События text/event-stream: пачка строк одним событием 'logs'"""
+    yield "retry: 3000\n\n"
+    while True:
+        await subscription.wait(keepalive)
+        if await is_disconnected():
+            return
+
+        items, dropped = subscription.drain()
+        if dropped:
+            yield f"event: dropped\ndata: {json.dumps({'count': dropped})}\n\n"
+        if items:
+            yield f"event: logs\ndata: [{','.join(items)}]\n\n"
+        elif not dropped:
+            yield ": keepalive\n\n"
@@ -0,0 +1,245 @@
+import hashlib
+import os
+import threading
+import uuid
+import zlib
+from typing import Callable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+UPLOAD_DIR = "./data/uploads"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Распакованные данные выдаются частями не больше этого размера, поэтому
+# маленький сжатый чанк не разворачивается в памяти целиком до проверки предела
+DECODE_CHUNK_SIZE = 1024 * 1024
+# Блок zstd из 4 байт (RLE) разворачивается до 128 КиБ, поэтому вход подается
+# кусками, из которых не получится больше DECODE_CHUNK_SIZE
+ZSTD_INPUT_SLICE = DECODE_CHUNK_SIZE // (128 * 1024 // 4)
+ALLOWED_EXTENSIONS = ('.json', '.log', '.txt')
+COMPRESSED_EXTENSIONS = ('.gz', '.zst', '.zstd')
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class UploadCancelled(UploadError):
+    pass
+
+
+def split_upload_filename(filename: Optional[str]) -> Optional[str]:
+    """Возвращает расширение лога (.json/.log/.txt) с учетом .gz/.zst или None"""
+    if not filename:
+        return None
+    name = filename
+    for suffix in COMPRESSED_EXTENSIONS:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    extension = os.path.splitext(name)[1]
+    return extension if extension in ALLOWED_EXTENSIONS else None
+
+
+def remove_upload_file(path: str) -> None:
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        print(f" Cleanup failed: {e}")
+
+
+class _GzipDecoder:
+    """Распаковка gzip; emit получает части не больше DECODE_CHUNK_SIZE"""
+
+    def __init__(self, emit: Callable[[bytes], None]):
+        self._emit = emit
+        self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> None:
+        while True:
+            out = self._decoder.decompress(data, DECODE_CHUNK_SIZE)
+            self._emit(out)
+            data = self._decoder.unconsumed_tail
+            # Полный буфер: у zlib может остаться вывод и без входа
+            if data or len(out) == DECODE_CHUNK_SIZE:
+                continue
+            if self._decoder.eof and self._decoder.unused_data:
+                # Следующий член многочастного gzip-архива
+                data = self._decoder.unused_data
+                self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                continue
+            return
+
+    def flush(self) -> None:
+        self._emit(self._decoder.flush())
+
+    @property
+    def eof(self) -> bool:
+        return self._decoder.eof
+
+
+class _ZstdDecoder:
+    """Распаковка zstd, в том числе нескольких кадров подряд; emit получает
+    части не больше DECODE_CHUNK_SIZE"""
+
+    def __init__(self, emit: Callable[[bytes], None]):
+        if zstandard is None:
+            raise UploadError("zstd uploads require the 'zstandard' package")
+        self._emit = emit
+        self._context = zstandard.ZstdDecompressor()
+        self._decoder = self._context.decompressobj()
+
+    def decompress(self, data: bytes) -> None:
+        for start in range(0, len(data), ZSTD_INPUT_SLICE):
+            piece = data[start:start + ZSTD_INPUT_SLICE]
+            while piece:
+                if self._decoder.eof:
+                    # Следующий кадр
+                    self._decoder = self._context.decompressobj()
+                self._emit(self._decoder.decompress(piece))
+                piece = self._decoder.unused_data if self._decoder.eof else b''
+
+    def flush(self) -> None:
+        pass
+
+    @property
+    def eof(self) -> bool:
+        return self._decoder.eof
+
+
+class UploadSpool:
+    """Файл загрузки, который пишется на диск чанками.
+
+    Сжатые (gzip/zstd) загрузки распаковываются на лету, распакованные байты
+    хешируются по мере записи. Если распакованный файл больше max_bytes
+    (0 - без предела), write() бросает UploadTooLarge: небольшой сжатый файл
+    может развернуться в сколь угодно большой. Пока загрузка не завершена, follow_chunks()
+    позволяет читать уже записанную часть файла и ждать продолжения;
+    cancel() прерывает и чтение, и дальнейшую запись.
+    """
+
+    def __init__(self, extension: str, upload_dir: str = UPLOAD_DIR, hash_content: bool = True, max_bytes: int = 0):
+        os.makedirs(upload_dir, exist_ok=True)
+        self.filename = f"{uuid.uuid4()}{extension}"
+        self.path = os.path.join(upload_dir, self.filename)
+        self.bytes_received = 0
+        self.bytes_written = 0
+        self.max_bytes = max_bytes
+        self.compression: Optional[str] = None
+        self.finished = False
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+
+        self._hash = hashlib.sha256() if hash_content else None
+        self._decoder = None
+        self._file = open(self.path, 'wb')
+        self._cond = threading.Condition()
+
+    @property
+    def sha256(self) -> Optional[str]:
+        return self._hash.hexdigest() if self._hash else None
+
+    def write(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        if self.cancelled:
+            raise UploadCancelled("Upload was cancelled")
+        if self.bytes_received == 0:
+            self._decoder = self._detect_decoder(chunk)
+        self.bytes_received += len(chunk)
+
+        if self._decoder is None:
+            self._append(chunk)
+            return
+        try:
+            self._decoder.decompress(chunk)
+        except zlib.error as e:
+            raise UploadError(f"Invalid {self.compression} stream: {e}")
+        except UploadError:
+            raise
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise UploadError(f"Invalid {self.compression} stream: {e}")
+            raise
+
+    def finish(self) -> None:
+        if self._decoder:
+            self._decoder.flush()
+            if not self._decoder.eof:
+                raise UploadError(f"Truncated {self.compression} stream: the upload ended inside the archive")
+        self._file.close()
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def fail(self, error: BaseException) -> None:
+        if not self._file.closed:
+            self._file.close()
+        with self._cond:
+            self.error = error
+            self.finished = True
+            self._cond.notify_all()
+
+    def cancel(self) -> None:
+        with self._cond:
+            self.cancelled = True
+            self._cond.notify_all()
+
+    def follow_chunks(self, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+        """Читает распакованный файл по мере записи, пока загрузка не завершится"""
+        with open(self.path, 'rb') as file:
+            offset = 0
+            while True:
+                with self._cond:
+                    while offset >= self.bytes_written and not self.finished and not self.cancelled:
+                        self._cond.wait()
+                    available = self.bytes_written - offset
+                    finished = self.finished
+                    error = self.error
+
+                if self.cancelled:
+                    raise UploadCancelled("Upload was cancelled")
+                if error is not None:
+                    raise UploadError(f"Upload aborted: {error}")
+
+                if available <= 0 and finished:
+                    return
+
+                chunk = file.read(min(chunk_size, available))
+                offset += len(chunk)
+                yield chunk
+
+    def remove(self) -> None:
+        remove_upload_file(self.path)
+
+    def _append(self, data: bytes) -> None:
+        if not data:
+            return
+        if self.max_bytes and self.bytes_written + len(data) > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes after decompression")
+        if self._hash:
+            self._hash.update(data)
+        self._file.write(data)
+        self._file.flush()
+        with self._cond:
+            self.bytes_written += len(data)
+            self._cond.notify_all()
+
+    def _detect_decoder(self, head: bytes):
+        if head.startswith(GZIP_MAGIC):
+            self.compression = 'gzip'
+            return _GzipDecoder(self._append)
+        if head.startswith(ZSTD_MAGIC):
+            self.compression = 'zstd'
+            return _ZstdDecoder(self._append)
+        return None
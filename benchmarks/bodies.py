@@ -0,0 +1,109 @@
+"""Разбор JSON из тел HTTP: прежнее регулярное выражение против BodyExtractor.
+
+Прежняя реализация - re.search(r'(\\{.*\\}|\\[.*\\])', DOTALL) и json.loads
+найденного. На телах из незакрытых скобок поиск квадратичен по длине;
+BodyExtractor линеен и ограничен по размеру и глубине. На обычных телах
+обе реализации должны давать одно и то же; расхождение - код возврата 1.
+
+    python -m benchmarks.bodies                    # синтетические тела
+    python -m benchmarks.bodies --file terraform.log
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from typing import Any, Callable, List, Optional
+
+from app.bodies import BodyExtractor
+from app.records import JSON_BODY_FIELDS
+
+DEFAULT_BODIES = 5000
+PATHOLOGICAL_SIZES = (5000, 20000)
+ROUNDS = 3
+
+LEGACY_PATTERN = re.compile(r'(\{.*\}|\[.*\])', re.DOTALL)
+
+
+def legacy_extract(value: str) -> Optional[Any]:
+    match = LEGACY_PATTERN.search(value)
+    if match:
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def synthetic_bodies(count: int) -> List[str]:
+    """Тела разного размера, как у ответов облачных API: от пары полей до сотен элементов"""
+    bodies = []
+    for n in range(count):
+        items = [{"id": f"i-{n}-{i}", "state": "running", "tags": {"env": "dev", "n": i}} for i in range(n % 200)]
+        bodies.append(json.dumps({"request_id": f"req-{n}", "items": items, "next": None}))
+    return bodies
+
+
+def file_bodies(path: str) -> List[str]:
+    bodies = []
+    with open(path, 'rb') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                bodies.extend(record[field] for field in JSON_BODY_FIELDS if isinstance(record.get(field), str))
+    return bodies
+
+
+def seconds(extract: Callable[[str], Any], bodies: List[str]) -> float:
+    best = None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for body in bodies:
+            extract(body)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(file_path=None, count: int = DEFAULT_BODIES) -> bool:
+    bodies = file_bodies(file_path) if file_path else synthetic_bodies(count)
+    if not bodies:
+        print("bodies: no HTTP bodies to measure")
+        return False
+
+    extractor = BodyExtractor()
+    # Прежний путь ничего не извлекает из тел, где после JSON есть текст со скобкой,
+    # поэтому сравниваются только тела, которые он разбирал
+    errors = 0
+    for body in bodies:
+        old = legacy_extract(body)
+        if old is not None and old != extractor.extract(body):
+            errors += 1
+
+    legacy = seconds(legacy_extract, bodies)
+    current = seconds(extractor.extract, bodies)
+    print(f"bodies: {len(bodies)}, {sum(map(len, bodies)):,} chars")
+    print(f"regex + json.loads: {len(bodies) / legacy:,.0f} bodies/sec")
+    print(f"BodyExtractor:      {len(bodies) / current:,.0f} bodies/sec ({legacy / current:.2f}x)")
+
+    for size in PATHOLOGICAL_SIZES:
+        body = '{' * size
+        print(f"'{{' * {size}: regex {seconds(legacy_extract, [body]):.3f}s, "
+              f"BodyExtractor {seconds(extractor.extract, [body]):.4f}s")
+    print(f"bodies: {errors} mismatched bodies")
+    return not errors
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--file', help='take HTTP bodies from a real log file (JSON lines)')
+    arg_parser.add_argument('--bodies', type=int, default=DEFAULT_BODIES, help='number of synthetic bodies')
+    args = arg_parser.parse_args()
+    sys.exit(0 if run(args.file, args.bodies) else 1)
+
+
+if __name__ == '__main__':
+    main()
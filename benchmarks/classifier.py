@@ -0,0 +1,129 @@
+"""Скорость определения уровня и секции: прежние проверки против Classifier.
+
+Прежняя реализация - lower() и до 16 проверок подстрок для уровня и три
+регулярных выражения для секции. Classifier сравнивается без кэша и с
+LRU-кэшем по тексту сообщения. Результаты обеих реализаций должны
+совпадать; расхождение - код возврата 1.
+
+    python -m benchmarks.classifier                    # синтетические сообщения
+    python -m benchmarks.classifier --file terraform.log
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from typing import Callable, List, Optional, Tuple
+
+from app.classifier import Classifier
+
+DEFAULT_MESSAGES = 100000
+ROUNDS = 3
+
+LEGACY_LEVELS = {
+    'error': ['error', 'failed', 'exception', 'fatal'],
+    'warn': ['warn', 'warning', 'attention', 'caution'],
+    'debug': ['debug', 'trace'],
+    'info': ['info', 'message', 'starting', 'completed'],
+}
+LEGACY_SECTIONS = (
+    ('plan', re.compile(r'starting Plan operation', re.IGNORECASE)),
+    ('apply', re.compile(r'starting Apply operation', re.IGNORECASE)),
+    ('validation', re.compile(r'running validation operation', re.IGNORECASE)),
+)
+
+TEMPLATES = [
+    "provider.stdio: waiting for stdio data",
+    "provider: plugin process exited: path=.terraform/providers/registry.terraform.io/hashicorp/aws/5.{n}/linux_amd64",
+    "ReferenceTransformer: \"aws_instance.web[{n}]\" references: []",
+    "Sending HTTP Request",
+    "Received HTTP Response",
+    "Value for var.region was not set, using default",
+    "backend/local: starting Plan operation",
+    "backend/local: starting Apply operation",
+    "terraform: running validation operation",
+    "Error: failed to read instance i-{n}: timeout",
+    "CLI command args: []string{{\"plan\", \"-out=tf.plan\"}}",
+    "GRPCProvider: ReadResource for aws_s3_bucket.logs_{n}",
+]
+
+
+def legacy_classify(message: str) -> Tuple[str, Optional[str]]:
+    message_lower = message.lower()
+    level = 'info'
+    for name, patterns in LEGACY_LEVELS.items():
+        if any(pattern in message_lower for pattern in patterns):
+            level = name
+            break
+    for name, pattern in LEGACY_SECTIONS:
+        if pattern.search(message):
+            return level, name
+    return level, None
+
+
+def classifier_classify(classifier: Classifier) -> Callable[[str], Tuple[str, Optional[str]]]:
+    return lambda message: (classifier.level(message), classifier.section(message))
+
+
+def synthetic_messages(count: int) -> List[str]:
+    """Шаблоны повторяются, как в настоящих логах; часть сообщений с переменными id"""
+    return [TEMPLATES[n % len(TEMPLATES)].format(n=n // len(TEMPLATES) % 500) for n in range(count)]
+
+
+def file_messages(path: str) -> List[str]:
+    messages = []
+    with open(path, 'rb') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and isinstance(record.get('@message'), str):
+                messages.append(record['@message'])
+    return messages
+
+
+def messages_per_sec(classify: Callable[[str], Tuple[str, Optional[str]]], messages: List[str]) -> float:
+    best = None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for message in messages:
+            classify(message)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(messages) / best
+
+
+def run(file_path=None, count: int = DEFAULT_MESSAGES) -> bool:
+    messages = file_messages(file_path) if file_path else synthetic_messages(count)
+    if not messages:
+        print("classifier: no messages to measure")
+        return False
+
+    cold = Classifier(cache_size=0)
+    cached = Classifier()
+    errors = sum(1 for message in messages if legacy_classify(message) != classifier_classify(cold)(message))
+
+    legacy = messages_per_sec(legacy_classify, messages)
+    uncached = messages_per_sec(classifier_classify(cold), messages)
+    warm = messages_per_sec(classifier_classify(cached), messages)
+    distinct = len(set(messages))
+
+    print(f"messages: {len(messages)}, distinct: {distinct}")
+    print(f"lower() + substrings + 3 regexes: {legacy:,.0f} messages/sec")
+    print(f"Classifier, no cache:             {uncached:,.0f} messages/sec ({uncached / legacy:.2f}x)")
+    print(f"Classifier, LRU cache:            {warm:,.0f} messages/sec ({warm / legacy:.2f}x)")
+    print(f"classifier: {errors} mismatched messages")
+    return not errors
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--file', help='take messages from a real log file (JSON lines)')
+    arg_parser.add_argument('--messages', type=int, default=DEFAULT_MESSAGES, help='number of synthetic messages')
+    args = arg_parser.parse_args()
+    sys.exit(0 if run(args.file, args.messages) else 1)
+
+
+if __name__ == '__main__':
+    main()
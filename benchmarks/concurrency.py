@@ -0,0 +1,184 @@
+"""Задержка /api/logs, пока параллельно идут поиск и загрузка.
+
+Сервер запускается отдельным процессом (uvicorn) на временной БД, в нее
+загружается синтетический лог. Затем /api/logs запрашивается подряд
+сначала без нагрузки, а потом одновременно с поиском по всей таблице
+(exact_total=true) и загрузкой второго такого же лога. Печатаются p50 и
+p99; код возврата 1, если какой-то запрос завершился ошибкой.
+
+    python -m benchmarks.concurrency
+    python -m benchmarks.concurrency --lines 200000
+"""
+import argparse
+import asyncio
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import aiohttp
+
+from benchmarks.ingest_decode import synthetic_lines
+
+DEFAULT_LINES = 20000
+IDLE_REQUESTS = 200
+SEARCH_QUERY = 'request'
+STARTUP_TIMEOUT = 30.0
+JOB_POLL_INTERVAL = 0.2
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RequestFailed(Exception):
+    pass
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def describe(latencies: List[float]) -> str:
+    return (f"{len(latencies)} requests, p50 {percentile(latencies, 0.5):.1f} ms, "
+            f"p99 {percentile(latencies, 0.99):.1f} ms, max {max(latencies):.1f} ms")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(tmp: str, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO_ROOT,
+        TERRAVIEWER_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'concurrency.db')}",
+        TERRAVIEWER_MAINTENANCE_INTERVAL='0',
+        # Измеряются сами запросы к БД, а не ответы из кэша
+        TERRAVIEWER_CACHE_TTL='0',
+    )
+    # Каталог загрузок относительный, поэтому сервер работает во временном каталоге
+    with open(os.path.join(tmp, 'server.log'), 'wb') as log:
+        return subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning'],
+            cwd=tmp, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+
+async def get_json(session: aiohttp.ClientSession, path: str, **params) -> Dict:
+    async with session.get(path, params=params) as response:
+        if response.status != 200:
+            raise RequestFailed(f"GET {path}: HTTP {response.status} {await response.text()}")
+        return await response.json()
+
+
+async def wait_for_server(session: aiohttp.ClientSession, server: subprocess.Popen) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if server.poll() is not None:
+            raise RequestFailed("server exited during startup")
+        try:
+            await get_json(session, '/')
+            return
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def ingest(session: aiohttp.ClientSession, path: str, source: str) -> Dict:
+    """Загружает файл и ждет завершения задачи"""
+    form = aiohttp.FormData()
+    with open(path, 'rb') as file:
+        form.add_field('file', file, filename=os.path.basename(path))
+        async with session.post('/api/upload-logs', data=form, params={'source': source}) as response:
+            if response.status != 200:
+                raise RequestFailed(f"upload: HTTP {response.status} {await response.text()}")
+            job_id = (await response.json())['job_id']
+
+    while True:
+        job = await get_json(session, f'/api/jobs/{job_id}')
+        if job['status'] == 'completed':
+            return job
+        if job['status'] not in ('queued', 'running'):
+            raise RequestFailed(f"job {job_id} {job['status']}: {job.get('error')}")
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+async def timed_logs(session: aiohttp.ClientSession, latencies: List[float]) -> None:
+    started = time.perf_counter()
+    await get_json(session, '/api/logs', limit=100)
+    latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def search_loop(session: aiohttp.ClientSession, done: asyncio.Event, durations: List[float]) -> None:
+    while not done.is_set():
+        started = time.perf_counter()
+        await get_json(session, '/api/search', q=SEARCH_QUERY, exact_total='true')
+        durations.append((time.perf_counter() - started) * 1000)
+
+
+async def measure(base_url: str, server: subprocess.Popen, log_path: str, lines: int) -> None:
+    async with aiohttp.ClientSession(base_url) as session:
+        await wait_for_server(session, server)
+        await ingest(session, log_path, 'base')
+
+        idle: List[float] = []
+        for _ in range(IDLE_REQUESTS):
+            await timed_logs(session, idle)
+
+        loaded: List[float] = []
+        searches: List[float] = []
+        done = asyncio.Event()
+        searcher = asyncio.create_task(search_loop(session, done, searches))
+        loader = asyncio.create_task(ingest(session, log_path, 'load'))
+        try:
+            # Пока идет загрузка и хотя бы до конца первого поиска
+            while not loader.done() or not searches:
+                await timed_logs(session, loaded)
+            job = loader.result()
+        finally:
+            done.set()
+            loader.cancel()
+        await searcher
+
+    print(f"/api/logs idle:                  {describe(idle)}")
+    print(f"/api/logs with search + ingest:  {describe(loaded)}")
+    print(f"search exact_total: {len(searches)} requests, p50 {percentile(searches, 0.5):.1f} ms")
+    print(f"ingest under load: {lines} lines, {job.get('lines_per_sec', 0):,.0f} lines/sec")
+
+
+def run(count: int = DEFAULT_LINES) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, 'terraform.log')
+        with open(log_path, 'wb') as file:
+            file.write(b'\n'.join(synthetic_lines(count)) + b'\n')
+
+        port = free_port()
+        server = start_server(tmp, port)
+        try:
+            asyncio.run(measure(f"http://127.0.0.1:{port}", server, log_path, count))
+        except (RequestFailed, aiohttp.ClientError) as e:
+            print(f"concurrency: {e}")
+            with open(os.path.join(tmp, 'server.log'), 'rb') as log:
+                print(log.read().decode('utf-8', 'replace')[-2000:])
+            return False
+        finally:
+            server.terminate()
+            server.wait()
+    return True
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--lines', type=int, default=DEFAULT_LINES, help='size of the synthetic log')
+    args = arg_parser.parse_args()
+    sys.exit(0 if run(args.lines) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Скорость разбора строк лога: прежний путь против быстрого декодирования.
+
+Прежний путь - json.loads в словарь, parse_row и json.dumps словаря обратно
+в raw_data. Новый - parse_lines: orjson (если установлен) в LogRecord и
+исходная строка как raw_data. Заодно проверяется, что оба пути дают
+одинаковые поля; расхождение - код возврата 1.
+
+    python -m benchmarks.ingest_decode                  # синтетический лог
+    python -m benchmarks.ingest_decode --file terraform.log
+"""
+import argparse
+import json
+import sys
+import time
+from typing import List
+
+from app.ingest import INGEST_COLUMNS, new_stats, parse_lines
+from app.parser import parser
+from app.records import orjson
+
+RAW_DATA_INDEX = INGEST_COLUMNS.index('raw_data')
+TIMESTAMP_INDEX = INGEST_COLUMNS.index('timestamp')
+DEFAULT_LINES = 50000
+ROUNDS = 3
+
+
+def synthetic_lines(count: int) -> List[bytes]:
+    """Строки в формате TF_LOG=json: компактный JSON, как его пишет terraform"""
+    templates = [
+        {"@level": "trace", "@message": "provider.stdio: waiting for stdio data", "@module": "provider.stdio"},
+        {"@level": "debug", "@message": "Sending HTTP Request", "@module": "provider", "tf_req_id": "{req}",
+         "tf_resource_type": "aws_instance", "tf_rpc": "ApplyResourceChange",
+         "tf_http_req_body": "{\"name\":\"vm-{n}\",\"tags\":{\"env\":\"dev\"},\"size\":[1,2,3]}"},
+        {"@level": "info", "@message": "Terraform version: 1.6.0", "@module": "terraform"},
+        {"@level": "trace", "@message": "starting Plan operation", "@module": "terraform.ui"},
+        {"@level": "debug", "@message": "Received HTTP Response", "tf_req_id": "{req}",
+         "tf_resource_type": "aws_instance", "tf_rpc": "ReadResource",
+         "tf_http_res_body": "{\"id\":\"i-{n}\",\"state\":\"running\"}"},
+    ]
+    lines = []
+    for n in range(count):
+        record = dict(templates[n % len(templates)])
+        record["@timestamp"] = f"2025-09-09T10:55:{n % 60:02d}.{n % 1000000:06d}+03:00"
+        for key, value in record.items():
+            if isinstance(value, str):
+                record[key] = value.replace("{req}", f"req-{n // 10}").replace("{n}", str(n))
+        lines.append(json.dumps(record, separators=(',', ':')).encode('utf-8'))
+    return lines
+
+
+def legacy_rows(lines: List[bytes]) -> List[tuple]:
+    return [parser.parse_row(json.loads(line)) for line in lines]
+
+
+def fast_rows(lines: List[bytes]) -> List[tuple]:
+    return list(parse_lines(parser, lines, new_stats()))
+
+
+def lines_per_sec(parse, lines: List[bytes]) -> float:
+    best = None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        parse(lines)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+def mismatches(lines: List[bytes]) -> int:
+    count = 0
+    for line, old, new in zip(lines, legacy_rows(lines), fast_rows(lines)):
+        skipped = {RAW_DATA_INDEX}
+        if '@timestamp' not in json.loads(line):
+            # Без @timestamp берется текущее время, и оно заведомо различается
+            skipped.add(TIMESTAMP_INDEX)
+        same_fields = all(a == b for index, (a, b) in enumerate(zip(old, new)) if index not in skipped)
+        if not same_fields or json.loads(old[RAW_DATA_INDEX]) != json.loads(new[RAW_DATA_INDEX]):
+            count += 1
+    return count
+
+
+def run(file_path=None, count: int = DEFAULT_LINES) -> bool:
+    if file_path:
+        with open(file_path, 'rb') as file:
+            lines = [line.strip() for line in file if line.strip()]
+    else:
+        lines = synthetic_lines(count)
+
+    try:
+        [json.loads(line) for line in lines]
+    except ValueError as e:
+        print(f"ingest decode: the input must contain only valid JSON lines: {e}")
+        return False
+
+    before = lines_per_sec(legacy_rows, lines)
+    after = lines_per_sec(fast_rows, lines)
+    errors = mismatches(lines)
+
+    print(f"decoder: {'orjson' if orjson is not None else 'json (orjson is not installed)'}")
+    print(f"json.loads + parse_row + json.dumps: {before:,.0f} lines/sec")
+    print(f"parse_lines (LogRecord, raw line):   {after:,.0f} lines/sec ({after / before:.2f}x)")
+    print(f"ingest decode: {errors} mismatched rows of {len(lines)}")
+    return not errors
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--file', help='measure on a real log file (JSON lines)')
+    arg_parser.add_argument('--lines', type=int, default=DEFAULT_LINES, help='size of the synthetic log')
+    args = arg_parser.parse_args()
+    sys.exit(0 if run(args.file, args.lines) else 1)
+
+
+if __name__ == '__main__':
+    main()
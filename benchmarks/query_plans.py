@@ -0,0 +1,48 @@
+"""Проверка планов запросов /api/logs.
+
+Для каждой комбинации фильтров выполняется EXPLAIN QUERY PLAN; если хотя бы
+одна комбинация деградировала до полного скана или сортировки без индекса,
+скрипт завершается с кодом 1.
+
+    python -m benchmarks.query_plans                 # чистая схема во временной БД
+    python -m benchmarks.query_plans --db data/terraform_logs.db
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+
+from app.migrations import apply_migrations
+from app.models import Base
+from app.queryplan import check_log_query_plans
+
+
+def run(db_path=None) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = db_path or os.path.join(tmp, 'plans.db')
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        apply_migrations(engine)
+
+        failures = check_log_query_plans(engine)
+        engine.dispose()
+
+    for filters, plan, problems in failures:
+        print(f"FAIL {sorted(filters)}")
+        for problem in problems:
+            print(f"    {problem}")
+    print(f"query plans: {len(failures)} regressions")
+    return not failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--db', help='check an existing database instead of a fresh schema')
+    args = arg_parser.parse_args()
+    sys.exit(0 if run(args.db) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Запуск всего набора бенчмарков: python -m benchmarks.run
+
+Код возврата 1, если хотя бы одна проверка не прошла.
+"""
+import sys
+
+from benchmarks import bodies, classifier, concurrency, ingest_decode, query_plans
+
+SUITE = [
+    ('query_plans', query_plans.run),
+    ('ingest_decode', ingest_decode.run),
+    ('classifier', classifier.run),
+    ('bodies', bodies.run),
+    ('concurrency', concurrency.run),
+]
+
+
+def main():
+    failed = []
+    for name, run in SUITE:
+        print(f"== {name}")
+        if not run():
+            failed.append(name)
+
+    if failed:
+        print(f"FAILED: {', '.join(failed)}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
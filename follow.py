@@ -0,0 +1,37 @@
+import argparse
+import os
+import sys
+
+
+def main():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, current_dir)
+
+    arg_parser = argparse.ArgumentParser(description="Дочитывает растущие файлы логов Terraform (TF_LOG_PATH)")
+    arg_parser.add_argument('paths', nargs='*', help="файлы для слежения; без аргументов - уже зарегистрированные")
+    arg_parser.add_argument('--interval', type=float, default=None, help="период опроса в секундах")
+    args = arg_parser.parse_args()
+
+    from app.main import file_follower
+
+    if args.interval:
+        file_follower.poll_interval = args.interval
+
+    for path in args.paths:
+        followed = file_follower.follow(path)
+        print(f"Слежение за {followed['path']} (смещение {followed['offset']})")
+
+    if not args.paths and not file_follower.list():
+        print("Нет файлов для слежения")
+        return
+
+    print("Новые строки загружаются по мере записи, Ctrl+C для выхода")
+    print("Позиции сохраняются в БД: после перезапуска чтение продолжится с того же места")
+    try:
+        file_follower.run_forever()
+    except KeyboardInterrupt:
+        print("Остановлено")
+
+
+if __name__ == "__main__":
+    main()
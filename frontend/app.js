@@ -3,10 +3,16 @@ class TerraViewer {
         this.API_BASE = 'http://localhost:8000/api';
         this.currentLogs = [];
         this.requestChains = new Map();
+        this.chainDetails = new Map();
         this.lastTimestamp = null;
         this.currentChainIndex = 0;
         this.currentChainId = null;
         this.jsonExpandedState = new Map();
+        this.pageSize = 100;
+        // Поля строки, которые нужны списку; тела и raw_data читаются через /logs/{id}
+        this.listFields = 'id,level,message,timestamp,module,tf_req_id,tf_resource_type,tf_rpc,section,has_json,is_read';
+        this.pager = null;
+        this.liveSource = null;
         
         this.initializeEventListeners();
         this.loadInitialStats();
@@ -38,6 +44,10 @@ class TerraViewer {
             this.loadStats();
         });
 
+        document.getElementById('liveBtn').addEventListener('click', () => {
+            this.toggleLiveTail();
+        });
+
         document.getElementById('advancedSearchBtn').addEventListener('click', () => {
             this.toggleAdvancedSearch();
         });
@@ -66,6 +76,12 @@ class TerraViewer {
             }
         });
 
+        new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                this.loadMoreLogs();
+            }
+        }, { rootMargin: '400px' }).observe(document.getElementById('logsSentinel'));
+
         document.querySelectorAll('.close').forEach(closeBtn => {
             closeBtn.addEventListener('click', () => {
                 this.closeModal();
@@ -112,7 +128,7 @@ class TerraViewer {
         const section = document.getElementById('advancedSectionFilter').value;
         const searchQuery = document.getElementById('advancedSearchInput').value;
 
-        let url = `${this.API_BASE}/logs?limit=500`;
+        let url = `${this.API_BASE}/logs?limit=500&fields=${this.listFields}`;
         const params = [];
 
         if (resourceType) params.push(`tf_resource_type=${encodeURIComponent(resourceType)}`);
@@ -132,6 +148,8 @@ class TerraViewer {
             if (!response.ok) throw new Error('Network response was not ok');
             
             const data = await response.json();
+            this.pager = null;
+            this.currentLogs = data;
             
             if (searchQuery) {
                 const filteredLogs = data.filter(log => 
@@ -178,11 +196,19 @@ class TerraViewer {
             });
 
             if (response.ok) {
+                const upload = await response.json();
+                if (upload.duplicate_file) {
+                    this.showNotification(`Этот файл уже загружен: ${upload.lines_duplicate} повторных строк пропущено`, 'info');
+                    this.hideLoading();
+                    return;
+                }
                 this.showNotification('Файл успешно загружен! Логи обрабатываются...', 'success');
-                setTimeout(() => {
-                    this.loadLogs();
-                    this.loadStats();
-                }, 2000);
+                await this.waitForJob(upload.job_id);
+                this.loadLogs();
+                this.loadStats();
+            } else if (response.status === 429) {
+                this.showNotification('Очередь обработки переполнена, попробуйте позже', 'error');
+                this.hideLoading();
             } else {
                 throw new Error('Ошибка загрузки файла');
             }
@@ -193,16 +219,36 @@ class TerraViewer {
         }
     }
 
+    async waitForJob(jobId) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+
+            const response = await fetch(`${this.API_BASE}/jobs/${jobId}`);
+            if (!response.ok) return;
+
+            const job = await response.json();
+            if (job.status !== 'queued' && job.status !== 'running') {
+                if (job.status === 'failed') {
+                    this.showNotification(`Ошибка обработки файла: ${job.error || ''}`, 'error');
+                } else if (job.status === 'completed' && job.lines_duplicate) {
+                    this.showNotification(`Новых строк: ${job.lines_new}, повторных пропущено: ${job.lines_duplicate}`, 'info');
+                }
+                return;
+            }
+        }
+    }
+
     async loadLogs(unreadOnly = false) {
         this.showLoading();
         this.lastTimestamp = null;
+        this.chainDetails.clear();
         
         try {
             const searchQuery = document.getElementById('searchInput').value;
             const levelFilter = document.getElementById('levelFilter').value;
             const sectionFilter = document.getElementById('sectionFilter').value;
             
-            let url = `${this.API_BASE}/logs?limit=500`;
+            let url = `${this.API_BASE}/logs?limit=${this.pageSize}&fields=${this.listFields}`;
             
             if (levelFilter) {
                 url += `&level=${levelFilter}`;
@@ -214,12 +260,9 @@ class TerraViewer {
                 url += `&unread_only=true`;
             }
 
-            const response = await fetch(url);
-            
-            if (!response.ok) throw new Error('Network response was not ok');
-            
-            const data = await response.json();
-            this.currentLogs = data;
+            const page = await this.fetchLogsPage(url);
+            this.pager = { url, fetchPage: this.fetchLogsPage, cursor: page.nextCursor };
+            this.currentLogs = page.logs;
             
             this.displayLogs(this.currentLogs);
             this.hideLoading();
@@ -240,12 +283,12 @@ class TerraViewer {
         this.showLoading();
 
         try {
-            const response = await fetch(`${this.API_BASE}/search?q=${encodeURIComponent(query)}&limit=500`);
+            const url = `${this.API_BASE}/search?q=${encodeURIComponent(query)}&limit=${this.pageSize}`;
+            const page = await this.fetchSearchPage(url);
+            this.pager = { url, fetchPage: this.fetchSearchPage, cursor: page.nextCursor };
+            this.currentLogs = page.logs;
             
-            if (!response.ok) throw new Error('Network response was not ok');
-            
-            const data = await response.json();
-            this.displayLogs(data.logs);
+            this.displayLogs(this.currentLogs);
             this.hideLoading();
             
         } catch (error) {
@@ -255,7 +298,58 @@ class TerraViewer {
         }
     }
 
+    async fetchLogsPage(url) {
+        const response = await fetch(url);
+        if (!response.ok) throw new Error('Network response was not ok');
+        
+        return {
+            logs: await response.json(),
+            nextCursor: response.headers.get('X-Next-Cursor')
+        };
+    }
+
+    async fetchSearchPage(url) {
+        const response = await fetch(url);
+        if (!response.ok) throw new Error('Network response was not ok');
+        
+        const data = await response.json();
+        return { logs: data.logs, nextCursor: data.next_cursor };
+    }
+
+    async loadMoreLogs() {
+        const pager = this.pager;
+        if (!pager || !pager.cursor || this.loadingMore) return;
+        
+        this.loadingMore = true;
+        try {
+            const page = await pager.fetchPage(`${pager.url}&cursor=${encodeURIComponent(pager.cursor)}`);
+            if (this.pager !== pager) return;
+            
+            pager.cursor = page.nextCursor;
+            this.currentLogs = this.currentLogs.concat(page.logs);
+            this.appendLogs(page.logs);
+        } catch (error) {
+            console.error('Error loading more logs:', error);
+            this.showNotification('Ошибка при загрузке логов', 'error');
+        } finally {
+            this.loadingMore = false;
+        }
+        
+        if (this.pager === pager && pager.cursor && this.isSentinelVisible()) {
+            this.loadMoreLogs();
+        }
+    }
+
+    isSentinelVisible() {
+        const rect = document.getElementById('logsSentinel').getBoundingClientRect();
+        return rect.top < window.innerHeight + 400;
+    }
+
     filterLogs() {
+        if (this.liveSource) {
+            this.startLiveTail();
+        }
+
         const levelFilter = document.getElementById('levelFilter').value;
         const sectionFilter = document.getElementById('sectionFilter').value;
         const searchQuery = document.getElementById('searchInput').value;
@@ -267,6 +361,71 @@ class TerraViewer {
         }
     }
 
+    toggleLiveTail() {
+        if (this.liveSource) {
+            this.stopLiveTail();
+        } else {
+            this.startLiveTail();
+        }
+    }
+
+    startLiveTail() {
+        this.stopLiveTail();
+
+        const params = new URLSearchParams();
+        const levelFilter = document.getElementById('levelFilter').value;
+        const sectionFilter = document.getElementById('sectionFilter').value;
+        if (levelFilter) params.set('level', levelFilter);
+        if (sectionFilter) params.set('section', sectionFilter);
+
+        // Сервер присылает только новые строки, список дополняется сверху без перерисовки
+        this.liveSource = new EventSource(`${this.API_BASE}/stream?${params}`);
+        this.liveSource.addEventListener('logs', (e) => {
+            this.prependLogs(JSON.parse(e.data));
+            clearTimeout(this.liveStatsTimer);
+            this.liveStatsTimer = setTimeout(() => this.loadStats(), 1000);
+        });
+        this.liveSource.addEventListener('dropped', (e) => {
+            const { count } = JSON.parse(e.data);
+            this.showNotification(`Пропущено ${count} новых записей, обновите список`);
+        });
+
+        document.getElementById('liveBtn').classList.add('active');
+    }
+
+    stopLiveTail() {
+        if (this.liveSource) {
+            this.liveSource.close();
+            this.liveSource = null;
+        }
+        document.getElementById('liveBtn').classList.remove('active');
+    }
+
+    prependLogs(logs) {
+        if (logs.length === 0) return;
+
+        const newest = logs.slice().reverse();
+        this.currentLogs = newest.concat(this.currentLogs);
+
+        const chains = this.buildRequestChains(newest);
+        chains.forEach((chainLogs, reqId) => {
+            const existing = this.requestChains.get(reqId) || [];
+            this.requestChains.set(reqId, chainLogs.concat(existing));
+        });
+
+        const logsList = document.getElementById('logsList');
+        logsList.style.display = 'block';
+        document.getElementById('emptyState').style.display = 'none';
+
+        const page = document.createElement('div');
+        page.className = 'logs-page';
+        page.innerHTML = this.generateLogsHTML(newest, chains);
+        const quickSearch = logsList.querySelector('.quick-search');
+        logsList.insertBefore(page, quickSearch ? quickSearch.nextSibling : logsList.firstChild);
+
+        this.attachLogActionsHandlers(page);
+    }
+
     displayLogs(logs) {
         const logsList = document.getElementById('logsList');
         const emptyState = document.getElementById('emptyState');
@@ -286,7 +445,24 @@ class TerraViewer {
         const logsHTML = quickSearchHTML + this.generateLogsHTML(logs);
         logsList.innerHTML = logsHTML;
 
-        this.attachLogActionsHandlers();
+        this.attachLogActionsHandlers(logsList);
+    }
+
+    appendLogs(logs) {
+        if (logs.length === 0) return;
+
+        const chains = this.buildRequestChains(logs);
+        chains.forEach((chainLogs, reqId) => {
+            const existing = this.requestChains.get(reqId) || [];
+            this.requestChains.set(reqId, existing.concat(chainLogs));
+        });
+
+        const page = document.createElement('div');
+        page.className = 'logs-page';
+        page.innerHTML = this.generateLogsHTML(logs, chains);
+        document.getElementById('logsList').appendChild(page);
+
+        this.attachLogActionsHandlers(page);
     }
 
     generateQuickSearchHTML(logs) {
@@ -310,20 +486,26 @@ class TerraViewer {
     }
 
     groupLogsByRequestId(logs) {
-        this.requestChains.clear();
+        this.requestChains = this.buildRequestChains(logs);
+    }
+
+    buildRequestChains(logs) {
+        const chains = new Map();
         
         logs.forEach(log => {
             if (log.tf_req_id) {
-                if (!this.requestChains.has(log.tf_req_id)) {
-                    this.requestChains.set(log.tf_req_id, []);
+                if (!chains.has(log.tf_req_id)) {
+                    chains.set(log.tf_req_id, []);
                 }
-                this.requestChains.get(log.tf_req_id).push(log);
+                chains.get(log.tf_req_id).push(log);
             }
         });
+
+        return chains;
     }
 
-    generateLogsHTML(logs) {
-        const groupedLogs = this.groupLogsForDisplay(logs);
+    generateLogsHTML(logs, chains = this.requestChains) {
+        const groupedLogs = this.groupLogsForDisplay(logs, chains);
         return groupedLogs.map(group => {
             if (group.type === 'chain' && group.logs.length > 1) {
                 return this.generateChainHTML(group);
@@ -333,15 +515,15 @@ class TerraViewer {
         }).join('');
     }
 
-    groupLogsForDisplay(logs) {
+    groupLogsForDisplay(logs, chains = this.requestChains) {
         const groups = [];
         const processedIds = new Set();
 
         logs.forEach(log => {
             if (processedIds.has(log.id)) return;
 
-            if (log.tf_req_id && this.requestChains.has(log.tf_req_id)) {
-                const chainLogs = this.requestChains.get(log.tf_req_id);
+            if (log.tf_req_id && chains.has(log.tf_req_id)) {
+                const chainLogs = chains.get(log.tf_req_id);
                 if (chainLogs.length > 1) {
                     groups.push({
                         type: 'chain',
@@ -413,8 +595,11 @@ class TerraViewer {
             </span>
         ` : '';
 
-        const hasJson = log.json_blocks && Object.keys(log.json_blocks).length > 0;
-        const jsonPreview = hasJson ? this.generateJsonPreview(log.json_blocks) : '';
+        // В списках json_blocks не приходит, есть только признак has_json;
+        // сами блоки подгружаются при раскрытии (loadLogPayload)
+        const payloadLoaded = log.json_blocks !== undefined;
+        const hasJson = log.has_json || (log.json_blocks && Object.keys(log.json_blocks).length > 0);
+        const jsonPreview = hasJson && payloadLoaded ? this.generateJsonPreview(log.json_blocks || {}) : '';
 
         return `
             <div class="${cssClass}" data-log-id="${log.id}">
@@ -441,7 +626,7 @@ class TerraViewer {
                         ` : ''}
                     </div>
                 </div>
-                <div class="log-message">${this.escapeHtml(log.message)}</div>
+                <div class="log-message">${log.snippet ? this.renderSnippet(log.snippet) : this.escapeHtml(log.message)}</div>
                 <div class="log-details">
                     ${sectionBadge}
                     ${log.tf_resource_type ? `
@@ -486,7 +671,7 @@ class TerraViewer {
                         </button>
                     </div>
                     
-                    <div class="json-accordion" id="json-accordion-${log.id}" style="display: none;">
+                    <div class="json-accordion" id="json-accordion-${log.id}" style="display: none;" data-loaded="${payloadLoaded}">
                         <div class="json-accordion-header active" data-log-id="${log.id}">
                             <span>📋 JSON данные</span>
                             <span class="json-toggle">▼</span>
@@ -581,8 +766,8 @@ class TerraViewer {
         return html;
     }
 
-    attachLogActionsHandlers() {
-        document.querySelectorAll('.mark-read').forEach(btn => {
+    attachLogActionsHandlers(root = document) {
+        root.querySelectorAll('.mark-read').forEach(btn => {
             btn.addEventListener('click', async (e) => {
                 e.stopPropagation();
                 const logId = e.target.dataset.logId;
@@ -590,7 +775,7 @@ class TerraViewer {
             });
         });
 
-        document.querySelectorAll('.view-chain').forEach(btn => {
+        root.querySelectorAll('.view-chain').forEach(btn => {
             btn.addEventListener('click', async (e) => {
                 e.stopPropagation();
                 const reqId = e.target.dataset.reqId;
@@ -598,7 +783,7 @@ class TerraViewer {
             });
         });
 
-        document.querySelectorAll('.view-chain-details').forEach(btn => {
+        root.querySelectorAll('.view-chain-details').forEach(btn => {
             btn.addEventListener('click', async (e) => {
                 e.stopPropagation();
                 const reqId = e.target.dataset.reqId;
@@ -606,7 +791,7 @@ class TerraViewer {
             });
         });
 
-        document.querySelectorAll('.toggle-json').forEach(btn => {
+        root.querySelectorAll('.toggle-json').forEach(btn => {
             btn.addEventListener('click', (e) => {
                 e.stopPropagation();
                 const logId = e.target.dataset.logId;
@@ -614,7 +799,7 @@ class TerraViewer {
             });
         });
 
-        document.querySelectorAll('.json-accordion-header').forEach(header => {
+        root.querySelectorAll('.json-accordion-header').forEach(header => {
             header.addEventListener('click', (e) => {
                 const content = header.nextElementSibling;
                 const isActive = header.classList.contains('active');
@@ -633,7 +818,7 @@ class TerraViewer {
             });
         });
 
-        document.querySelectorAll('.chain-header').forEach(header => {
+        root.querySelectorAll('.chain-header').forEach(header => {
             header.addEventListener('click', (e) => {
                 if (!e.target.classList.contains('action-btn')) {
                     const chainGroup = e.currentTarget.parentElement;
@@ -642,7 +827,7 @@ class TerraViewer {
             });
         });
 
-        document.querySelectorAll('.log-item').forEach(item => {
+        root.querySelectorAll('.log-item').forEach(item => {
             item.addEventListener('click', (e) => {
                 if (!e.target.classList.contains('action-btn') && 
                     !e.target.classList.contains('quick-action-btn') &&
@@ -654,10 +839,33 @@ class TerraViewer {
         });
     }
 
-    toggleJsonAccordion(logId) {
+    async toggleJsonAccordion(logId) {
         const accordion = document.getElementById(`json-accordion-${logId}`);
-        if (accordion) {
-            accordion.style.display = accordion.style.display === 'none' ? 'block' : 'none';
+        if (!accordion) return;
+
+        if (accordion.dataset.loaded !== 'true') {
+            const log = this.currentLogs.find(l => l.id == logId);
+            if (!log || !await this.loadLogPayload(log)) return;
+            accordion.querySelector('.json-accordion-content').innerHTML = this.generateJsonPreview(log.json_blocks || {});
+            accordion.dataset.loaded = 'true';
+        }
+        accordion.style.display = accordion.style.display === 'none' ? 'block' : 'none';
+    }
+
+    async loadLogPayload(log) {
+        if (log.raw_data !== undefined) return true;
+
+        try {
+            const response = await fetch(`${this.API_BASE}/logs/${log.id}`);
+            if (!response.ok) throw new Error('Network response was not ok');
+            const details = await response.json();
+            log.raw_data = details.raw_data;
+            log.json_blocks = details.json_blocks;
+            return true;
+        } catch (error) {
+            console.error('Error loading log details:', error);
+            this.showNotification('Ошибка при загрузке данных лога', 'error');
+            return false;
         }
     }
 
@@ -713,9 +921,9 @@ class TerraViewer {
         }
     }
 
-    showLogDetails(logId, fromNavigation = false) {
+    async showLogDetails(logId, fromNavigation = false) {
         const log = this.currentLogs.find(l => l.id == logId);
-        if (!log) return;
+        if (!log || !await this.loadLogPayload(log)) return;
 
         const modal = document.getElementById('logDetailModal');
         const content = document.getElementById('logDetailContent');
@@ -940,13 +1148,22 @@ class TerraViewer {
         `;
     }
 
+    fetchRequestChain(reqId) {
+        // Обе кнопки цепочки используют один запрос; промис кэшируется до обновления списка
+        if (!this.chainDetails.has(reqId)) {
+            const request = fetch(`${this.API_BASE}/chains/${encodeURIComponent(reqId)}`).then(response => {
+                if (!response.ok) throw new Error('Chain not found');
+                return response.json();
+            });
+            request.catch(() => this.chainDetails.delete(reqId));
+            this.chainDetails.set(reqId, request);
+        }
+        return this.chainDetails.get(reqId);
+    }
+
     async showRequestChain(reqId) {
         try {
-            const response = await fetch(`${this.API_BASE}/chains/${reqId}`);
-            
-            if (!response.ok) throw new Error('Chain not found');
-            
-            const chainData = await response.json();
+            const chainData = await this.fetchRequestChain(reqId);
             this.displayRequestChain(chainData);
             
         } catch (error) {
@@ -957,11 +1174,7 @@ class TerraViewer {
 
     async showRequestChainDetails(reqId) {
         try {
-            const response = await fetch(`${this.API_BASE}/chains/${reqId}`);
-            
-            if (!response.ok) throw new Error('Chain not found');
-            
-            const chainData = await response.json();
+            const chainData = await this.fetchRequestChain(reqId);
             this.displayRequestChainDetails(chainData);
             
         } catch (error) {
@@ -970,11 +1183,22 @@ class TerraViewer {
         }
     }
 
+    formatDuration(durationMs) {
+        if (durationMs < 1000) return `${Math.round(durationMs)}ms`;
+        return `${(durationMs / 1000).toFixed(2)}s`;
+    }
+
+    chainShownNote(chainData) {
+        if (chainData.logs.length >= chainData.total_logs) return '';
+        return `<span class="chain-badge">Показано: ${chainData.logs.length} из ${chainData.total_logs}</span>`;
+    }
+
     displayRequestChain(chainData) {
         const modal = document.getElementById('chainsModal');
         const chainsList = document.getElementById('chainsList');
         
-        const sortedLogs = chainData.logs.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
+        // Сервер отдает записи цепочки уже по возрастанию времени
+        const sortedLogs = chainData.logs;
         let lastTimestamp = null;
         
         const chainHTML = `
@@ -985,7 +1209,8 @@ class TerraViewer {
                         <div class="chain-info">
                             <span class="chain-badge">ID: ${chainData.tf_req_id}</span>
                             <span class="chain-badge">Записей: ${chainData.total_logs}</span>
-                            <span class="chain-badge">Длительность: ${this.calculateChainDuration(sortedLogs)}</span>
+                            <span class="chain-badge">Длительность: ${this.formatDuration(chainData.summary.duration_ms)}</span>
+                            ${this.chainShownNote(chainData)}
                         </div>
                     </div>
                 </div>
@@ -1017,7 +1242,7 @@ class TerraViewer {
         const modal = document.getElementById('chainsModal');
         const chainsList = document.getElementById('chainsList');
         
-        const sortedLogs = chainData.logs.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
+        const sortedLogs = chainData.logs;
         
         const stats = this.calculateChainStats(sortedLogs);
         
@@ -1029,14 +1254,16 @@ class TerraViewer {
                         <div class="chain-info">
                             <span class="chain-badge">ID: ${chainData.tf_req_id}</span>
                             <span class="chain-badge">Уровни: ${Object.entries(stats.levels).map(([k,v]) => `${k}:${v}`).join(', ')}</span>
-                            <span class="chain-badge">Длительность: ${stats.duration}</span>
+                            <span class="chain-badge">Длительность: ${this.formatDuration(chainData.summary.duration_ms)}</span>
+                            ${this.chainShownNote(chainData)}
                         </div>
                     </div>
                 </div>
                 <div class="chain-logs">
                     <div style="padding: 1rem; background: white; border-radius: 8px; margin-bottom: 1rem;">
                         <h4>Общая статистика:</h4>
-                        <p>Всего записей: ${stats.total}</p>
+                        <p>Всего записей: ${chainData.total_logs}, ошибок: ${chainData.summary.error_count}</p>
+                        <p>RPC: ${chainData.summary.tf_rpc || '—'}, худший уровень: ${chainData.summary.worst_level || '—'}</p>
                         <p>Временной диапазон: ${stats.timeRange}</p>
                         <p>Среднее время между событиями: ${stats.avgInterval}</p>
                     </div>
@@ -1260,6 +1487,12 @@ class TerraViewer {
             .replace(/"/g, "&quot;")
             .replace(/'/g, "&#039;");
     }
+
+    renderSnippet(snippet) {
+        return this.escapeHtml(snippet)
+            .replace(/&lt;mark&gt;/g, '<mark>')
+            .replace(/&lt;\/mark&gt;/g, '</mark>');
+    }
 }
 
 document.addEventListener('DOMContentLoaded', () => {
@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+# app.database создает движки по TERRAVIEWER_DATABASE_URL при импорте;
+# тесты работают со своими базами и не должны трогать data/
+os.environ.setdefault('TERRAVIEWER_DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'unused.db'))
+
+from sqlalchemy.orm import sessionmaker
+
+from app.database import create_sqlite_engine
+from app.migrations import apply_migrations
+from app.models import Base
+
+
+def new_database(path):
+    """Движок записи для новой базы по пути path со всеми таблицами и миграциями"""
+    engine = create_sqlite_engine(f"sqlite:///{path}", pool_size=1)
+    Base.metadata.create_all(bind=engine)
+    apply_migrations(engine)
+    return engine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = new_database(tmp_path / 'terraform_logs.db')
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def write_log(tmp_path):
+    """Пишет записи лога (dict) по одной JSON-строке и возвращает путь к файлу"""
+    def write(records, name='terraform.log'):
+        path = tmp_path / name
+        path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+        return str(path)
+    return write
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from app.ingest import LogIngestor
+from app.models import RequestChain
+from app.parser import TerraformLogParser
+
+
+def test_chain_with_mixed_and_missing_timestamps(db, write_log):
+    path = write_log([
+        {'@level': 'debug', '@message': 'start', '@timestamp': '2025-09-09T15:31:47.000000+03:00', 'tf_req_id': 'req-1'},
+        {'@level': 'error', '@message': 'no timestamp', 'tf_req_id': 'req-1'},
+        {'@level': 'debug', '@message': 'bad timestamp', '@timestamp': 'not a time', 'tf_req_id': 'req-1'},
+        {'@level': 'debug', '@message': 'end', '@timestamp': '2025-09-09T15:31:48.500000+03:00', 'tf_req_id': 'req-1'},
+    ])
+
+    stats = LogIngestor(TerraformLogParser()).ingest_file(path, db, run_id=None)
+
+    assert stats['inserted'] == 4
+    chain = db.get(RequestChain, 'req-1')
+    assert chain.log_count == 4
+    assert chain.error_count == 1
+    assert chain.first_timestamp == datetime(2025, 9, 9, 15, 31, 47)
+    # Строка без @timestamp получает время загрузки и становится последней
+    assert chain.last_timestamp > datetime(2025, 9, 10)
+
+
+def test_chain_duration_from_timestamps_with_offset(db, write_log):
+    path = write_log([
+        {'@level': 'debug', '@message': 'start', '@timestamp': '2025-09-09T15:31:47.000000+03:00', 'tf_req_id': 'req-2'},
+        {'@level': 'debug', '@message': 'end', '@timestamp': '2025-09-09T15:31:48.500000+03:00', 'tf_req_id': 'req-2'},
+    ])
+
+    LogIngestor(TerraformLogParser()).ingest_file(path, db)
+
+    assert db.get(RequestChain, 'req-2').duration_ms == 1500.0
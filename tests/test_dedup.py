@@ -0,0 +1,51 @@
+import json
+
+from sqlalchemy import text
+
+from app.dedup import backfill_fingerprints, line_fingerprint, terraform_line
+from app.ingest import LogIngestor
+from app.parser import TerraformLogParser
+
+RECORDS = [
+    {'@level': 'info', '@message': 'Terraform version: 1.13.1', '@timestamp': '2025-09-09T15:31:47.945980+03:00'},
+    {'@level': 'debug', '@message': 'провайдер <t1> & co', '@timestamp': '2025-09-09T15:31:47.946115+03:00'},
+]
+# Так пишет terraform: компактный JSON, <, > и & экранированы
+LINES = [
+    '{"@level":"info","@message":"Terraform version: 1.13.1","@timestamp":"2025-09-09T15:31:47.945980+03:00"}',
+    '{"@level":"debug","@message":"провайдер \\u003ct1\\u003e \\u0026 co","@timestamp":"2025-09-09T15:31:47.946115+03:00"}',
+]
+
+
+def write_lines(tmp_path, name='terraform.log'):
+    path = tmp_path / name
+    path.write_text(''.join(line + '\n' for line in LINES), encoding='utf-8')
+    return str(path)
+
+
+def test_fingerprint_depends_on_source_and_raw_line():
+    assert line_fingerprint('ci', LINES[0]) == line_fingerprint('ci', LINES[0])
+    assert line_fingerprint('ci', LINES[0]) != line_fingerprint('', LINES[0])
+    assert line_fingerprint('ci', LINES[0]) != line_fingerprint('ci', json.dumps(RECORDS[0]))
+
+
+def test_terraform_line_restores_original_form():
+    for line, record in zip(LINES, RECORDS):
+        assert terraform_line(json.dumps(record)) == line
+
+
+def test_reupload_skips_lines_stored_before_fingerprints(db, tmp_path):
+    # Строки, загруженные до отпечатков: raw_data - json.dumps разобранной строки
+    parser = TerraformLogParser()
+    ingestor = LogIngestor(parser)
+    stats = {'inserted': 0, 'duplicates': 0, 'batches': 0}
+    ingestor.write_batch(db, [parser.parse_row(record) for record in RECORDS], stats)
+    db.execute(text("UPDATE terraform_logs SET fingerprint = NULL"))
+    db.commit()
+
+    assert backfill_fingerprints(db) == len(RECORDS)
+    db.commit()
+
+    stats = ingestor.ingest_file(write_lines(tmp_path), db)
+    assert stats['inserted'] == 0
+    assert stats['duplicates'] == len(RECORDS)
@@ -0,0 +1,38 @@
+import gzip
+import json
+
+import pytest
+
+from app.export import export_stream, iter_export_records
+from app.ingest import LogIngestor
+from app.parser import TerraformLogParser
+
+
+@pytest.fixture
+def logs(db, write_log):
+    records = [
+        {'@level': 'info', '@message': f'timed {i}', '@timestamp': f'2025-09-09T15:31:{i:02d}.000000+03:00'}
+        for i in range(7)
+    ]
+    # Неразборчивый @timestamp сохраняется как NULL
+    records += [{'@level': 'info', '@message': f'untimed {i}', '@timestamp': 'garbage'} for i in range(5)]
+    LogIngestor(TerraformLogParser()).ingest_file(write_log(records), db)
+    return records
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 3, 5, 7, 12, 100])
+def test_export_includes_rows_without_timestamp(session_factory, logs, chunk_rows):
+    batches = list(iter_export_records(session_factory, ['message', 'timestamp'], {}, chunk_rows))
+
+    messages = [record['message'] for records in batches for record in records]
+    # Порядок списка: от новых к старым, строки без времени - в конце по убыванию id
+    assert messages == [f'timed {i}' for i in reversed(range(7))] + [f'untimed {i}' for i in reversed(range(5))]
+    assert all(len(records) <= chunk_rows for records in batches)
+
+
+def test_export_ndjson_gzip(session_factory, logs):
+    body = b''.join(export_stream(session_factory, 'ndjson', ['id', 'raw_data'], {'level': 'info'}, 'gzip'))
+
+    lines = gzip.decompress(body).decode('utf-8').splitlines()
+    assert len(lines) == len(logs)
+    assert {json.loads(json.loads(line)['raw_data'])['@message'] for line in lines} == {r['@message'] for r in logs}
@@ -0,0 +1,38 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.ingest import LogIngestor
+from app.models import TerraformLog
+from app.parser import SimpleTerraformParser
+from tests.conftest import new_database
+
+
+def stored_rows(db):
+    return db.execute(
+        select(TerraformLog.level, TerraformLog.message, TerraformLog.timestamp, TerraformLog.tf_req_id)
+        .order_by(TerraformLog.id)
+    ).all()
+
+
+def test_parallel_ingest_matches_serial(db, write_log, tmp_path):
+    records = [
+        {'@level': 'info', '@message': f'line {i}', '@timestamp': f'2025-09-09T15:{i // 60:02d}:{i % 60:02d}.000000+03:00',
+         'tf_req_id': f'req-{i % 7}'}
+        for i in range(500)
+    ]
+    path = write_log(records)
+    parser = SimpleTerraformParser()
+    serial = LogIngestor(parser).ingest_file(path, db)
+
+    engine = new_database(tmp_path / 'parallel.db')
+    try:
+        with Session(engine) as parallel_db:
+            # Маленькие шарды, чтобы разбор разошелся по нескольким процессам
+            ingestor = LogIngestor(parser, batch_size=64, workers=2, shard_size=4096)
+            parallel = ingestor.ingest_file(path, parallel_db)
+
+            assert parallel['inserted'] == serial['inserted'] == len(records)
+            assert parallel['errors'] == 0
+            assert stored_rows(parallel_db) == stored_rows(db)
+    finally:
+        engine.dispose()
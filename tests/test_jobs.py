@@ -0,0 +1,26 @@
+from app.jobs import JobManager
+from app.models import IngestJob
+
+
+def test_recover_fails_interrupted_jobs_and_removes_their_spool_files(db, session_factory, tmp_path):
+    spools = {}
+    for job_id, status in (('queued', 'queued'), ('running', 'running'), ('done', 'completed')):
+        spools[job_id] = tmp_path / f'{job_id}.log'
+        spools[job_id].write_text('{}\n')
+        db.add(IngestJob(id=job_id, status=status, spool_path=str(spools[job_id])))
+    # Задача без файла (созданная до появления spool_path)
+    db.add(IngestJob(id='legacy', status='running'))
+    db.commit()
+
+    manager = JobManager(None, session_factory, workers=1)
+    try:
+        manager.recover()
+    finally:
+        manager.shutdown()
+
+    db.expire_all()
+    statuses = {job.id: job.status for job in db.query(IngestJob)}
+    assert statuses == {'queued': 'failed', 'running': 'failed', 'done': 'completed', 'legacy': 'failed'}
+    assert not spools['queued'].exists()
+    assert not spools['running'].exists()
+    assert spools['done'].exists()
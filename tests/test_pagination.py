@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from app.ingest import LogIngestor
+from app.main import logs_page
+from app.models import TerraformLog
+from app.pagination import decode_time_cursor, encode_cursor
+from app.parser import TerraformLogParser
+from app.queries import parse_log_fields
+from app.search import LogSearch
+
+
+@pytest.fixture
+def logs(db, write_log):
+    # Строки со временем и без него (неразборчивый @timestamp) вперемешку
+    records = [
+        {'@level': 'info', '@message': f'deploy step {i}',
+         '@timestamp': f'2025-09-09T15:31:{i:02d}.000000+03:00' if i % 3 else 'garbage'}
+        for i in range(20)
+    ]
+    LogIngestor(TerraformLogParser()).ingest_file(write_log(records), db)
+    return [log_id for (log_id,) in db.query(TerraformLog.id)]
+
+
+def test_time_cursor_of_row_without_timestamp():
+    assert decode_time_cursor(encode_cursor('time', None, 42)) == (None, 42)
+
+
+@pytest.mark.parametrize('limit', [1, 3, 7, 13, 20, 50])
+def test_logs_pages_return_every_row_once(db, logs, limit):
+    seen = []
+    cursor = None
+    while True:
+        body, cursor = logs_page(db, parse_log_fields('id'), 0, limit, after=decode_time_cursor(cursor))
+        page = [row['id'] for row in json.loads(body)]
+        assert len(page) <= limit
+        seen += page
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(logs)
+    assert len(seen) == len(logs)
+
+
+def test_logs_page_skip_reaches_rows_without_timestamp(db, logs):
+    body, cursor = logs_page(db, parse_log_fields('id'), 0, 5)
+    first = json.loads(body)
+
+    # skip больше числа оставшихся строк со временем
+    body, _ = logs_page(db, parse_log_fields('id'), 12, 5, after=decode_time_cursor(cursor))
+
+    tail, _ = logs_page(db, parse_log_fields('id'), 5 + 12, 5)
+    assert json.loads(body) == json.loads(tail)
+    assert {row['id'] for row in first}.isdisjoint(row['id'] for row in json.loads(body))
+
+
+@pytest.mark.parametrize('limit', [1, 4, 20])
+def test_search_by_time_pages_return_every_match_once(engine, logs, limit):
+    search = LogSearch(engine)
+    seen = []
+    after = None
+    while True:
+        hits = search.search_ids('deploy', limit=limit + 1, order='time', after=after)['hits']
+        seen += [hit['id'] for hit in hits[:limit]]
+        if len(hits) <= limit:
+            break
+        last = hits[limit - 1]
+        after = decode_time_cursor(encode_cursor('time', last['timestamp'], last['id']))
+
+    assert sorted(seen) == sorted(logs)
+    assert len(seen) == len(logs)
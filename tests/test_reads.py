@@ -0,0 +1,38 @@
+from sqlalchemy import func, select
+
+from app.ingest import LogIngestor
+from app.models import TerraformLog
+from app.parser import TerraformLogParser
+from app.reads import mark_matching_read
+
+
+def ingest_with_missing_timestamps(db, write_log):
+    # Неразборчивый @timestamp сохраняется как NULL
+    records = [
+        {'@level': 'info', '@message': f'timed {i}', '@timestamp': f'2025-09-09T15:31:{i:02d}.000000+03:00'}
+        for i in range(7)
+    ]
+    records += [{'@level': 'info', '@message': f'untimed {i}', '@timestamp': 'garbage'} for i in range(8)]
+    records += [{'@level': 'error', '@message': f'untimed error {i}', '@timestamp': 'garbage'} for i in range(2)]
+    LogIngestor(TerraformLogParser()).ingest_file(write_log(records), db)
+    return len(records)
+
+
+def unread(db, *conditions):
+    return db.execute(select(func.count()).where(TerraformLog.is_read == False, *conditions)).scalar()
+
+
+def test_mark_matching_read_includes_rows_without_timestamp(db, write_log):
+    total = ingest_with_missing_timestamps(db, write_log)
+    assert unread(db, TerraformLog.timestamp.is_(None)) == 10
+
+    assert mark_matching_read(db, [], chunk_size=3) == total
+    assert unread(db) == 0
+
+
+def test_mark_matching_read_with_filter_and_untimed_rows(db, write_log):
+    ingest_with_missing_timestamps(db, write_log)
+
+    assert mark_matching_read(db, [TerraformLog.level == 'info'], chunk_size=2) == 15
+    assert unread(db) == 2
+    assert unread(db, TerraformLog.level == 'error') == 2
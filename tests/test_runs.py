@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from app.ingest import LogIngestor
+from app.models import Run, TerraformLog
+from app.parser import TerraformLogParser
+from app.runs import create_run
+
+
+def test_run_with_mixed_and_missing_timestamps(db, write_log):
+    records = [
+        {'@level': 'info', '@message': f'line {i}', '@timestamp': f'2025-09-09T15:31:4{i}.000000+03:00'}
+        for i in range(5)
+    ]
+    records.append({'@level': 'info', '@message': 'no timestamp'})
+    records.append({'@level': 'info', '@message': 'utc', '@timestamp': '2025-09-09T12:31:30.000000Z'})
+    records.append({'@level': 'info', '@message': 'bad timestamp', '@timestamp': 'yesterday'})
+    path = write_log(records)
+
+    run = create_run(db, source='test')
+    stats = LogIngestor(TerraformLogParser()).ingest_file(path, db, source='test', run_id=run.id)
+
+    assert stats['inserted'] == len(records)
+    db.expire_all()
+    run = db.get(Run, run.id)
+    assert run.log_count == len(records)
+    # Смещение отбрасывается, как и раньше при записи в SQLite
+    assert run.first_timestamp == datetime(2025, 9, 9, 12, 31, 30)
+    assert db.query(TerraformLog).filter(TerraformLog.message == 'line 0').one().timestamp == datetime(2025, 9, 9, 15, 31, 40)
+    # Строка без @timestamp получает время загрузки
+    assert run.last_timestamp > datetime(2025, 9, 10)
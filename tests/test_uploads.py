@@ -0,0 +1,45 @@
+import gzip
+
+import pytest
+
+from app.uploads import DECODE_CHUNK_SIZE, UploadSpool, UploadTooLarge
+
+
+def spool_bytes(tmp_path, data, max_bytes=0, chunk_size=64 * 1024):
+    spool = UploadSpool('.log', upload_dir=str(tmp_path), max_bytes=max_bytes)
+    try:
+        for start in range(0, len(data), chunk_size):
+            spool.write(data[start:start + chunk_size])
+        spool.finish()
+    except Exception as e:
+        spool.fail(e)
+        raise
+    return spool
+
+
+def test_gzip_bomb_is_rejected_before_it_is_unpacked(tmp_path):
+    bomb = gzip.compress(b'\0' * (64 * 1024 * 1024))
+    assert len(bomb) < 100 * 1024
+
+    with pytest.raises(UploadTooLarge):
+        spool_bytes(tmp_path, bomb, max_bytes=4 * 1024 * 1024)
+
+
+def test_gzip_stream_is_unpacked_in_bounded_parts(tmp_path):
+    line = b'{"@level":"info","@message":"hello"}\n'
+    content = line * (3 * DECODE_CHUNK_SIZE // len(line))
+    # Два члена gzip подряд, как у дописанного .gz
+    data = gzip.compress(content[:1000]) + gzip.compress(content[1000:])
+
+    spool = spool_bytes(tmp_path, data, max_bytes=len(content))
+
+    assert spool.compression == 'gzip'
+    assert spool.bytes_written == len(content)
+    with open(spool.path, 'rb') as file:
+        assert file.read() == content
+
+
+def test_plain_upload_limit(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        spool_bytes(tmp_path, b'x\n' * 1000, max_bytes=1000)
+    assert spool_bytes(tmp_path, b'x\n' * 1000).bytes_written == 2000